@@ -0,0 +1,192 @@
+'''
+asyncio front for area targeting. AsyncPinchService runs analyses on a bounded worker pool so the event loop
+never does the CPU work itself, shares one computation between identical requests that are in flight at the
+same time, and limits how many requests may wait for a worker. serve() exposes the service over a minimal
+HTTP/JSON interface for local testing:
+
+    POST /area_target  {"streams": [[T_s, T_t, CP, h], ...], "hot_utility": {"T_s": 240, "T_t": 239, "h": 3},
+                        "cold_utility": {"T_s": 20, "T_t": 30}, "dT_min": 10}
+    GET  /stats
+
+    python async_service.py [port]
+'''
+import asyncio
+import concurrent.futures
+import json
+import os
+import sys
+
+from batch_runner import ScenarioCase, CaseResult
+from result_cache import fingerprint
+from utility import Utility
+
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+class ServiceOverloaded(Exception):
+    pass
+
+
+class AsyncPinchService:
+    def __init__(self, max_workers=None, max_queued=64, executor=None):
+        '''
+        :param max_workers: number of analyses run at once (defaults to the CPU count)
+        :param max_queued: number of distinct analyses allowed to wait for a worker; further requests
+                           raise ServiceOverloaded instead of queueing without bound
+        :param executor: concurrent.futures executor to run analyses on (defaults to a process pool)
+        '''
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self._executor = executor or concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        self._owns_executor = executor is None
+        self._slots = None
+        self._in_flight = {}
+        self._queued = 0
+        self.completed = 0
+        self.deduplicated = 0
+
+    async def area_target(self, streams, hot_utility_stream, cold_utility_stream, dT_min=5, name=None):
+        '''
+        Area target of a stream set. Identical requests made while one is running await the same result.
+        :param streams: StreamTable or list of streams/[T_s, T_t, CP, (h)] rows (not a file path: requests are
+                        matched on the stream data)
+        :param hot_utility_stream: hot Utility
+        :param cold_utility_stream: cold Utility
+        :param dT_min: minimum approach temperature
+        :param name: optional label carried through to the result
+        :return: CaseResult
+        '''
+        key = fingerprint(streams, 'area_target', dT_min, hot_utility_stream, cold_utility_stream)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            if len(self._in_flight) >= self.max_workers + self.max_queued:
+                raise ServiceOverloaded("{} analyses are already running or waiting for a worker".format(
+                    len(self._in_flight)))
+            case = ScenarioCase(streams, hot_utility_stream, cold_utility_stream, dT_min, name)
+            self._queued += 1
+            task = asyncio.ensure_future(self._run(case))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the computation other callers share
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            'workers': self.max_workers,
+            'running': len(self._in_flight) - self._queued,
+            'queued': self._queued,
+            'completed': self.completed,
+            'deduplicated': self.deduplicated
+        }
+
+    async def close(self):
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Private methods
+    async def _run(self, case):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, _run_case, case)
+        finally:
+            self._slots.release()
+        self.completed += 1
+        return result
+
+
+async def serve(service, host='127.0.0.1', port=8080):
+    '''
+    Starts the HTTP/JSON front end (see the module docstring)
+    :param service: AsyncPinchService
+    :return: asyncio.Server
+    '''
+    async def handle(reader, writer):
+        try:
+            status, body = await _handle_request(service, reader)
+        except (ValueError, KeyError, TypeError) as e:
+            status, body = 400, {'error': "{}: {}".format(type(e).__name__, e)}
+        payload = json.dumps(body).encode()
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, _REASONS[status], len(payload)).encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# Private methods
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+
+def _run_case(case):
+    try:
+        result = CaseResult(0, case.name, *case.run())
+    except Exception as e:
+        return CaseResult(0, case.name, error="{}: {}".format(type(e).__name__, e))
+    # Plain floats so the result can go straight to JSON
+    for key in ('T_pinch', 'hot_utility', 'cold_utility', 'total_area', 'total_cost'):
+        value = getattr(result, key)
+        setattr(result, key, None if value is None else float(value))
+    return result
+
+
+async def _handle_request(service, reader):
+    method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+    length = 0
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        header, _, value = line.partition(':')
+        if header.strip().lower() == 'content-length':
+            length = int(value)
+    if length > MAX_REQUEST_BYTES:
+        return 413, {'error': "Request body exceeds {} bytes".format(MAX_REQUEST_BYTES)}
+    body = await reader.readexactly(length) if length else b''
+
+    if method == 'GET' and path == '/stats':
+        return 200, service.stats()
+    if method != 'POST' or path != '/area_target':
+        return 404, {'error': "Unknown endpoint {} {}".format(method, path)}
+
+    request = json.loads(body)
+    hot_utility_stream = _utility_from_json('hot', request['hot_utility'])
+    cold_utility_stream = _utility_from_json('cold', request['cold_utility'])
+    try:
+        result = await service.area_target(request['streams'], hot_utility_stream, cold_utility_stream,
+                                           request.get('dT_min', 5), request.get('name'))
+    except ServiceOverloaded as e:
+        return 503, {'error': str(e)}
+    return 200, result.as_dict()
+
+
+def _utility_from_json(type, data):
+    return Utility(type, T_s=data.get('T_s'), T_t=data.get('T_t'), CP=data.get('CP'), h=data.get('h', 1),
+                   cost=data.get('cost'))
+
+
+async def _main(port):
+    async with AsyncPinchService() as service:
+        server = await serve(service, port=port)
+        print("Serving on port {}".format(port))
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(int(sys.argv[1]) if len(sys.argv) > 1 else 8080))
@@ -1,24 +1,35 @@
-import math
 import numpy as np
-import matplotlib.pyplot as plt
-from helper_functions import get_intervals
+from stream import StreamTable
+from helper_functions import get_intervals, interval_totals
 from composite_curve import CompositeCurve
+from results import BCCSegmentsResult
+from cost_model import CostModel
 
 TYPE_HOT = 0
 TYPE_COLD = 1
 
+DEFAULT_COST_MODEL = CostModel()
+
 
 class BalancedCompositeCurve(CompositeCurve):
     def __init__(self, hot_streams, cold_streams, hot_utility, cold_utility,
                  hot_utility_stream, cold_utility_stream, T_pinch, dTmin):
-        hot_streams.append(hot_utility_stream.fit(hot_utility))
-        cold_streams.append(cold_utility_stream.fit(cold_utility))
+        '''
+        :param hot_utility: hot utility load, or list of loads for several hot utilities
+        :param hot_utility_stream: hot Utility, or list of hot Utility matching the loads
+        :param cold_utility: cold utility load, or list of loads for several cold utilities
+        :param cold_utility_stream: cold Utility, or list of cold Utility matching the loads
+        '''
+        hot_streams = StreamTable.from_streams(hot_streams).extended(
+            _fit_utilities(hot_utility_stream, hot_utility))
+        cold_streams = StreamTable.from_streams(cold_streams).extended(
+            _fit_utilities(cold_utility_stream, cold_utility))
 
         hot_intervals = get_intervals(hot_streams)
         cold_intervals = get_intervals(cold_streams)
 
-        self.bcc_intervals = []
         self.q_intervals = []
+        self._bcc_intervals = None
 
         super().__init__(hot_streams, cold_streams,
                          hot_intervals, cold_intervals,
@@ -26,58 +37,102 @@ class BalancedCompositeCurve(CompositeCurve):
                          T_pinch=T_pinch, dTmin=dTmin)
 
     def get_area_target(self, verbose=True):
-        self.get_heat_intervals(self.hot_composite_curve, self.cold_composite_curve)
+        self.get_heat_intervals()
         if verbose:
             self.print_report()
             self.plot_from_heat_intervals()
         return self.get_total_area()
 
-    def get_heat_intervals(self, hcc, ccc):
-        hcc = hcc.copy()
-        hcc.sort(key=lambda intv: intv.T_c)
-        ccc = ccc.copy()
-        ccc.sort(key=lambda intv: intv.T_c)
-
-        q_intervals = set()
-        q = 0
-        for intv in hcc:
-            q_old = q
-            q += intv.get_heat_load()
-            q = np.round(q, decimals=6)
-            q_intervals.add(q)
-            intv.Q = (q_old, q)
-
-        q = 0
-        for intv in ccc:
-            q_old = q
-            q += intv.get_heat_load()
-            q = np.round(q, decimals=6)
-            q_intervals.add(q)
-            intv.Q = (q_old, q)
-
-        q_intervals = [0] + sorted(list(q_intervals))
-
-        T_h_start = hcc[0].T_c
-        T_c_start = ccc[0].T_c
-
-        for i in range(len(q_intervals) - 1):
-            bcc_interval = BalancedCompositeCurveHeatInterval(
-                q_intervals[i], q_intervals[i+1], T_h_start, T_c_start)
-            bcc_interval.take_streams_from_curves(hcc, ccc)
-            T_h_start, T_c_start = bcc_interval.get_final_temps()
-            self.bcc_intervals.append(bcc_interval)
+    def get_heat_intervals(self):
+        '''
+        Splits the balanced composite curves into vertical heat load segments. The rounded cumulative heat
+        loads of both curves are merged into one sorted list of breakpoints, and each segment is matched to
+        the hot and cold curve interval it lies in by a single sorted search, so the segment CPs and end
+        temperatures come out as arrays without rescanning the curve intervals per segment.
+        '''
+        hot_Q = np.round(self.hot_Q, decimals=6)
+        cold_Q = np.round(self.cold_Q, decimals=6)
+        q_intervals = np.union1d(hot_Q, cold_Q)
+        q_start = q_intervals[:-1]
+        dq = np.diff(q_intervals)
+
+        # A segment belongs to the last curve interval starting at or below it, which skips the zero
+        # load intervals where a curve jumps in temperature
+        self.hot_index = np.clip(np.searchsorted(hot_Q, q_start, side='right') - 1, 0, len(self.hot_CP) - 1)
+        self.cold_index = np.clip(np.searchsorted(cold_Q, q_start, side='right') - 1, 0, len(self.cold_CP) - 1)
+        self.segment_hot_CP = self.hot_CP[self.hot_index]
+        self.segment_cold_CP = self.cold_CP[self.cold_index]
+        assert np.all(self.segment_hot_CP != 0) and np.all(self.segment_cold_CP != 0)
+
+        self.T_h_start = (self.hot_temperatures[self.hot_index]
+                          + (q_start - hot_Q[self.hot_index]) / self.segment_hot_CP)
+        self.T_c_start = (self.cold_temperatures[self.cold_index]
+                          + (q_start - cold_Q[self.cold_index]) / self.segment_cold_CP)
+        self.T_h_end = self.T_h_start + dq / self.segment_hot_CP
+        self.T_c_end = self.T_c_start + dq / self.segment_cold_CP
+
+        self.segment_lmtd = lmtd(self.T_h_end - self.T_c_end, self.T_h_start - self.T_c_start)
+        self.segment_area = segment_areas(self.T_h_start, self.T_h_end, self.T_c_start, self.T_c_end,
+                                          self.hot_CP_h[self.hot_index], self.cold_CP_h[self.cold_index],
+                                          self.segment_lmtd)
 
         self.q_intervals = q_intervals
+        self._bcc_intervals = None
+
+    @property
+    def bcc_intervals(self):
+        '''Per-segment view of the balanced composite curve arrays'''
+        if self._bcc_intervals is None:
+            if len(self.q_intervals) == 0:
+                return []
+            # Composite curve interval lists run hottest first, the arrays run coldest first
+            hcc = self.hot_composite_curve
+            ccc = self.cold_composite_curve
+            self._bcc_intervals = [
+                BalancedCompositeCurveHeatInterval(
+                    self.q_intervals[i], self.q_intervals[i + 1], self.T_h_start[i], self.T_c_start[i],
+                    hcc[len(hcc) - 1 - self.hot_index[i]], ccc[len(ccc) - 1 - self.cold_index[i]],
+                    self.segment_lmtd[i], self.segment_area[i])
+                for i in range(len(self.q_intervals) - 1)
+            ]
+        return self._bcc_intervals
+
+    def to_result(self):
+        '''Immutable BCCSegmentsResult of the heat load segments'''
+        return BCCSegmentsResult.from_balanced_composite_curve(self)
+
+    def get_segment_stream_counts(self):
+        '''Number of streams (utilities included) spanning each segment'''
+        hot, cold = self.hot_streams, self.cold_streams
+        hot_counts = interval_totals(self.hot_temperatures[::-1], np.maximum(hot.T_s, hot.T_t),
+                                     np.minimum(hot.T_s, hot.T_t), np.ones(len(hot)))[::-1]
+        cold_counts = interval_totals(self.cold_temperatures[::-1], np.maximum(cold.T_s, cold.T_t),
+                                      np.minimum(cold.T_s, cold.T_t), np.ones(len(cold)))[::-1]
+        return (hot_counts[self.hot_index] + cold_counts[self.cold_index]).astype(int)
 
     def get_total_area(self):
-        return sum([intv.get_area() for intv in self.bcc_intervals])
+        if len(self.q_intervals) == 0:
+            return 0
+        return float(self.segment_area.sum())
 
-    def get_total_cost(self):
-        # In BCC, utilities have already been added. Therefore, no heater/cooler is counted in Nmin.
-        n_min_exchangers = len(self.get_streams_below_pinch()) + len(self.get_streams_above_pinch()) - 2
-        print(self.get_total_area())
-        area_per_exchanger = self.get_total_area()/n_min_exchangers
-        return n_min_exchangers * self._get_base_cost(area_per_exchanger)
+    def get_total_cost(self, cost_model=None):
+        '''
+        :param cost_model: CostModel to price the area and unit targets with (optional, plain fixed head units)
+        :return: capital cost ($)
+        '''
+        return (cost_model or DEFAULT_COST_MODEL).total_cost(self)
+
+    def get_unit_target(self):
+        '''
+        Nmin: streams minus one in each region on either side of the pinch. A threshold problem has only
+        one region, with all streams in it.
+        '''
+        # In BCC, utilities have already been added. Therefore, no heater/cooler is counted separately.
+        regions = (self.get_streams_below_pinch(), self.get_streams_above_pinch())
+        return sum(len(streams) - 1 for streams in regions if streams)
+
+    def _get_total_cost(self, total_area, cost_model=None):
+        return float((cost_model or DEFAULT_COST_MODEL).capital_cost(total_area, self.get_unit_target()))
 
     @staticmethod
     def _get_base_cost(area):
@@ -86,26 +141,15 @@ class BalancedCompositeCurve(CompositeCurve):
         :param area: HE area (m2)
         :return: base cost ($)
         '''
-        # conversion from m2 to ft2
-        area = 10.76391041671 * area
-        return math.exp(11.0545 - 0.9228 * math.log(area) + 0.09861 * math.log(area) ** 2)
-
-    def plot_from_heat_intervals(self):
-        temps_h = [self.bcc_intervals[0].T_h_start]
-        temps_c = [self.bcc_intervals[0].T_c_start]
-        heats = [0]
-        for intv in self.bcc_intervals:
-            temps_h.append(intv.T_h_start)
-            temps_c.append(intv.T_c_start)
-            temps_h.append(intv.T_h_end)
-            temps_c.append(intv.T_c_end)
-            heats.append(intv.q_start)
-            heats.append(intv.q_end)
-
-        plt.figure(figsize=(8,4.5))
-        plt.plot(heats, temps_h, 'r')
-        plt.plot(heats, temps_c, 'b')
-        plt.show()
+        return float(DEFAULT_COST_MODEL.base_cost(area))
+
+    def plot_from_heat_intervals(self, filename=None):
+        '''
+        Plots the balanced composite curve segments
+        :param filename: write the figure to this file instead of showing it (optional, headless)
+        '''
+        from plotting import plot_balanced_composite_curve
+        plot_balanced_composite_curve(self, filename)
 
     def print_report(self):
         print("===== Balanced Composite Curve =====")
@@ -115,74 +159,39 @@ class BalancedCompositeCurve(CompositeCurve):
 
 
 class BalancedCompositeCurveHeatInterval:
-    def __init__(self, q_start, q_end, T_h_start, T_c_start):
+    def __init__(self, q_start, q_end, T_h_start, T_c_start, hot_interval, cold_interval, lmtd, area):
         self.q_start = q_start
         self.q_end = q_end
         self.heat_load = q_end - q_start
 
         self.T_h_start = T_h_start
         self.T_c_start = T_c_start
-        self.T_h_end = 0
-        self.T_c_end = 0
-
-        self.hot_streams = []
-        self.cold_streams = []
-
-        self.hot_CP = 0
-        self.cold_CP = 0
-
-    def take_streams_from_curves(self, hcc, ccc, verbose=False):
-        for intv in hcc:
-            if self._intersect(intv.Q, (self.q_start, self.q_end)):
-                if intv.Q[1] - intv.Q[0] < 1e-6:
-                    self.T_h_start = intv.T_h
-                self.hot_streams += intv.streams
-
-        for intv in ccc:
-            if self._intersect(intv.Q, (self.q_start, self.q_end)):
-                if intv.Q[1] - intv.Q[0] < 1e-6:
-                    self.T_c_start = intv.T_h
-                self.cold_streams += intv.streams
 
-        self._get_combined_CP()
+        self.hot_interval = hot_interval
+        self.cold_interval = cold_interval
+        self.hot_CP = hot_interval.CP
+        self.cold_CP = cold_interval.CP
 
-    def _get_combined_CP(self):
-        for s in self.hot_streams:
-            self.hot_CP += s.CP
+        self.T_h_end, self.T_c_end = self.get_final_temps()
+        self.lmtd = lmtd
+        self.area = area
 
-        for s in self.cold_streams:
-            self.cold_CP += s.CP
+    @property
+    def hot_streams(self):
+        return self.hot_interval.streams
 
-        assert self.hot_CP != 0 and self.cold_CP != 0
+    @property
+    def cold_streams(self):
+        return self.cold_interval.streams
 
     def get_final_temps(self):
-        self.T_h_end = self.T_h_start + self.heat_load/self.hot_CP
-        self.T_c_end = self.T_c_start + self.heat_load/self.cold_CP
-
-        return self.T_h_end, self.T_c_end
+        return self.T_h_start + self.heat_load/self.hot_CP, self.T_c_start + self.heat_load/self.cold_CP
 
     def get_lmtd(self):
-        upper_term = (self.T_h_end - self.T_c_end) - (self.T_h_start - self.T_c_start)
-        lower_term = math.log((self.T_h_end - self.T_c_end) / (self.T_h_start - self.T_c_start))
-        return upper_term / lower_term
+        return self.lmtd
 
     def get_area(self):
-        area = 0
-        for stream in self.hot_streams:
-            area += stream.CP * (self.T_h_end - self.T_h_start) / stream.h
-
-        for stream in self.cold_streams:
-            area += stream.CP * (self.T_c_end - self.T_c_start) / stream.h
-
-        return area / self.get_lmtd()
-
-    @staticmethod
-    def _intersect(r1, r2):
-        if r1[0] == r1[1]:
-            return r2[1] > r1[1] and r2[0] <= r1[0]
-        if r2[0] == r2[1]:
-            return r1[1] > r2[1] and r1[0] <= r2[0]
-        return max(r1[0], r2[0]) < min(r1[-1], r2[-1])
+        return self.area
 
     def __str__(self):
         return ("BCC Area Segment with Heat Load interval from {} to {} (dQ = {}) \n    LMTD = {}, Area = {}".format(
@@ -195,14 +204,48 @@ class InvalidIntervalException(Exception):
     pass
 
 
-# b = BalancedCompositeCurveHeatInterval(0,1, 0, 1)
-# print(b._intersect((8.8, 11), (8,9)))
-# print(b._intersect((9,9), (10,10)))
-# print(b._intersect((9,9), (9,10)))
-# print(b._intersect((9,9), (8,9)))
-# print(b._intersect((8,9), (9,9)))
-# print(b._intersect((9,10), (9,9)))
-# print(b._intersect((9,10), (10,11)))
+def lmtd(dT_a, dT_b):
+    '''
+    Log mean temperature difference of many segments at once. Written as dT_b * x / ln(1 + x) with
+    x = dT_a / dT_b - 1, switching to its series expansion when the end differences are nearly equal.
+    :param dT_a: temperature difference at one end of each segment (array)
+    :param dT_b: temperature difference at the other end (array)
+    :return: LMTD per segment (array)
+    '''
+    dT_a = np.asarray(dT_a, dtype=float)
+    dT_b = np.asarray(dT_b, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = dT_a / dT_b - 1
+        near_equal = np.abs(x) < 1e-4
+        ratio = np.where(near_equal, 1 + x / 2 - x ** 2 / 12, x / np.log1p(np.where(near_equal, 1, x)))
+    return dT_b * ratio
+
+
+def segment_areas(T_h_start, T_h_end, T_c_start, T_c_end, hot_CP_h, cold_CP_h, segment_lmtd=None):
+    '''
+    Bath formula area of every BCC segment in one call: (sum of q/h over the segment's streams) / LMTD
+    :param T_h_start: hot temperature at the start of each segment (array)
+    :param T_h_end: hot temperature at the end of each segment (array)
+    :param T_c_start: cold temperature at the start of each segment (array)
+    :param T_c_end: cold temperature at the end of each segment (array)
+    :param hot_CP_h: sum of CP/h over the hot streams of each segment (array)
+    :param cold_CP_h: sum of CP/h over the cold streams of each segment (array)
+    :param segment_lmtd: precomputed LMTD per segment (optional)
+    :return: area per segment (array)
+    '''
+    if segment_lmtd is None:
+        segment_lmtd = lmtd(T_h_end - T_c_end, T_h_start - T_c_start)
+    q_over_h = hot_CP_h * (T_h_end - T_h_start) + cold_CP_h * (T_c_end - T_c_start)
+    return q_over_h / segment_lmtd
+
+
+# Private methods
+def _fit_utilities(utility_streams, loads):
+    # Utilities without load are left out rather than fitted as degenerate streams
+    if not isinstance(utility_streams, (list, tuple)):
+        utility_streams, loads = [utility_streams], [loads]
+    return [u.fit(q) for u, q in zip(utility_streams, loads) if q > 0]
+
 
 # Unit tests
 # u1 = Utility('hot', T_s=150, CP=40)
@@ -212,4 +255,4 @@ class InvalidIntervalException(Exception):
 # u3 = Utility('hot', T_s=240, T_t=239)
 # print(u3.fit(7500))
 # u4 = Utility('cold', T_s=20, T_t=30)
-# print(u4.fit(10000))
\ No newline at end of file
+# print(u4.fit(10000))
@@ -0,0 +1,119 @@
+import concurrent.futures
+import heapq
+import math
+import os
+import sys
+
+from pinch_analysis import PinchAnalyser
+from data_loader import load_stream_table
+
+
+class ScenarioCase:
+    def __init__(self, streams, hot_utility_stream, cold_utility_stream, dT_min=5, name=None):
+        '''
+        A single analysis to be run by the batch runner
+        :param streams: stream data (StreamTable or list of [T_s, T_t, CP, (h)]) or path to a stream csv/excel file
+        :param hot_utility_stream: hot Utility
+        :param cold_utility_stream: cold Utility
+        :param dT_min: minimum approach temperature
+        :param name: optional label carried through to the result
+        '''
+        self.streams = streams
+        self.hot_utility_stream = hot_utility_stream
+        self.cold_utility_stream = cold_utility_stream
+        self.dT_min = dT_min
+        self.name = name
+
+    def run(self):
+        streams = load_stream_table(self.streams) if isinstance(self.streams, str) else self.streams
+        pinch = PinchAnalyser(streams)
+        total_area = pinch.get_area_target(self.hot_utility_stream, self.cold_utility_stream,
+                                           self.dT_min, verbose=False)
+        total_cost = pinch.balanced_composite_curve._get_total_cost(total_area)
+        return pinch.T_pinch, pinch.hot_utility, pinch.cold_utility, total_area, total_cost
+
+
+class CaseResult:
+    __slots__ = ('index', 'name', 'T_pinch', 'hot_utility', 'cold_utility', 'total_area', 'total_cost', 'error')
+
+    def __init__(self, index, name, T_pinch=None, hot_utility=None, cold_utility=None,
+                 total_area=None, total_cost=None, error=None):
+        self.index = index
+        self.name = name
+        self.T_pinch = T_pinch
+        self.hot_utility = hot_utility
+        self.cold_utility = cold_utility
+        self.total_area = total_area
+        self.total_cost = total_cost
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __str__(self):
+        label = self.name if self.name is not None else self.index
+        if not self.ok:
+            return "Case {} failed: {}".format(label, self.error)
+        return "Case {}: T_pinch={} QH={} QC={} Area={} Cost={}".format(
+            label, self.T_pinch, self.hot_utility, self.cold_utility, self.total_area, self.total_cost)
+
+
+def run_cases(cases, max_workers=None, chunk_size=None, ordered=False):
+    '''
+    Runs scenario cases over a process pool and yields a CaseResult for each case as it completes.
+    A case that raises (e.g. an infeasible balanced composite curve) yields a result with its error
+    message set instead of stopping the batch.
+    :param cases: list of ScenarioCase
+    :param max_workers: number of worker processes (defaults to the CPU count)
+    :param chunk_size: number of cases sent to a worker at once (defaults to ~4 chunks per worker)
+    :param ordered: yield results in the order of the input cases rather than as they complete
+    :return: generator of CaseResult
+    '''
+    cases = list(cases)
+    if not cases:
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(cases) / (4 * max_workers)))
+    indexed_cases = list(enumerate(cases))
+    chunks = [indexed_cases[i:i + chunk_size] for i in range(0, len(cases), chunk_size)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_run_chunk, chunk) for chunk in chunks]
+        if not ordered:
+            for future in concurrent.futures.as_completed(futures):
+                yield from future.result()
+            return
+
+        # Hold back results until every earlier case has been yielded
+        pending = []
+        next_index = 0
+        for future in concurrent.futures.as_completed(futures):
+            for result in future.result():
+                heapq.heappush(pending, (result.index, result))
+            while pending and pending[0][0] == next_index:
+                yield heapq.heappop(pending)[1]
+                next_index += 1
+
+
+# Private methods
+def _init_worker():
+    # Workers never display figures
+    os.environ['MPLBACKEND'] = 'Agg'
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg', force=True)
+
+
+def _run_chunk(indexed_cases):
+    results = []
+    for index, case in indexed_cases:
+        try:
+            results.append(CaseResult(index, case.name, *case.run()))
+        except Exception as e:
+            results.append(CaseResult(index, case.name, error="{}: {}".format(type(e).__name__, e)))
+    return results
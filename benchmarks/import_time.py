@@ -0,0 +1,59 @@
+'''
+Startup benchmark: time to import the core analysis modules in a fresh interpreter, and whether doing so
+pulls in matplotlib or pandas.
+
+Usage (from the repository root):
+    python -m benchmarks.import_time [--repeat N] [--module pinch_analysis]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('matplotlib', 'matplotlib.pyplot', 'pandas')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module='pinch_analysis', repeat=5):
+    '''
+    Imports a module in fresh interpreters and records the import time
+    :param module: module to import
+    :param repeat: number of interpreters to start
+    :return: dict with the per-run times (s), their median and the heavy modules that got loaded
+    '''
+    runs = []
+    loaded = set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        runs.append(result['seconds'])
+        loaded.update(result['loaded'])
+    return {'module': module, 'runs': runs, 'median': statistics.median(runs), 'heavy_modules_loaded': sorted(loaded)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--module', action='append', help='module(s) to import (default: pinch_analysis)')
+    args = parser.parse_args()
+
+    for module in args.module or ['pinch_analysis']:
+        result = measure(module, args.repeat)
+        print("import {:<20s} median {:8.1f} ms  (min {:.1f} ms, {} runs)  heavy modules: {}".format(
+            module, 1000 * result['median'], 1000 * min(result['runs']), len(result['runs']),
+            ', '.join(result['heavy_modules_loaded']) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
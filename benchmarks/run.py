@@ -0,0 +1,227 @@
+'''
+Stage-by-stage benchmark of the pinch analysis pipeline on synthetic stream sets.
+
+Every stage (loading, stream shifting, heat cascade, composite curves, BCC segmentation, area and cost)
+is timed separately for each stream count, together with its peak traced memory and throughput.
+A log-log fit over the stream counts gives each stage's scaling exponent. Results can be saved as a
+named baseline and later runs compared against it, so regressions show up as numbers. The committed
+baselines/main.json is the reference run over the default sizes; comparing against a baseline that does not
+exist, or that lacks a size or stage of the current run, is an error rather than a skipped check.
+
+Usage (from the repository root):
+    python -m benchmarks.run --sizes 10 100 1000 10000 100000
+    python -m benchmarks.run --save-baseline main
+    python -m benchmarks.run --compare main
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import generate_streams, default_utilities, write_csv
+from data_loader import load_stream_table
+from heat_cascade import HeatCascade
+from composite_curve import CompositeCurve
+from balanced_composite_curve import BalancedCompositeCurve
+from helper_functions import get_intervals
+from pinch_analysis import PinchAnalyser
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+DT_MIN = 10
+REGRESSION_THRESHOLD = 1.25
+
+
+# Stages: each takes the shared context and returns the value stored under its name
+def _load(ctx):
+    return load_stream_table(ctx['csv_path'], use_cache=False)
+
+
+def _load_cached(ctx):
+    return load_stream_table(ctx['csv_path'], use_cache=True)
+
+
+def _shift(ctx):
+    return ctx['analyser']._shifted_temp_streams(ctx['streams'], DT_MIN)
+
+
+def _heat_cascade(ctx):
+    return HeatCascade(ctx['shift'], get_intervals(ctx['shift']))
+
+
+def _composite_curve(ctx):
+    T_pinch, hot_utility, cold_utility = ctx['heat_cascade'].get_results()
+    hot, cold = ctx['streams'].hot(), ctx['streams'].cold()
+    return CompositeCurve(hot, cold, get_intervals(hot), get_intervals(cold),
+                          hot_utility, cold_utility, T_pinch, DT_MIN)
+
+
+def _bcc_segments(ctx):
+    T_pinch, hot_utility, cold_utility = ctx['heat_cascade'].get_results()
+    bcc = BalancedCompositeCurve(ctx['streams'].hot(), ctx['streams'].cold(), hot_utility, cold_utility,
+                                 ctx['hu'], ctx['cu'], T_pinch, DT_MIN)
+    bcc.get_heat_intervals()
+    return bcc
+
+
+def _area(ctx):
+    return ctx['bcc_segments'].get_total_area()
+
+
+def _cost(ctx):
+    return ctx['bcc_segments']._get_total_cost(ctx['area'])
+
+
+STAGES = [
+    ('load', _load),
+    ('load_cached', _load_cached),
+    ('shift', _shift),
+    ('heat_cascade', _heat_cascade),
+    ('composite_curve', _composite_curve),
+    ('bcc_segments', _bcc_segments),
+    ('area', _area),
+    ('cost', _cost)
+]
+
+
+def run(sizes=DEFAULT_SIZES, repeat=3, seed=0):
+    '''
+    Runs every stage for every stream count
+    :param sizes: stream counts
+    :param repeat: timed repetitions per stage (the median is reported)
+    :param seed: seed of the synthetic stream sets
+    :return: dict with per-size stage results and per-stage scaling exponents
+    '''
+    hu, cu = default_utilities()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in sizes:
+            streams = generate_streams(n, seed=seed)
+            ctx = {'streams': streams, 'analyser': PinchAnalyser(streams), 'hu': hu, 'cu': cu,
+                   'csv_path': os.path.join(tmp_dir, 'streams_{}.csv'.format(n))}
+            write_csv(streams, ctx['csv_path'])
+
+            results[n] = {}
+            for name, stage in STAGES:
+                # Untimed warm-up, so one-off costs such as importing pandas are not attributed to the stage
+                ctx[name] = stage(ctx)
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    ctx[name] = stage(ctx)
+                    times.append(time.perf_counter() - start)
+
+                tracemalloc.start()
+                stage(ctx)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                seconds = statistics.median(times)
+                results[n][name] = {
+                    'seconds': seconds,
+                    'streams_per_second': n / seconds if seconds > 0 else float('inf'),
+                    'peak_bytes': peak
+                }
+
+    return {
+        'sizes': list(sizes),
+        'results': {str(n): r for n, r in results.items()},
+        'scaling': _scaling_exponents(results),
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform()}
+    }
+
+
+def save_baseline(report, name):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, name + '.json')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(report, name, threshold=REGRESSION_THRESHOLD):
+    '''
+    Compares a report against a saved baseline
+    :return: list of (size, stage, baseline seconds, current seconds, ratio) for stages slower than threshold
+    '''
+    path = os.path.join(BASELINE_DIR, name + '.json')
+    if not os.path.exists(path):
+        raise MissingBaselineException("No baseline named {!r} in {}; save one with --save-baseline {}".format(
+            name, BASELINE_DIR, name))
+    with open(path) as f:
+        baseline = json.load(f)
+
+    missing = ["{}/{}".format(size, stage) for size, stages in report['results'].items() for stage in stages
+               if stage not in baseline['results'].get(size, {})]
+    if missing:
+        raise MissingBaselineException("Baseline {!r} has no results for {}".format(name, ', '.join(missing)))
+
+    regressions = []
+    for size, stages in report['results'].items():
+        for stage, result in stages.items():
+            reference = baseline['results'][size][stage]
+            if reference['seconds'] <= 0:
+                continue
+            ratio = result['seconds'] / reference['seconds']
+            print("{:>7s} {:<16s} {:10.4f} s -> {:10.4f} s  x{:.2f}{}".format(
+                size, stage, reference['seconds'], result['seconds'], ratio,
+                '  REGRESSION' if ratio > threshold else ''))
+            if ratio > threshold:
+                regressions.append((size, stage, reference['seconds'], result['seconds'], ratio))
+    return regressions
+
+
+def print_report(report):
+    print("{:>7s} {:<16s} {:>12s} {:>16s} {:>12s}".format('streams', 'stage', 'time (ms)', 'streams/s', 'peak (MB)'))
+    for size, stages in report['results'].items():
+        for stage, result in stages.items():
+            print("{:>7s} {:<16s} {:12.3f} {:16.0f} {:12.2f}".format(
+                size, stage, 1000 * result['seconds'], result['streams_per_second'], result['peak_bytes'] / 2 ** 20))
+    print("Scaling exponents (time ~ n^k): " + ", ".join(
+        "{}={:.2f}".format(stage, k) for stage, k in report['scaling'].items()))
+
+
+class MissingBaselineException(Exception):
+    pass
+
+
+# Private methods
+def _scaling_exponents(results):
+    sizes = sorted(results)
+    if len(sizes) < 2:
+        return {}
+    exponents = {}
+    for name, _ in STAGES:
+        seconds = np.array([max(results[n][name]['seconds'], 1e-9) for n in sizes])
+        exponents[name] = float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+    return exponents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.repeat, args.seed)
+    print_report(report)
+    if args.save_baseline:
+        print("Saved baseline to {}".format(save_baseline(report, args.save_baseline)))
+    if args.compare:
+        regressions = compare(report, args.compare, args.threshold)
+        if regressions:
+            raise SystemExit("{} stage(s) regressed beyond x{}".format(len(regressions), args.threshold))
+
+
+if __name__ == '__main__':
+    main()
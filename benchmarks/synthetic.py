@@ -0,0 +1,61 @@
+'''
+Reproducible synthetic stream sets for benchmarking.
+'''
+import numpy as np
+
+from stream import StreamTable
+from utility import Utility
+
+
+def generate_streams(n_streams, seed=0, T_min=20.0, T_max=400.0, hot_fraction=0.5,
+                     cp_mean=5.0, cp_sigma=0.8, h_min=0.1, h_max=2.0,
+                     coincident_fraction=0.3, grid_step=5.0):
+    '''
+    Generates a random stream set
+    :param n_streams: number of streams
+    :param seed: random seed, the same seed always gives the same streams
+    :param T_min: lowest stream temperature
+    :param T_max: highest stream temperature
+    :param hot_fraction: share of hot streams
+    :param cp_mean: median CP (CPs are lognormally distributed)
+    :param cp_sigma: sigma of log(CP)
+    :param h_min: lowest film coefficient (h is log-uniform between h_min and h_max)
+    :param h_max: highest film coefficient
+    :param coincident_fraction: share of temperatures snapped to a grid, giving many coincident temperatures
+    :param grid_step: spacing of that grid
+    :return: StreamTable
+    '''
+    rng = np.random.default_rng(seed)
+    temperatures = rng.uniform(T_min, T_max, size=(2, n_streams))
+    snap = rng.random((2, n_streams)) < coincident_fraction
+    temperatures[snap] = np.round(temperatures[snap] / grid_step) * grid_step
+    temperatures = np.round(temperatures, decimals=3)
+
+    # Resolve equal supply/target temperatures by moving the target one grid step
+    equal = temperatures[0] == temperatures[1]
+    temperatures[1][equal] += np.where(temperatures[1][equal] + grid_step <= T_max, grid_step, -grid_step)
+
+    T_high = temperatures.max(axis=0)
+    T_low = temperatures.min(axis=0)
+    is_hot = rng.random(n_streams) < hot_fraction
+    T_s = np.where(is_hot, T_high, T_low)
+    T_t = np.where(is_hot, T_low, T_high)
+
+    CP = np.round(cp_mean * rng.lognormal(0.0, cp_sigma, n_streams), decimals=4)
+    h = np.round(np.exp(rng.uniform(np.log(h_min), np.log(h_max), n_streams)), decimals=4)
+    names = ['S{}'.format(i) for i in range(n_streams)]
+    return StreamTable(T_s, T_t, CP, h, names)
+
+
+def default_utilities(T_min=20.0, T_max=400.0):
+    '''Hot and cold utilities that lie outside the synthetic temperature range'''
+    return (Utility('hot', T_s=T_max + 100, T_t=T_max + 99, h=5),
+            Utility('cold', T_s=T_min - 15, T_t=T_min - 5, h=2))
+
+
+def write_csv(streams, file_path):
+    '''Writes a stream table in the Name,Supply Temperature,Target Temperature,CP,h layout read by data_loader'''
+    with open(file_path, 'w') as f:
+        f.write('Name,Supply Temperature,Target Temperature,CP,h\n')
+        for name, row in zip(streams.names, np.column_stack((streams.T_s, streams.T_t, streams.CP, streams.h))):
+            f.write('{},{:.6g},{:.6g},{:.6g},{:.6g}\n'.format(name, *row))
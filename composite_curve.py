@@ -1,4 +1,9 @@
-import matplotlib.pyplot as plt
+import numpy as np
+
+from stream import StreamTable, stream_arrays
+from helper_functions import interval_totals
+from results import CompositeCurveResult
+from heat_cascade import PINCH_TOLERANCE
 
 TYPE_HOT = 0
 TYPE_COLD = 1
@@ -9,69 +14,82 @@ class CompositeCurve:
                  hot_intervals, cold_intervals,
                  hot_utility, cold_utility,
                  T_pinch, dTmin):
-        # Populate composite curve intervals
-        self.hot_streams = hot_streams
-        self.cold_streams = cold_streams
-        self.hot_composite_curve = []
-        self.cold_composite_curve = []
+        # Populate composite curve arrays (boundaries, CP and cumulative Q from the cold end)
+        self.hot_streams = StreamTable.from_streams(hot_streams)
+        self.cold_streams = StreamTable.from_streams(cold_streams)
         self.hot_utility = hot_utility
         self.cold_utility = cold_utility
         self.T_pinch = T_pinch
         self.dTmin = dTmin
 
-        for i in range(len(hot_intervals) - 1):
-            interval = CompositeCurveInterval(TYPE_HOT, hot_intervals[i], hot_intervals[i + 1])
-            interval.extract(hot_streams)
-            self.hot_composite_curve.append(interval)
-
-        for i in range(len(cold_intervals) - 1):
-            interval = CompositeCurveInterval(TYPE_COLD, cold_intervals[i], cold_intervals[i + 1])
-            interval.extract(cold_streams)
-            self.cold_composite_curve.append(interval)
-
-    def plot(self):
-        plt.figure(figsize=(8, 4.5))
-        q = 0
-        for interval in reversed(self.hot_composite_curve):
-            q_next = q + interval.CP * interval.dT
-            plt.plot((q, q_next), (interval.T_c, interval.T_h), 'r-')
-            q = q_next
-
-        q = self.cold_utility
-        for interval in reversed(self.cold_composite_curve):
-            q_next = q + interval.CP * interval.dT
-            plt.plot((q, q_next), (interval.T_c, interval.T_h), 'b-')
-            q = q_next
-
-        plt.show()
+        (self.hot_temperatures, self.hot_CP, self.hot_CP_h,
+         self.hot_Q) = _sweep_composite_curve(self.hot_streams, hot_intervals)
+        (self.cold_temperatures, self.cold_CP, self.cold_CP_h,
+         self.cold_Q) = _sweep_composite_curve(self.cold_streams, cold_intervals)
+        self._hot_composite_curve = None
+        self._cold_composite_curve = None
+
+    @property
+    def hot_composite_curve(self):
+        '''Hot composite curve intervals, hottest first. Stream membership is resolved lazily.'''
+        if self._hot_composite_curve is None:
+            self._hot_composite_curve = self._intervals(TYPE_HOT, self.hot_temperatures, self.hot_CP,
+                                                        self.hot_streams)
+        return self._hot_composite_curve
+
+    @property
+    def cold_composite_curve(self):
+        '''Cold composite curve intervals, hottest first. Stream membership is resolved lazily.'''
+        if self._cold_composite_curve is None:
+            self._cold_composite_curve = self._intervals(TYPE_COLD, self.cold_temperatures, self.cold_CP,
+                                                         self.cold_streams)
+        return self._cold_composite_curve
+
+    def to_result(self):
+        '''Immutable CompositeCurveResult of the hot and cold curves'''
+        return CompositeCurveResult.from_composite_curve(self)
+
+    def plot(self, filename=None):
+        '''
+        Plots the composite curves
+        :param filename: write the figure to this file instead of showing it (optional, headless)
+        '''
+        from plotting import plot_composite_curve
+        plot_composite_curve(self, filename)
+
+    @staticmethod
+    def _intervals(type, temperatures, CP, streams):
+        return [CompositeCurveInterval(type, temperatures[i + 1], temperatures[i], CP=CP[i], source_streams=streams)
+                for i in reversed(range(len(CP)))]
 
     def get_streams_below_pinch(self):
-        streams = []
-        for stream in self.hot_streams:
-            if stream.T_t < self.T_pinch + self.dTmin/2:
-                streams.append(stream)
-
-        for stream in self.cold_streams:
-            if stream.T_s < self.T_pinch - self.dTmin/2:
-                streams.append(stream)
-
-        return streams
+        '''Streams with a part below the pinch. Without a pinch no hot utility is needed and all of them are.'''
+        if self.T_pinch is None:
+            return self._one_row_per_stream()
+        hot_dT, cold_dT = self.hot_streams.contributions(self.dTmin), self.cold_streams.contributions(self.dTmin)
+        hot = _first_row_per_stream(self.hot_streams, self.hot_streams.T_t < self.T_pinch + hot_dT - PINCH_TOLERANCE)
+        cold = _first_row_per_stream(self.cold_streams,
+                                     self.cold_streams.T_s < self.T_pinch - cold_dT - PINCH_TOLERANCE)
+        return [self.hot_streams[i] for i in hot] + [self.cold_streams[i] for i in cold]
 
     def get_streams_above_pinch(self):
-        streams = []
-        for stream in self.hot_streams:
-            if stream.T_s > self.T_pinch + self.dTmin/2:
-                streams.append(stream)
-
-        for stream in self.cold_streams:
-            if stream.T_t > self.T_pinch - self.dTmin/2:
-                streams.append(stream)
+        '''Streams with a part above the pinch, none when there is no pinch'''
+        if self.T_pinch is None:
+            return []
+        hot_dT, cold_dT = self.hot_streams.contributions(self.dTmin), self.cold_streams.contributions(self.dTmin)
+        hot = _first_row_per_stream(self.hot_streams, self.hot_streams.T_s > self.T_pinch + hot_dT + PINCH_TOLERANCE)
+        cold = _first_row_per_stream(self.cold_streams,
+                                     self.cold_streams.T_t > self.T_pinch - cold_dT + PINCH_TOLERANCE)
+        return [self.hot_streams[i] for i in hot] + [self.cold_streams[i] for i in cold]
 
-        return streams
+    def _one_row_per_stream(self):
+        hot = _first_row_per_stream(self.hot_streams, np.ones(len(self.hot_streams), dtype=bool))
+        cold = _first_row_per_stream(self.cold_streams, np.ones(len(self.cold_streams), dtype=bool))
+        return [self.hot_streams[i] for i in hot] + [self.cold_streams[i] for i in cold]
 
 
 class CompositeCurveInterval:
-    def __init__(self, type, T_h, T_c):
+    def __init__(self, type, T_h, T_c, CP=0, source_streams=None):
         if T_h <= T_c:
             raise InvalidIntervalException('Hot temperature of interval cannot be colder than cold temperature')
         self.T_h = T_h
@@ -79,21 +97,30 @@ class CompositeCurveInterval:
         self.dT = T_h - T_c
 
         self.type = type
-        self.CP = 0
-        self.streams = []
+        self.CP = CP
         self.Q = -1
+        self._source_streams = source_streams
+        self._streams = None
+
+    @property
+    def streams(self):
+        '''Streams spanning this interval, looked up from the source streams on first access'''
+        if self._streams is None:
+            if isinstance(self._source_streams, StreamTable):
+                self._streams = self._source_streams.spanning(self.T_h, self.T_c)
+            else:
+                self._streams = [s for s in self._source_streams or [] if self._spans(s)]
+        return self._streams
 
     def extract(self, streams):
-        for s in streams:
-            if s.is_hot():
-                if s.T_s > self.T_c and s.T_t < self.T_h:
-                    self.CP += s.CP
-                    self.streams.append(s)
-            elif not s.is_hot():
-                if s.T_t > self.T_c and s.T_s < self.T_h:
-                    self.CP += s.CP
-                    self.streams.append(s)
-        # assert len(self.streams) > 0
+        self._streams = [s for s in streams if self._spans(s)]
+        for s in self._streams:
+            self.CP += s.CP
+
+    def _spans(self, s):
+        if s.is_hot():
+            return s.T_s > self.T_c and s.T_t < self.T_h
+        return s.T_t > self.T_c and s.T_s < self.T_h
 
     def get_heat_load(self):
         return self.CP * self.dT
@@ -107,3 +134,27 @@ class CompositeCurveInterval:
 class InvalidIntervalException(Exception):
     pass
 
+
+def _sweep_composite_curve(streams, intervals):
+    '''
+    Builds one composite curve in a single sweep over its sorted temperature boundaries
+    :param streams: streams of a single type
+    :param intervals: interval boundaries in descending order
+    :return: boundaries (ascending), CP and sum of CP/h per interval, cumulative heat load at each boundary
+    '''
+    T_s, T_t, CP, h, _ = stream_arrays(streams)
+    T_high = np.maximum(T_s, T_t)
+    T_low = np.minimum(T_s, T_t)
+    CP_total = interval_totals(intervals, T_high, T_low, CP)[::-1]
+    CP_h_total = interval_totals(intervals, T_high, T_low, CP / h)[::-1]
+    temperatures = np.asarray(intervals, dtype=float)[::-1]
+    Q = np.concatenate(([0.0], np.cumsum(CP_total * np.diff(temperatures))))
+    return (np.ascontiguousarray(temperatures), np.ascontiguousarray(CP_total),
+            np.ascontiguousarray(CP_h_total), Q)
+
+
+def _first_row_per_stream(streams, mask):
+    '''Rows where mask holds, keeping one row for each stream (segmented streams take several rows)'''
+    rows = np.flatnonzero(mask)
+    _, first = np.unique(streams.stream_ids()[rows], return_index=True)
+    return rows[np.sort(first)]
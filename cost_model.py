@@ -0,0 +1,176 @@
+'''
+Capital cost models for area targets. A CostModel prices a number of equally sized units with the fixed head
+exchanger correlation, corrected for material, pressure and tube length. With shell targeting on, the balanced
+composite curve segments are treated as 1-2 shell and tube exchangers: each segment gets its fractional number
+of shells (Ahmad, Linnhoff and Smith) and its Bath area is divided by the matching F_T correction. Every step
+works on arrays, so whole sets of segments or sweep points are costed in one call.
+'''
+import math
+
+import numpy as np
+
+from helper_functions import capital_recovery_factor
+
+FT2_PER_M2 = 10.76391041671
+
+# F_M = a + (A / 100 ft2) ** b for shell/tube material pairs
+MATERIAL_FACTORS = {
+    'CS/CS': (0.0, 0.0),
+    'CS/brass': (1.08, 0.05),
+    'CS/SS': (1.75, 0.13),
+    'CS/monel': (2.1, 0.13),
+    'CS/Ti': (5.2, 0.16),
+    'CS/Cr-Mo': (1.55, 0.05),
+    'Cr-Mo/Cr-Mo': (1.7, 0.07),
+    'SS/SS': (2.7, 0.07),
+    'monel/monel': (3.3, 0.08),
+    'Ti/Ti': (9.6, 0.06),
+}
+
+# F_L by tube length (ft)
+TUBE_LENGTH_FACTORS = {8: 1.25, 12: 1.12, 16: 1.05, 20: 1.0}
+
+
+class CostModel:
+    def __init__(self, material='CS/CS', pressure=None, tube_length=20, shell_targeting=False, X_P=0.9,
+                 max_shell_area=None, interest_rate=0.1, years=5, coefficients=(11.0545, -0.9228, 0.09861)):
+        '''
+        The defaults reproduce the plain fixed head cost of Nmin equal units.
+        :param material: shell/tube material pair, a key of MATERIAL_FACTORS
+        :param pressure: shell side design pressure (psig), None for the 100 psig base of the correlation
+        :param tube_length: tube length (ft), a key of TUBE_LENGTH_FACTORS
+        :param shell_targeting: cost 1-2 shells with F_T corrected areas instead of counter-current units
+        :param X_P: fraction of the largest feasible P each 1-2 shell is designed for
+        :param max_shell_area: largest area of one unit (m2), None for no limit
+        :param interest_rate: interest rate used to annualise the capital cost
+        :param years: plant life used to annualise the capital cost
+        :param coefficients: a, b, c of ln(cost) = a + b ln(A) + c ln(A)^2 with A in ft2
+        '''
+        if material not in MATERIAL_FACTORS:
+            raise ValueError("Unknown material {!r}, expected one of {}".format(material, sorted(MATERIAL_FACTORS)))
+        if tube_length not in TUBE_LENGTH_FACTORS:
+            raise ValueError("Unknown tube length {!r}, expected one of {}".format(
+                tube_length, sorted(TUBE_LENGTH_FACTORS)))
+        if not 0 < X_P < 1:
+            raise ValueError("X_P must lie between 0 and 1, got {}".format(X_P))
+        self.material = material
+        self.pressure = pressure
+        self.tube_length = tube_length
+        self.shell_targeting = shell_targeting
+        self.X_P = X_P
+        self.max_shell_area = max_shell_area
+        self.interest_rate = interest_rate
+        self.years = years
+        self.coefficients = coefficients
+
+    def base_cost(self, area):
+        '''
+        Fixed head exchanger base cost
+        :param area: area per unit (m2, array)
+        :return: base cost ($)
+        '''
+        a, b, c = self.coefficients
+        log_area = np.log(FT2_PER_M2 * np.asarray(area, dtype=float))
+        return np.exp(a + b * log_area + c * log_area ** 2)
+
+    def material_factor(self, area):
+        a, b = MATERIAL_FACTORS[self.material]
+        return a + (FT2_PER_M2 * np.asarray(area, dtype=float) / 100) ** b
+
+    def pressure_factor(self):
+        if self.pressure is None:
+            return 1.0
+        return 0.9803 + 0.018 * (self.pressure / 100) + 0.0017 * (self.pressure / 100) ** 2
+
+    def length_factor(self):
+        return TUBE_LENGTH_FACTORS[self.tube_length]
+
+    def purchase_cost(self, area):
+        '''
+        :param area: area per unit (m2, array)
+        :return: purchase cost per unit ($)
+        '''
+        return self.pressure_factor() * self.length_factor() * self.material_factor(area) * self.base_cost(area)
+
+    def capital_cost(self, total_area, units):
+        '''
+        Capital cost of a total area spread evenly over a number of units, for one or many cases at once
+        :param total_area: total area (m2, array)
+        :param units: number of units (array)
+        :return: capital cost ($)
+        '''
+        total_area = np.asarray(total_area, dtype=float)
+        units = np.asarray(units, dtype=float)
+        if np.any(units < 1):
+            raise ValueError("Capital cost needs at least one unit, got {}".format(units[units < 1].min()))
+        if self.max_shell_area is not None:
+            units = np.maximum(units, np.ceil(total_area / self.max_shell_area))
+        return units * self.purchase_cost(total_area / units)
+
+    def annualise(self, capital_cost):
+        '''Capital cost spread into equal yearly payments'''
+        return capital_cost * capital_recovery_factor(self.interest_rate, self.years)
+
+    def shell_targets(self, T_h_start, T_h_end, T_c_start, T_c_end):
+        '''
+        Fractional number of 1-2 shells and the F_T correction of counter-current segments. A segment
+        needing more than one shell is split into shells each reaching X_P of the largest feasible P.
+        :param T_h_start: hot temperature at the cold end of each segment (array)
+        :param T_h_end: hot temperature at the hot end of each segment (array)
+        :param T_c_start: cold temperature at the cold end of each segment (array)
+        :param T_c_end: cold temperature at the hot end of each segment (array)
+        :return: shells per segment, F_T per segment (arrays)
+        '''
+        R = (T_h_end - T_h_start) / (T_c_end - T_c_start)
+        P = (T_c_end - T_c_start) / (T_h_end - T_c_start)
+        S = R + 1 + np.sqrt(R ** 2 + 1)
+        P_shell = self.X_P * 2 / S
+        near_one = np.abs(R - 1) < 1e-6
+        R_safe = np.where(near_one, 2.0, R)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shells = np.where(near_one,
+                              P / (1 - P) * (1 - P_shell) / P_shell,
+                              np.log((1 - R_safe * P) / (1 - P))
+                              / np.log((S - 2 * R_safe * self.X_P) / (S - 2 * self.X_P)))
+        # Less than one shell: the single shell works at the segment's own P
+        return shells, correction_factor(R, np.where(shells <= 1, P, P_shell))
+
+    def bcc_targets(self, balanced_composite_curve):
+        '''
+        Area and unit targets the capital cost is based on
+        :param balanced_composite_curve: BalancedCompositeCurve with its heat intervals
+        :return: total area (m2), number of units
+        '''
+        bcc = balanced_composite_curve
+        if len(bcc.q_intervals) == 0:
+            bcc.get_heat_intervals()
+        units = bcc.get_unit_target()
+        if not self.shell_targeting:
+            return bcc.get_total_area(), units
+        shells, F_T = self.shell_targets(bcc.T_h_start, bcc.T_h_end, bcc.T_c_start, bcc.T_c_end)
+        return float((bcc.segment_area / F_T).sum()), max(units, math.ceil(shells.sum() - 1e-9))
+
+    def total_cost(self, balanced_composite_curve):
+        '''Capital cost of a balanced composite curve's area and unit targets ($)'''
+        return float(self.capital_cost(*self.bcc_targets(balanced_composite_curve)))
+
+
+def correction_factor(R, P):
+    '''
+    F_T of a 1-2 shell and tube exchanger
+    :param R: heat capacity flowrate ratio, cold CP over hot CP (array)
+    :param P: thermal effectiveness of the cold side (array)
+    :return: F_T (array)
+    '''
+    R = np.asarray(R, dtype=float)
+    P = np.asarray(P, dtype=float)
+    root = np.sqrt(R ** 2 + 1)
+    near_one = np.abs(R - 1) < 1e-6
+    R_safe = np.where(near_one, 2.0, R)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = np.log((2 - P * (R + 1 - root)) / (2 - P * (R + 1 + root)))
+        F_T = np.where(near_one,
+                       root * P / (1 - P) / denominator,
+                       root / (R_safe - 1) * np.log((1 - P) / (1 - R_safe * P)) / denominator)
+    # No temperature change on one side means pure counter-current behaviour
+    return np.where(P > 0, F_T, 1.0)
@@ -1,62 +1,173 @@
-import pandas as pd
+import hashlib
+import os
+
+import numpy as np
+
+from stream import StreamTable
+
+CACHE_SUFFIX = '.streams.npz'
+MAX_REPORTED_ROWS = 10
 
 
 class DataLoader:
     @staticmethod
-    def load_streams_from_excel(file_path):
+    def load_streams_from_excel(file_path, use_cache=True):
         '''
         Loads stream data from an excel file. Stream data must be on the first sheet and be arranged with the columns:
         Name/ID | Supply Temperature | Target Temperature | CP | h (Optional)
 
         h values that are not supplied will be assumed to be 1
         :param file_path: path to the excel file (string)
-        :return:
+        :param use_cache: read/write the binary sidecar cache
+        :return: StreamTable
         '''
-        df = pd.read_excel(file_path)
-
-        print(df.head())
+        return load_stream_table(file_path, use_cache=use_cache)
 
     @staticmethod
-    def load_streams_from_csv(file_path):
+    def load_streams_from_csv(file_path, use_cache=True):
         '''
-        Loads stream data from an excel file. Stream data must be on the first sheet and be arranged with the columns:
+        Loads stream data from a csv file. Stream data must be arranged with the columns:
         Name/ID,Supply Temperature,Target Temperature,CP,h (Optional)
 
         h values that are not supplied will be assumed to be 1
         :param file_path: path to the csv file (string)
-        :return:
+        :param use_cache: read/write the binary sidecar cache
+        :return: StreamTable
         '''
+        return load_stream_table(file_path, use_cache=use_cache)
 
-        df = pd.read_csv(file_path)
 
-        df = df.drop(columns=df.columns[0])
+class StreamDataError(ValueError):
+    pass
 
-        df = df.fillna(1)
 
-        # _validate_stream_data(df)
-        streams = df.values
+def load_stream_table(file_path, use_cache=True):
+    '''
+    Loads stream data from a csv or excel file straight into a StreamTable. The columns must be:
+    Name/ID, Supply Temperature, Target Temperature, CP, h (Optional)
+
+    h values that are not supplied will be assumed to be 1. All rows are validated together and a
+    StreamDataError lists every offending row. The parsed columns are stored next to the file
+    (<file>.streams.npz) and reused while the file is unchanged.
+    :param file_path: path to the csv/excel file (string)
+    :param use_cache: read/write the binary sidecar cache
+    :return: StreamTable
+    '''
+    cache_path = file_path + CACHE_SUFFIX
+    if use_cache:
+        table = _read_cache(file_path, cache_path)
+        if table is not None:
+            return table
 
-        return streams
+    names, columns = _parse(file_path)
+    _validate_stream_data(columns)
+    table = StreamTable(columns[0], columns[1], columns[2], columns[3], names)
 
+    if use_cache:
+        _write_cache(file_path, cache_path, names, columns)
+    return table
 
-def load_streams_from_csv(file_path):
-    '''
-    Loads stream data from an excel file. Stream data must be on the first sheet and be arranged with the columns:
-    Name/ID,Supply Temperature,Target Temperature,CP,h (Optional)
 
-    h values that are not supplied will be assumed to be 1
+def load_streams_from_csv(file_path, use_cache=True):
+    '''
+    Loads stream data from a csv file as a list of [T_s, T_t, CP, h] rows (hot streams first). See load_stream_table.
     :param file_path: path to the csv file (string)
-    :return:
+    :param use_cache: read/write the binary sidecar cache
+    :return: list of stream rows
     '''
-    df = pd.read_csv(file_path)
-    df = df.drop(columns=df.columns[0])
-    df = df.fillna(1)
-    df = df.round(decimals=6)
+    table = load_stream_table(file_path, use_cache=use_cache)
+    return np.column_stack((table.T_s, table.T_t, table.CP, table.h)).tolist()
 
-    streams = list(df.values)
 
-    streams = [list(s) for s in streams]
+# Private methods
+def _parse(file_path):
+    import pandas as pd
 
-    return streams
+    if os.path.splitext(file_path)[1].lower() in ('.xls', '.xlsx', '.xlsm'):
+        df = pd.read_excel(file_path)
+    else:
+        df = pd.read_csv(file_path)
 
-# Testing
\ No newline at end of file
+    if df.shape[1] < 4:
+        raise StreamDataError(
+            "Stream data needs Name/ID, Supply Temperature, Target Temperature and CP columns, found {}".format(
+                list(df.columns)))
+    if df.shape[1] > 5:
+        raise StreamDataError("Stream data has too many columns: {}".format(list(df.columns)))
+
+    names = df.iloc[:, 0].astype(str).tolist()
+    columns = np.full((4, len(df)), np.nan)
+    for i in range(df.shape[1] - 1):
+        columns[i] = pd.to_numeric(df.iloc[:, i + 1], errors='coerce').to_numpy(dtype=float)
+    if df.shape[1] == 4:
+        columns[3] = 1
+    else:
+        columns[3][df.iloc[:, 4].isna().to_numpy()] = 1
+
+    return names, np.round(columns, decimals=6)
+
+
+def _validate_stream_data(columns):
+    T_s, T_t, CP, h = columns
+    checks = [
+        (np.isnan(T_s) | np.isnan(T_t) | np.isnan(CP) | np.isnan(h), "missing or non-numeric values"),
+        (T_s == T_t, "equal supply and target temperatures"),
+        (CP <= 0, "non-positive CP"),
+        (h <= 0, "non-positive h")
+    ]
+
+    errors = []
+    for failed, message in checks:
+        # Row numbers as seen in the file, after the header line
+        rows = np.flatnonzero(failed) + 2
+        if len(rows):
+            shown = ", ".join(str(r) for r in rows[:MAX_REPORTED_ROWS])
+            more = " and {} more".format(len(rows) - MAX_REPORTED_ROWS) if len(rows) > MAX_REPORTED_ROWS else ""
+            errors.append("{} in row(s) {}{}".format(message, shown, more))
+
+    if errors:
+        raise StreamDataError("Invalid stream data: " + "; ".join(errors))
+
+
+def _file_key(file_path):
+    stat = os.stat(file_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _read_cache(file_path, cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as cache:
+            key, digest = cache['key'], str(cache['sha256'])
+            columns, names = cache['columns'], cache['names'].tolist()
+    except (OSError, KeyError, ValueError):
+        return None
+
+    # Size and mtime are checked first; a touched but identical file is recognised by its hash
+    if not np.array_equal(key, _file_key(file_path)):
+        if digest != _file_hash(file_path):
+            return None
+        _write_cache(file_path, cache_path, names, columns, digest)
+    return StreamTable(columns[0], columns[1], columns[2], columns[3], names)
+
+
+def _write_cache(file_path, cache_path, names, columns, digest=None):
+    digest = digest or _file_hash(file_path)
+    tmp_path = '{}.{}.tmp.npz'.format(cache_path, os.getpid())
+    try:
+        np.savez(tmp_path, key=_file_key(file_path), sha256=np.array(digest),
+                 columns=columns, names=np.array(names, dtype=str))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # The cache is an optimisation only, e.g. the data directory may be read-only
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
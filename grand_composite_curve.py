@@ -0,0 +1,100 @@
+import numpy as np
+
+PLACEMENT_TOLERANCE = 1e-6
+
+
+class GrandCompositeCurve:
+    def __init__(self, heat_cascade, dTmin):
+        '''
+        Net heat flow through the shifted temperature scale, read off the feasible heat cascade
+        :param heat_cascade: HeatCascade of the shifted streams
+        :param dTmin: minimum approach temperature the streams were shifted with
+        '''
+        self.dTmin = dTmin
+        self.T_pinch = heat_cascade.T_pinch
+        self.hot_utility = heat_cascade.hot_utility
+        self.cold_utility = heat_cascade.cold_utility
+
+        # Shifted boundaries (descending) and the heat flowing down through each; the top boundary
+        # receives the hot utility and the bottom one passes the cold utility
+        self.temperatures = heat_cascade.temperatures
+        self.heat = np.concatenate(([heat_cascade.hot_utility], heat_cascade.fhc))
+        self._infeasible_heat = np.concatenate(([0.0], heat_cascade.ihc))
+
+    def place_utilities(self, hot_utility_streams, cold_utility_streams):
+        '''
+        Allocates the minimum hot and cold utility loads over several utility levels. Utilities are taken
+        cheapest first (by Utility.cost, or lowest steam/highest cooling level first when no costs are given)
+        and each takes as much load as the cascade lets it. A hot utility can only serve the boundaries below
+        its shifted level, so its load is limited by the smallest heat flow still unallocated at any boundary
+        at or above it; cold utilities are limited likewise by the boundaries below them once the hot loads are in.
+        The shifted levels must be boundaries of the cascade (see utility_levels).
+        :param hot_utility_streams: list of hot Utility
+        :param cold_utility_streams: list of cold Utility
+        :return: hot loads, cold loads (arrays in the order of the given utilities)
+        '''
+        descending = -self.temperatures
+        hot_levels = utility_levels(hot_utility_streams, self.dTmin)
+        cold_levels = utility_levels(cold_utility_streams, self.dTmin)
+
+        # Hot loads supplied at or below boundary j may not exceed the heat flowing through j
+        hot_loads = np.zeros(len(hot_utility_streams))
+        slack = self.heat.copy()
+        remaining = self.hot_utility
+        for k in _cheapest_first(hot_utility_streams, hot_levels, hot=True):
+            above = np.searchsorted(descending, -hot_levels[k], side='right')
+            load = min(remaining, slack[:above].min()) if above else remaining
+            hot_loads[k] = max(load, 0.0)
+            slack[:above] -= hot_loads[k]
+            remaining -= hot_loads[k]
+        if remaining > PLACEMENT_TOLERANCE * max(1.0, self.hot_utility):
+            raise ValueError("Hot utility levels are too low to supply {} of the {} hot utility target".format(
+                remaining, self.hot_utility))
+
+        # Heat reaching each boundary with the hot utilities in place; cold loads removed at or above
+        # boundary j may not exceed it
+        supplied = (hot_levels > self.temperatures[:, None]) @ hot_loads
+        slack = self._infeasible_heat + supplied
+        cold_loads = np.zeros(len(cold_utility_streams))
+        remaining = self.cold_utility
+        for k in _cheapest_first(cold_utility_streams, cold_levels, hot=False):
+            below = np.searchsorted(descending, -cold_levels[k], side='left')
+            load = min(remaining, slack[below:].min()) if below < len(slack) else remaining
+            cold_loads[k] = max(load, 0.0)
+            slack[below:] -= cold_loads[k]
+            remaining -= cold_loads[k]
+        if remaining > PLACEMENT_TOLERANCE * max(1.0, self.cold_utility):
+            raise ValueError("Cold utility levels are too high to absorb {} of the {} cold utility target".format(
+                remaining, self.cold_utility))
+
+        return hot_loads, cold_loads
+
+    def plot(self, filename=None):
+        '''
+        Plots the grand composite curve
+        :param filename: write the figure to this file instead of showing it (optional, headless)
+        '''
+        from plotting import plot_grand_composite_curve
+        plot_grand_composite_curve(self, filename)
+
+
+def utility_levels(utility_streams, dTmin):
+    '''
+    Shifted temperature at which each utility exchanges heat: its target temperature (or its supply
+    temperature when the target is the fitted variable), moved down by dTmin/2 for hot utilities and
+    up for cold ones
+    :param utility_streams: list of Utility
+    :param dTmin: minimum approach temperature
+    :return: shifted levels (array)
+    '''
+    return np.array([(u.T_t if u.T_t is not None else u.T_s) + u.type * dTmin / 2.0 for u in utility_streams],
+                    dtype=float)
+
+
+# Private methods
+def _cheapest_first(utility_streams, levels, hot):
+    # Without prices, lower steam levels and warmer coolants are assumed cheaper
+    def key(k):
+        cost = utility_streams[k].cost
+        return cost is None, cost or 0.0, levels[k] if hot else -levels[k]
+    return sorted(range(len(utility_streams)), key=key)
@@ -1,52 +1,459 @@
-import pandas as pd
+import numpy as np
+
+from stream import stream_arrays
+from helper_functions import interval_totals
+from results import CascadeResult
+
+PINCH_TOLERANCE = 1e-5
+# Parametric pieces evaluated together
+PIECE_BLOCK_SIZE = 128
+
+PROBLEM_PINCHED = 'pinched'
+PROBLEM_THRESHOLD = 'threshold'
 
 
 class HeatCascade:
     def __init__(self, streams, intervals):
+        T_s, T_t, CP, _, is_hot = stream_arrays(streams)
+
         # Populate heat cascade intervals
-        self.cascades = []
-        for i in range(len(intervals) - 1):
-            interval = HeatCascadeInterval(intervals[i], intervals[i + 1])
-            for s in streams:
-                interval.add(s)
-            self.cascades.append(interval)
+        self.temperatures = np.asarray(intervals, dtype=float)
+        self.dT = self.temperatures[:-1] - self.temperatures[1:]
+        self.CP_total = interval_cp_totals(self.temperatures, T_s, T_t, CP, is_hot)
+        self.dH = self.CP_total * self.dT
 
         # Perform heat cascade to find shifted pinch temperature
-        q = 0
-        violation = 1
-        for c in self.cascades:
-            q = c.infeasible_cascade(q)
-            violation = min(violation, q)
-
-        # Feasible heat cascade
-        q = -violation
-        self.T_pinch = None
-        for c in self.cascades:
-            q = c.feasible_cascade(q)
-            if q <= 1e-5:
-                self.T_pinch = c.T_c
-
-        self.hot_utility = -violation
-        self.cold_utility = self.cascades[-1].fhc
+        self.ihc, self.fhc, self.hot_utility, self.cold_utility = cascade(self.dH)
+
+        # Pinch is at the coldest interval boundary where the feasible cascade reaches zero
+        pinch_index = np.flatnonzero(self.fhc <= PINCH_TOLERANCE)
+        self.T_pinch = float(self.temperatures[pinch_index[-1] + 1]) if len(pinch_index) else None
+
+        # Every interior boundary the feasible cascade reaches zero at is a pinch point, hottest first.
+        # Zero flow at the cold end is a zero cold utility, i.e. a threshold, not a pinch.
+        self.pinch_points = self.temperatures[pinch_index[pinch_index < len(self.fhc) - 1] + 1]
+
+    @property
+    def zero_utility(self):
+        ''''hot', 'cold' or 'both' for the utilities that are not needed, None when both are'''
+        no_hot = self.hot_utility <= PINCH_TOLERANCE
+        no_cold = self.cold_utility <= PINCH_TOLERANCE
+        if no_hot and no_cold:
+            return 'both'
+        return 'hot' if no_hot else 'cold' if no_cold else None
+
+    @property
+    def problem_type(self):
+        '''PROBLEM_THRESHOLD when one of the utilities is not needed, PROBLEM_PINCHED otherwise'''
+        return PROBLEM_PINCHED if self.zero_utility is None else PROBLEM_THRESHOLD
+
+    @property
+    def cascades(self):
+        '''Per-interval view of the cascade arrays'''
+        cascades = []
+        for i in range(len(self.dT)):
+            interval = HeatCascadeInterval(self.temperatures[i], self.temperatures[i + 1])
+            interval.CP_total = self.CP_total[i]
+            interval.dH = self.dH[i]
+            interval.ihc = self.ihc[i]
+            interval.fhc = self.fhc[i]
+            cascades.append(interval)
+        return cascades
 
     def get_results(self):
         return self.T_pinch, self.hot_utility, self.cold_utility
 
+    def to_result(self):
+        '''Immutable CascadeResult of this cascade'''
+        return CascadeResult.from_heat_cascade(self)
+
     def print_table(self):
         print('===== PROBLEM TABLE ANALYSIS =====')
         print("Pinch temperature is at shifted T = {}".format(self.T_pinch))
         print("Minimum Hot Utility = {}, Minimum Cold Utility = {}".format(self.hot_utility, self.cold_utility))
 
-        cascades_list = [[self.cascades[0].T_h, 0, 0, 0, 0, self.hot_utility]]
-        for c in self.cascades:
-            cascades_list.append([c.T_c, c.dT, c.CP_total, c.dH, c.ihc, c.fhc])
-
-        pd.options.display.max_columns = 6
-        print(pd.DataFrame(cascades_list,
-                           columns=['S', 'dS', 'CP total', 'dH', 'Infeasible Cascade', 'Feasible Cascade']))
+        from reporting import print_problem_table
+        print_problem_table(self)
         print("=" * 32)
 
 
+def interval_cp_totals(temperatures, T_s, T_t, CP, is_hot):
+    '''
+    Net CP of every shifted temperature interval (hot streams positive, cold streams negative)
+    :param temperatures: interval boundaries in descending order
+    :param T_s: supply temperatures (array)
+    :param T_t: target temperatures (array)
+    :param CP: heat capacity flowrates (array)
+    :param is_hot: stream type flags (bool array)
+    :return: CP total per interval (array of len(temperatures) - 1)
+    '''
+    T_high = np.where(is_hot, T_s, T_t)
+    T_low = np.where(is_hot, T_t, T_s)
+    return interval_totals(temperatures, T_high, T_low, np.where(is_hot, CP, -CP))
+
+
+def cascade(dH):
+    '''
+    Infeasible and feasible heat cascades from the interval heat surpluses
+    :param dH: heat surplus per interval, from the hottest interval down
+    :return: infeasible cascade, feasible cascade, minimum hot utility, minimum cold utility
+    '''
+    ihc = np.cumsum(dH)
+    hot_utility = -min(0.0, float(ihc.min()))
+    fhc = ihc + hot_utility
+    return ihc, fhc, hot_utility, float(fhc[-1])
+
+
+def dtmin_targets(T_s, T_t, CP, is_hot, dT_min_values):
+    '''
+    Pinch and utility targets for many dTmin values at once. The hot and cold enthalpy profiles are
+    built once from the unshifted streams; each dTmin only offsets where they are sampled, so no
+    streams are shifted and no interval list is rebuilt per point.
+    :param T_s: supply temperatures (array)
+    :param T_t: target temperatures (array)
+    :param CP: heat capacity flowrates (array)
+    :param is_hot: stream type flags (bool array)
+    :param dT_min_values: dTmin values to evaluate (array)
+    :return: shifted pinch temperature (nan when there is none), hot utility and cold utility arrays
+    '''
+    hot_T, hot_H, cold_T, cold_H = _enthalpy_profiles(T_s, T_t, CP, is_hot)
+    dt = np.asarray(dT_min_values, dtype=float)[:, None] / 2.0
+    shifted, ihc = _boundary_cascade(hot_T, hot_H, cold_T, cold_H, dt)
+    T_pinch, hot_utility = _pinch_targets(shifted, ihc)
+    return T_pinch, hot_utility, hot_utility + _total_load(hot_H) - _total_load(cold_H)
+
+
+def topology_breakpoints(T_s, T_t, is_hot):
+    '''
+    dTmin values at which a shifted hot stream temperature crosses a shifted cold one. Between two
+    consecutive breakpoints the order of the interval boundaries, and so the pinch location, stays the
+    same and the utility targets change linearly with dTmin.
+    :param T_s: supply temperatures (array)
+    :param T_t: target temperatures (array)
+    :param is_hot: stream type flags (bool array)
+    :return: positive breakpoints in ascending order (array)
+    '''
+    hot_T = np.unique(np.concatenate((T_s[is_hot], T_t[is_hot])))
+    cold_T = np.unique(np.concatenate((T_s[~is_hot], T_t[~is_hot])))
+    differences = np.subtract.outer(hot_T, cold_T).ravel()
+    return np.unique(differences[differences > 0])
+
+
+class ParametricTargets:
+    '''
+    Exact pinch and utility targets as piecewise linear functions of dTmin over a closed range, evaluated
+    by a sorted lookup of the breakpoints. The utilities are continuous and kept as their values at the
+    breakpoints. The shifted pinch temperature jumps where the pinch moves to another boundary, so it is
+    kept both at the breakpoints and as one line per piece between them.
+    '''
+    def __init__(self, dT_min, hot_utility, cold_utility, T_pinch, pinch_start, pinch_slope):
+        '''
+        :param dT_min: breakpoints in ascending order, both ends of the range included (array)
+        :param hot_utility: hot utility at each breakpoint (array)
+        :param cold_utility: cold utility at each breakpoint (array)
+        :param T_pinch: shifted pinch temperature at each breakpoint, nan where there is none (array)
+        :param pinch_start: shifted pinch temperature at the start of each piece, nan where there is none (array)
+        :param pinch_slope: change of the shifted pinch temperature per unit dTmin along each piece (array)
+        '''
+        self.dT_min = np.asarray(dT_min, dtype=float)
+        self.hot_utility = np.asarray(hot_utility, dtype=float)
+        self.cold_utility = np.asarray(cold_utility, dtype=float)
+        self.T_pinch = np.asarray(T_pinch, dtype=float)
+        self.pinch_start = np.asarray(pinch_start, dtype=float)
+        self.pinch_slope = np.asarray(pinch_slope, dtype=float)
+
+    def __len__(self):
+        '''Number of linear pieces'''
+        return len(self.dT_min) - 1
+
+    @property
+    def pinch_changes(self):
+        '''Breakpoints where the pinch moves to another boundary, appears or disappears'''
+        end = self.pinch_start + self.pinch_slope * np.diff(self.dT_min)
+        moved = ~np.isclose(end[:-1], self.pinch_start[1:], rtol=0, atol=PINCH_TOLERANCE, equal_nan=True)
+        return self.dT_min[1:-1][moved]
+
+    def __call__(self, dT_min_values):
+        '''
+        :param dT_min_values: dTmin value or values within the range
+        :return: shifted pinch temperature (nan when there is none), hot utility and cold utility, shaped
+                 like dT_min_values
+        '''
+        values = np.asarray(dT_min_values, dtype=float)
+        if np.any((values < self.dT_min[0]) | (values > self.dT_min[-1])):
+            raise ValueError("dTmin must lie within the parametric range [{}, {}]".format(
+                self.dT_min[0], self.dT_min[-1]))
+
+        x = values.ravel()
+        piece = np.clip(np.searchsorted(self.dT_min, x, side='right') - 1, 0, len(self) - 1)
+        offset = x - self.dT_min[piece]
+        fraction = offset / (self.dT_min[piece + 1] - self.dT_min[piece])
+        hot_utility = self.hot_utility[piece] + fraction * (self.hot_utility[piece + 1] - self.hot_utility[piece])
+        cold_utility = self.cold_utility[piece] + fraction * (self.cold_utility[piece + 1] - self.cold_utility[piece])
+
+        # On a breakpoint the pinch is taken from the breakpoint itself, where both neighbouring pieces meet
+        T_pinch = self.pinch_start[piece] + self.pinch_slope[piece] * offset
+        node = np.minimum(np.searchsorted(self.dT_min, x), len(self.dT_min) - 1)
+        T_pinch = np.where(self.dT_min[node] == x, self.T_pinch[node], T_pinch)
+
+        return tuple(column.reshape(values.shape)[()] for column in (T_pinch, hot_utility, cold_utility))
+
+
+def parametric_targets(T_s, T_t, CP, is_hot, dT_min_low, dT_min_high):
+    '''
+    Pinch and utility targets as exact piecewise linear functions of dTmin, found in one pass over the
+    topology breakpoints within the range. Between two breakpoints the infeasible cascade at every
+    interval boundary is a straight line in dTmin, so the hot utility follows the lower envelope of those
+    lines; its kinks, where the pinch moves from one boundary to another, are the only other breakpoints.
+    The cascade is only built at the low end: each breakpoint is a hot and a cold temperature crossing, which
+    changes the slope of just those two boundaries' lines, so the pass sorts the crossings once and updates
+    the slopes as it reaches them. The pieces are then searched in blocks, each over only the lines that
+    can get close enough to the lowest one to matter within it.
+    :param T_s: supply temperatures (array)
+    :param T_t: target temperatures (array)
+    :param CP: heat capacity flowrates (array)
+    :param is_hot: stream type flags (bool array)
+    :param dT_min_low: lowest dTmin of the range
+    :param dT_min_high: highest dTmin of the range
+    :return: ParametricTargets
+    '''
+    if not 0 <= dT_min_low < dT_min_high:
+        raise ValueError("dTmin range must satisfy 0 <= low < high, got [{}, {}]".format(dT_min_low, dT_min_high))
+
+    hot_T, hot_H, cold_T, cold_H = _enthalpy_profiles(T_s, T_t, CP, is_hot)
+    hot_CP, cold_CP = _segment_cps(hot_T, hot_H), _segment_cps(cold_T, cold_H)
+    # Hot boundaries move down by dTmin / 2, cold ones up
+    direction = np.concatenate((np.full(len(hot_T), -0.5), np.full(len(cold_T), 0.5)))
+
+    # Crossings inside the range, in dTmin order: hot temperature k meets cold temperature j at their difference
+    differences = np.subtract.outer(hot_T, cold_T)
+    hot_k, cold_j = np.nonzero((differences > dT_min_low) & (differences < dT_min_high))
+    crossings = differences[hot_k, cold_j]
+    order = np.argsort(crossings, kind='stable')
+    hot_k, cold_j, crossings = hot_k[order], cold_j[order], crossings[order]
+    nodes = np.concatenate(([dT_min_low], np.unique(crossings), [dT_min_high]))
+    first_crossing = np.searchsorted(crossings, nodes)
+    # As dTmin grows the hot boundary passes down through the cold temperature, and the cold one up through
+    # the hot temperature; the cascade at each falls by the CP of the other side's segment it is in
+    columns = np.stack((hot_k, len(hot_T) + cold_j), axis=1)
+    slope_changes = np.stack((cold_CP[cold_j + 1] - cold_CP[cold_j], hot_CP[hot_k] - hot_CP[hot_k + 1]), axis=1)
+
+    # Each boundary's cascade is kept as a line, intercept + slopes * dTmin, valid up to the next crossing
+    boundaries = np.concatenate((hot_T, cold_T))
+    _, ihc = _boundary_cascade(hot_T, hot_H, cold_T, cold_H, np.array([[nodes[0] / 2.0]]))
+    slopes = -np.concatenate((cold_CP[np.searchsorted(cold_T, hot_T - nodes[0], side='left')],
+                              hot_CP[np.searchsorted(hot_T, cold_T + nodes[0], side='right')]))
+    intercept = ihc[0] - slopes * nodes[0]
+
+    # No line falls faster than the steepest composite segment, so over a span of dTmin only the lines starting
+    # within that fall of the lowest can reach the bottom of the cascade. The hottest hot and cold boundaries are
+    # kept too, so the pinch search still knows which boundary is topmost.
+    steepest = max(hot_CP.max(), cold_CP.max())
+    top = np.array([len(hot_T) - 1, len(boundaries) - 1])[[len(hot_T) > 0, len(cold_T) > 0]]
+
+    dT_min, pinch_targets, pinch_start, pinch_slope = [], [], [], []
+    for first in range(0, len(nodes) - 1, PIECE_BLOCK_SIZE):
+        start, end = nodes[:-1][first:first + PIECE_BLOCK_SIZE], nodes[1:][first:first + PIECE_BLOCK_SIZE]
+        at_first = intercept + slopes * start[0]
+        reach = steepest * (end[-1] - start[0]) + 2 * PINCH_TOLERANCE
+        kept = np.union1d(np.flatnonzero(at_first <= at_first.min() + reach), top)
+        local = np.full(len(boundaries), -1)
+        local[kept] = np.arange(len(kept))
+
+        # Piece i starts at node i, so it takes the slope changes of the crossings there; none lie at the low end
+        events = slice(first_crossing[first], first_crossing[first + len(start)])
+        rows = np.repeat(np.arange(len(start)), np.diff(first_crossing[first:first + len(start) + 1]))
+        rows, event_columns = np.broadcast_arrays(rows[:, None], columns[events])
+        is_kept = local[event_columns] >= 0
+        slope_change = np.zeros((len(start), len(kept)))
+        np.add.at(slope_change, (rows[is_kept], local[event_columns[is_kept]]), slope_changes[events][is_kept])
+        piece_slopes = slopes[kept] + np.cumsum(slope_change, axis=0)
+        piece_intercepts = intercept[kept] - np.cumsum(slope_change * start[:, None], axis=0)
+        np.add.at(slopes, event_columns, slope_changes[events])
+        np.add.at(intercept, event_columns, -slope_changes[events] * crossings[events][:, None])
+
+        # A piece bends only where the line lowest at its start differs from the one lowest at its end
+        at_start = piece_intercepts + piece_slopes * start[:, None]
+        at_end = piece_intercepts + piece_slopes * end[:, None]
+        every_row = np.arange(len(start))
+        bends = (piece_slopes[every_row, _lowest(at_start, piece_slopes)]
+                 > piece_slopes[every_row, _lowest(at_end, -piece_slopes)])
+        row_pieces = [[row_start] for row_start in start]
+        for row in np.flatnonzero(bends):
+            row_pieces[row] += _envelope_kinks(at_start[row], piece_slopes[row], start[row], end[row])
+
+        # Targets at the start of every linear piece, and the pinch boundary found midway along it
+        row = np.repeat(every_row, [len(pieces) for pieces in row_pieces])
+        piece_start = np.concatenate(row_pieces)
+        piece_end = np.concatenate([pieces[1:] + [row_end] for pieces, row_end in zip(row_pieces, end)])
+        middle = (piece_start + piece_end) / 2.0
+        middle_shifted = boundaries[kept] + direction[kept] * middle[:, None]
+        pinch, _ = _pinch_targets(middle_shifted, piece_intercepts[row] + piece_slopes[row] * middle[:, None])
+        at_pinch = middle_shifted == pinch[:, None]
+        slope = np.where(at_pinch.any(axis=1), direction[kept][at_pinch.argmax(axis=1)], 0.0)
+        T_pinch, hot_utility = _pinch_targets(boundaries[kept] + direction[kept] * piece_start[:, None],
+                                              piece_intercepts[row] + piece_slopes[row] * piece_start[:, None])
+        dT_min.append(piece_start)
+        pinch_targets.append((T_pinch, hot_utility))
+        pinch_slope.append(slope)
+        pinch_start.append(pinch - slope * (middle - piece_start))
+
+    # The lines of the last piece hold up to the high end
+    pinch_targets.append(_pinch_targets((boundaries + direction * nodes[-1])[None, :],
+                                        (intercept + slopes * nodes[-1])[None, :]))
+    T_pinch, hot_utility = (np.concatenate(column) for column in zip(*pinch_targets))
+    dT_min = np.concatenate(dT_min + [nodes[-1:]])
+    pinch_start, pinch_slope = np.concatenate(pinch_start), np.concatenate(pinch_slope)
+
+    return ParametricTargets(dT_min, hot_utility, hot_utility + _total_load(hot_H) - _total_load(cold_H), T_pinch,
+                             pinch_start, pinch_slope)
+
+
+def threshold_dtmin(T_s, T_t, CP, is_hot):
+    '''
+    Threshold dTmin, below which one of the utilities is not needed and above which the problem is
+    pinched. Utility targets never fall as dTmin grows, so the topology breakpoints are bisected for the
+    interval where both utilities become necessary, and the exact point is then solved from the boundary
+    cascade lines within it.
+    :param T_s: supply temperatures (array)
+    :param T_t: target temperatures (array)
+    :param CP: heat capacity flowrates (array)
+    :param is_hot: stream type flags (bool array)
+    :return: threshold dTmin, or None when the problem is pinched at every dTmin or at none
+    '''
+    hot_T, hot_H, cold_T, cold_H = _enthalpy_profiles(T_s, T_t, CP, is_hot)
+    # Hot utility while the smaller utility is still zero
+    threshold_hot_utility = max(0.0, _total_load(cold_H) - _total_load(hot_H))
+    breakpoints = topology_breakpoints(T_s, T_t, is_hot)
+    # The targets stay linear past the last breakpoint, so one point beyond it closes the search
+    nodes = np.concatenate(([0.0], breakpoints, [breakpoints[-1] + 1 if len(breakpoints) else 1.0]))
+
+    def excess(i):
+        '''Hot utility each boundary would need beyond the threshold level at nodes[i]'''
+        _, ihc = _boundary_cascade(hot_T, hot_H, cold_T, cold_H, np.array([[nodes[i] / 2.0]]))
+        return -ihc[0] - threshold_hot_utility
+
+    def pinched(i):
+        return excess(i).max() > PINCH_TOLERANCE
+
+    low, high = 0, len(nodes) - 1
+    if pinched(low) or not pinched(high):
+        return None
+    while high - low > 1:
+        middle = (low + high) // 2
+        if pinched(middle):
+            high = middle
+        else:
+            low = middle
+
+    # First boundary line to cross the threshold level
+    excess_low, excess_high = excess(low), excess(high)
+    crossing = excess_high > PINCH_TOLERANCE
+    fraction = np.clip(-excess_low[crossing] / (excess_high[crossing] - excess_low[crossing]), 0.0, 1.0)
+    return float(nodes[low] + fraction.min() * (nodes[high] - nodes[low]))
+
+
+def _enthalpy_profiles(T_s, T_t, CP, is_hot):
+    '''Hot and cold enthalpy profiles of the unshifted streams'''
+    T_high = np.where(is_hot, T_s, T_t)
+    T_low = np.where(is_hot, T_t, T_s)
+    hot_T, hot_H = _enthalpy_profile(T_high[is_hot], T_low[is_hot], CP[is_hot])
+    cold_T, cold_H = _enthalpy_profile(T_high[~is_hot], T_low[~is_hot], CP[~is_hot])
+    return hot_T, hot_H, cold_T, cold_H
+
+
+def _boundary_cascade(hot_T, hot_H, cold_T, cold_H, dt):
+    '''
+    Shifted interval boundaries and the infeasible cascade at each of them, one row per temperature shift
+    :param dt: temperature shifts, i.e. dTmin / 2 (column array)
+    '''
+    # The interval boundaries are the shifted stream temperatures: hot ones move down, cold ones up
+    shifted = np.concatenate((np.broadcast_to(hot_T - dt, (len(dt), len(hot_T))),
+                              np.broadcast_to(cold_T + dt, (len(dt), len(cold_T)))), axis=1)
+
+    # Heat surplus cascaded down to each boundary
+    ihc = ((_total_load(hot_H) - _load_below(shifted + dt, hot_T, hot_H))
+           - (_total_load(cold_H) - _load_below(shifted - dt, cold_T, cold_H)))
+    return shifted, ihc
+
+
+def _pinch_targets(shifted, ihc):
+    '''Shifted pinch temperature (nan when there is none) and hot utility of each row of boundaries'''
+    hot_utility = -np.minimum(ihc.min(axis=1), 0.0)
+
+    # The topmost boundary is not the cold end of any interval, so it cannot be the pinch
+    fhc = ihc + hot_utility[:, None]
+    is_pinch = (fhc <= PINCH_TOLERANCE) & (shifted < shifted.max(axis=1, keepdims=True))
+    T_pinch = np.where(is_pinch, shifted, np.inf).min(axis=1)
+    T_pinch[np.isinf(T_pinch)] = np.nan
+    return T_pinch, hot_utility
+
+
+def _envelope_kinks(start_values, slopes, start, end):
+    '''
+    Points inside (start, end) where the lowest of a set of lines changes, in ascending order. Each
+    span is closed by intersecting the lines lowest at its two ends: either nothing lies below that
+    intersection and it is a kink, or the line lowest there splits the span in two.
+    '''
+    kinks = []
+    spans = [(start, end)]
+    while spans:
+        a, b = spans.pop()
+        at_a = start_values + slopes * (a - start)
+        at_b = start_values + slopes * (b - start)
+        # Among lines tied at an end, the one leading into the span is the one falling fastest towards it
+        low_a = _lowest(at_a, slopes)
+        low_b = _lowest(at_b, -slopes)
+        if slopes[low_a] <= slopes[low_b]:
+            continue
+        x = a + (at_a[low_b] - at_a[low_a]) / (slopes[low_a] - slopes[low_b])
+        if not a < x < b:
+            continue
+        at_x = start_values + slopes * (x - start)
+        if at_x.min() >= at_x[low_a] - PINCH_TOLERANCE:
+            kinks.append(x)
+        else:
+            spans.extend(((a, x), (x, b)))
+    return sorted(kinks)
+
+
+def _lowest(values, slopes):
+    '''Index of the lowest value (in each row), ties within the pinch tolerance going to the smallest slope'''
+    tied = values <= values.min(axis=-1, keepdims=True) + PINCH_TOLERANCE
+    return np.where(tied, slopes, np.inf).argmin(axis=-1)
+
+
+def _segment_cps(temperatures, enthalpy):
+    '''CP between each pair of neighbouring profile temperatures, padded with zero below and above the profile'''
+    return np.concatenate(([0.0], np.diff(enthalpy) / np.diff(temperatures), [0.0]))
+
+
+def _enthalpy_profile(T_high, T_low, CP):
+    '''
+    Cumulative heat load of a set of streams below each of their (sorted, unique) temperatures. Without
+    streams the profile is empty, so it adds no interval boundaries.
+    '''
+    temperatures = np.unique(np.concatenate((T_low, T_high)))
+    if len(temperatures) == 0:
+        return np.zeros(0), np.zeros(0)
+
+    deltas = (np.bincount(np.searchsorted(temperatures, T_low), weights=CP, minlength=len(temperatures))
+              - np.bincount(np.searchsorted(temperatures, T_high), weights=CP, minlength=len(temperatures)))
+    CP_segments = np.cumsum(deltas)[:-1]
+    enthalpy = np.concatenate(([0.0], np.cumsum(CP_segments * np.diff(temperatures))))
+    return temperatures, enthalpy
+
+
+def _total_load(enthalpy):
+    '''Heat load of a whole enthalpy profile'''
+    return enthalpy[-1] if len(enthalpy) else 0.0
+
+
+def _load_below(T, temperatures, enthalpy):
+    '''Heat load of an enthalpy profile below each temperature in T'''
+    return np.interp(T, temperatures, enthalpy) if len(temperatures) else np.zeros(np.shape(T))
+
+
 class HeatCascadeInterval:
     def __init__(self, T_h, T_c):
         if T_h <= T_c:
@@ -1,7 +1,128 @@
+import numpy as np
+
+from stream import stream_arrays
+
+
 # Export methods
 def get_intervals(streams):
-    intervals = set()
-    for s in streams:
-        intervals.add(s.T_s)
-        intervals.add(s.T_t)
-    return sorted(list(intervals), reverse=True)
+    '''Unique stream temperatures in descending order'''
+    T_s, T_t = stream_arrays(streams)[:2]
+    return np.unique(np.concatenate((T_s, T_t)))[::-1]
+
+
+def interval_totals(intervals, T_high, T_low, weights):
+    '''
+    Sweeps down a list of interval boundaries and sums the weights of the streams spanning each interval.
+    Every stream is an enter event at its hot end and an exit event at its cold end, so the totals are
+    a cumulative sum over the events rather than a scan over the streams for every interval.
+    :param intervals: interval boundaries in descending order
+    :param T_high: hot end temperature of each stream (array)
+    :param T_low: cold end temperature of each stream (array)
+    :param weights: weight of each stream, e.g. its CP (array)
+    :return: summed weight per interval (array of len(intervals) - 1)
+    '''
+    return grouped_interval_totals(intervals, T_high, T_low, weights, np.zeros(len(T_high), dtype=int), 1)[0]
+
+
+def grouped_interval_totals(intervals, T_high, T_low, weights, groups, n_groups):
+    '''
+    interval_totals for several groups of streams over one shared list of boundaries. The enter and exit
+    events of all streams are binned per (group, interval) in one bincount, so every group's totals come
+    from a single sweep.
+    :param intervals: interval boundaries in descending order
+    :param T_high: hot end temperature of each stream (array)
+    :param T_low: cold end temperature of each stream (array)
+    :param weights: weight of each stream (array)
+    :param groups: group index of each stream, from 0 to n_groups - 1 (int array)
+    :param n_groups: number of groups
+    :return: summed weight per group and interval (array of shape (n_groups, len(intervals) - 1))
+    '''
+    n_intervals = len(intervals) - 1
+    descending = -np.asarray(intervals, dtype=float)
+
+    # A stream spans interval i when T_high > T_c(i) and T_low < T_h(i)
+    enter = np.searchsorted(descending[1:], -np.asarray(T_high, dtype=float), side='right')
+    exit = np.searchsorted(descending[:-1], -np.asarray(T_low, dtype=float), side='left')
+    spans = enter < exit
+
+    weights = np.asarray(weights, dtype=float)[spans]
+    offset = np.asarray(groups)[spans] * (n_intervals + 1)
+    size = n_groups * (n_intervals + 1)
+    events = (np.bincount(offset + enter[spans], weights=weights, minlength=size)
+              - np.bincount(offset + exit[spans], weights=weights, minlength=size))
+    return np.cumsum(events.reshape(n_groups, n_intervals + 1), axis=1)[:, :n_intervals]
+
+
+def capital_recovery_factor(interest_rate, years):
+    '''Fraction of a capital cost paid each year to repay it over the given years at the given interest rate'''
+    if interest_rate == 0:
+        return 1.0 / years
+    growth = (1 + interest_rate) ** years
+    return interest_rate * growth / (growth - 1)
+
+
+def brent_minimise(f, a, b, tol=1e-2, max_iter=50):
+    '''
+    Brent's method for the minimum of a function of one variable on [a, b]: parabolic interpolation
+    through the three best points, falling back to a golden-section step whenever the parabola is not
+    trusted. Converges in a few evaluations on smooth functions and never slower than golden section.
+    :param f: function to minimise
+    :param a: lower bound
+    :param b: upper bound
+    :param tol: absolute tolerance on the position of the minimum
+    :param max_iter: maximum number of function evaluations
+    :return: position of the minimum, function value there
+    '''
+    golden = 0.5 * (3 - 5 ** 0.5)
+    x = w = v = a + golden * (b - a)
+    fx = fw = fv = f(x)
+    d = e = 0.0
+
+    for _ in range(max_iter - 1):
+        midpoint = 0.5 * (a + b)
+        tol1 = tol / 3 + 1e-10 * abs(x)
+        tol2 = 2 * tol1
+        if abs(x - midpoint) <= tol2 - 0.5 * (b - a):
+            break
+
+        use_golden = True
+        if abs(e) > tol1:
+            # Parabola through x, w and v
+            r = (x - w) * (fx - fv)
+            q = (x - v) * (fx - fw)
+            p = (x - v) * q - (x - w) * r
+            q = 2 * (q - r)
+            if q > 0:
+                p = -p
+            q = abs(q)
+            if abs(p) < abs(0.5 * q * e) and q * (a - x) < p < q * (b - x):
+                e, d = d, p / q
+                u = x + d
+                if u - a < tol2 or b - u < tol2:
+                    d = tol1 if x < midpoint else -tol1
+                use_golden = False
+        if use_golden:
+            e = (b - x) if x < midpoint else (a - x)
+            d = golden * e
+
+        u = x + (d if abs(d) >= tol1 else (tol1 if d > 0 else -tol1))
+        fu = f(u)
+        if fu <= fx:
+            if u < x:
+                b = x
+            else:
+                a = x
+            v, w, x = w, x, u
+            fv, fw, fx = fw, fx, fu
+        else:
+            if u < x:
+                a = u
+            else:
+                b = u
+            if fu <= fw or w == x:
+                v, w = w, u
+                fv, fw = fw, fu
+            elif fu <= fv or v == x or v == w:
+                v, fv = u, fu
+
+    return x, fx
@@ -0,0 +1,224 @@
+import itertools
+
+import numpy as np
+
+from stream import StreamTable
+from heat_cascade import PINCH_TOLERANCE, interval_cp_totals
+
+
+class IncrementalHeatCascade:
+    '''
+    Heat cascade that follows stream additions, removals and changes without being rebuilt. The interval heat
+    surpluses are the leaves of a segment tree whose nodes hold (sum, minimum prefix sum) of their range, so the
+    cascade violation (hot utility) is read at the root and the pinch is found by one descent. The interval
+    boundaries are a sorted coordinate index with spare leaves allocated behind them: a new boundary splits the
+    interval it falls in, shifting the leaves after it into the slack, and removed boundaries stay as harmless
+    extra boundaries. The index is only rebuilt to compact it, once half of it is dead or the slack runs out.
+    A stream update adds its CP over the net CP of the intervals it spans in one array operation and then
+    refreshes their ancestors level by level. The CP cannot be kept as a lazy tag on a node, because the
+    position of a node's minimum prefix sum moves with the CP added to it.
+    '''
+    def __init__(self, streams=(), dT_min=5):
+        '''
+        :param streams: initial streams (StreamTable or list of streams/[T_s, T_t, CP, (h)] rows), which get
+                        the ids 0, 1, ... in the order given
+        :param dT_min: minimum approach temperature
+        '''
+        self.dT_min = dT_min
+        self._streams = {}
+        table = StreamTable.from_streams(streams)
+        self._ids = itertools.count(len(table))
+        for i, stream_id in enumerate(_input_positions(streams, table)):
+            self._streams[stream_id] = (table.T_s[i], table.T_t[i], table.CP[i], table.h[i])
+        self._rebuild()
+
+    def add_stream(self, T_s, T_t, CP, h=1):
+        '''
+        :return: id of the new stream, used to update or remove it
+        '''
+        if T_s == T_t:
+            raise ValueError("Stream cannot have equal supply and target temperatures!")
+        stream_id = next(self._ids)
+        self._streams[stream_id] = (float(T_s), float(T_t), float(CP), float(h))
+        self._insert(stream_id)
+        return stream_id
+
+    def remove_stream(self, stream_id):
+        self._apply(stream_id, -1)
+        for T in self._shifted_ends(*self._streams[stream_id][:2]):
+            self._counts[self._position(T)] -= 1
+        del self._streams[stream_id]
+
+        if 2 * np.count_nonzero(self._counts == 0) > len(self.temperatures):
+            self._rebuild()
+
+    def update_stream(self, stream_id, T_s=None, T_t=None, CP=None, h=None):
+        '''Changes some of a stream's data; the values that are not given are kept'''
+        old = self._streams[stream_id]
+        new = tuple(float(old[i] if v is None else v) for i, v in enumerate((T_s, T_t, CP, h)))
+        if new[0] == new[1]:
+            raise ValueError("Stream cannot have equal supply and target temperatures!")
+        self.remove_stream(stream_id)
+        self._streams[stream_id] = new
+        self._insert(stream_id)
+
+    @property
+    def hot_utility(self):
+        return max(-float(self._min_prefix[1]), 0.0) if len(self._streams) else 0.0
+
+    @property
+    def cold_utility(self):
+        return float(self._sum[1]) + self.hot_utility if len(self._streams) else 0.0
+
+    @property
+    def T_pinch(self):
+        '''Coldest shifted interval boundary where the feasible cascade reaches zero (None if there is none)'''
+        if not len(self._streams):
+            return None
+        # Interval i ends at boundary i + 1; left-over boundaries above or below the current streams carry
+        # the full or zero heat flow and are not pinches
+        live = np.flatnonzero(self._counts)
+        interval = self._last_prefix_at_most(PINCH_TOLERANCE - self.hot_utility, live[-1])
+        if interval < live[0]:
+            return None
+        return float(self.temperatures[interval + 1])
+
+    def get_results(self):
+        return self.T_pinch, self.hot_utility, self.cold_utility
+
+    def get_streams(self):
+        '''Current streams as a StreamTable, e.g. for a full PinchAnalyser run'''
+        return StreamTable(*np.array(list(self._streams.values()), dtype=float).reshape(-1, 4).T)
+
+    def __len__(self):
+        return len(self._streams)
+
+    # Private methods
+    def _shifted_ends(self, T_s, T_t):
+        shift = -self.dT_min / 2.0 if T_s > T_t else self.dT_min / 2.0
+        return T_s + shift, T_t + shift
+
+    def _position(self, T):
+        '''Index of boundary T in the descending coordinate index, or where it would be inserted'''
+        return int(np.searchsorted(-self.temperatures, -T))
+
+    def _insert(self, stream_id):
+        ends = self._shifted_ends(*self._streams[stream_id][:2])
+        if len(self.temperatures) + 1 > self._n_leaves:
+            # No room for two more boundaries: compact, which also adds the new stream
+            self._rebuild()
+            return
+        for T in ends:
+            self._add_boundary(T)
+        self._apply(stream_id, 1)
+
+    def _add_boundary(self, T):
+        i = self._position(T)
+        if i < len(self.temperatures) and self.temperatures[i] == T:
+            self._counts[i] += 1
+            return
+
+        # A boundary inside the range splits interval i - 1 in two with the same net CP; one above or below
+        # it adds an interval no stream spans yet
+        split = min(max(i - 1, 0), len(self._CP))
+        CP = self._CP[i - 1] if 0 < i < len(self.temperatures) else 0.0
+        self.temperatures = np.insert(self.temperatures, i, T)
+        self._counts = np.insert(self._counts, i, 1)
+        if len(self.temperatures) > 1:
+            self._CP = np.insert(self._CP, split, CP)
+        self.dT = self.temperatures[:-1] - self.temperatures[1:]
+
+        # Every leaf from the split on moves one place into the slack
+        self._set_leaves(split, len(self._CP))
+
+    def _apply(self, stream_id, sign):
+        '''Adds (sign=1) or removes (sign=-1) a stream's heat surplus over the intervals it spans'''
+        T_s, T_t, CP = self._streams[stream_id][:3]
+        start, end = sorted(self._position(T) for T in self._shifted_ends(T_s, T_t))
+        self._CP[start:end] += sign * (CP if T_s > T_t else -CP)
+        self._set_leaves(start, end)
+
+    def _set_leaves(self, start, end):
+        dH = self._CP[start:end] * self.dT[start:end]
+        self._sum[self._n_leaves + start:self._n_leaves + end] = dH
+        self._min_prefix[self._n_leaves + start:self._n_leaves + end] = dH
+        self._update_ancestors(self._n_leaves + start, self._n_leaves + end)
+
+    def _last_prefix_at_most(self, threshold, end):
+        '''Last interval before end whose cumulative surplus is at most threshold (-1 if there is none)'''
+        # Split intervals 0..end-1 into tree nodes, in order, and look for the last one reaching the threshold
+        lo, hi = self._n_leaves, self._n_leaves + end
+        left_nodes, right_nodes = [], []
+        while lo < hi:
+            if lo & 1:
+                left_nodes.append(lo)
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right_nodes.append(hi)
+            lo, hi = lo // 2, hi // 2
+        nodes = left_nodes + right_nodes[::-1]
+        offsets = np.concatenate(([0.0], np.cumsum(self._sum[nodes])))
+
+        for k in reversed(range(len(nodes))):
+            node, offset = nodes[k], offsets[k]
+            if offset + self._min_prefix[node] <= threshold:
+                while node < self._n_leaves:
+                    left, right = 2 * node, 2 * node + 1
+                    if offset + self._sum[left] + self._min_prefix[right] <= threshold:
+                        offset += self._sum[left]
+                        node = right
+                    else:
+                        node = left
+                return node - self._n_leaves
+        return -1
+
+    def _update_ancestors(self, lo, hi):
+        # Recompute the parents of nodes lo..hi-1 one level at a time, up to the root
+        while lo > 1 and lo < hi:
+            lo, hi = lo // 2, (hi - 1) // 2 + 1
+            left_sum = self._sum[2 * lo:2 * hi:2]
+            self._min_prefix[lo:hi] = np.minimum(self._min_prefix[2 * lo:2 * hi:2],
+                                                 left_sum + self._min_prefix[2 * lo + 1:2 * hi:2])
+            self._sum[lo:hi] = left_sum + self._sum[2 * lo + 1:2 * hi:2]
+
+    def _rebuild(self):
+        '''Compacts the coordinate index to the boundaries of the current streams'''
+        if self._streams:
+            T_s, T_t, CP, _ = np.array(list(self._streams.values()), dtype=float).T
+            T_start, T_end = self._shifted_ends_array(T_s, T_t)
+            ends = np.concatenate((T_start, T_end))
+            self.temperatures = np.unique(ends)[::-1]
+            self._counts = np.bincount(self._position_array(ends), minlength=len(self.temperatures))
+            self.dT = self.temperatures[:-1] - self.temperatures[1:]
+            self._CP = interval_cp_totals(self.temperatures, T_start, T_end, CP, T_s > T_t)
+        else:
+            self.temperatures = np.zeros(0)
+            self._counts = np.zeros(0, dtype=int)
+            self.dT = np.zeros(0)
+            self._CP = np.zeros(0)
+
+        # Twice the leaves needed, so boundaries can be added before the next compaction. Leaves past the last
+        # interval are padding: no surplus and never the minimum.
+        self._n_leaves = 1 << max(2 * len(self._CP) - 1, 1).bit_length()
+        self._sum = np.zeros(2 * self._n_leaves)
+        self._min_prefix = np.full(2 * self._n_leaves, np.inf)
+        self._set_leaves(0, len(self._CP))
+        self._update_ancestors(self._n_leaves, 2 * self._n_leaves)
+
+    def _position_array(self, T):
+        return np.searchsorted(-self.temperatures, -T)
+
+    def _shifted_ends_array(self, T_s, T_t):
+        shift = np.where(T_s > T_t, -self.dT_min / 2.0, self.dT_min / 2.0)
+        return T_s + shift, T_t + shift
+
+
+# Private methods
+def _input_positions(streams, table):
+    '''Position in the input of each table row (the table stores hot streams ahead of cold ones)'''
+    if isinstance(streams, StreamTable):
+        return range(len(table))
+    is_hot = np.array([(s[0] > s[1]) if isinstance(s, (list, tuple, np.ndarray)) else s.T_s > s.T_t
+                       for s in streams], dtype=bool)
+    return np.argsort(~is_hot, kind='stable').tolist()
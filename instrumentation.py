@@ -0,0 +1,103 @@
+'''
+Opt-in timing and counter instrumentation for the analysis stages.
+
+An Instrumentation object collects structured records:
+    {'kind': 'timer', 'name': ..., 'path': ..., 'seconds': ..., **fields}
+    {'kind': 'counter', 'name': ..., 'path': ..., 'value': ..., **fields}
+where 'path' is the chain of enclosing stages (e.g. 'get_area_target/problem_table_analysis'). Records are
+kept in memory and/or handed to a user callback as they are produced. Code that is not instrumented uses
+NULL_INSTRUMENTATION, whose stage timer and counters do nothing.
+'''
+import time
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, callback=None, keep_records=True):
+        '''
+        :param callback: function called with every record as it is produced (optional)
+        :param keep_records: keep records in self.records
+        '''
+        self.callback = callback
+        self.keep_records = keep_records
+        self.records = []
+        self._stack = []
+
+    def stage(self, name, **fields):
+        '''Context manager timing one stage; extra keyword fields are added to its record'''
+        return _StageTimer(self, name, fields)
+
+    def count(self, name, value, **fields):
+        self.emit({'kind': 'counter', 'name': name, 'path': self._path(name), 'value': value, **fields})
+
+    def emit(self, record):
+        if self.keep_records:
+            self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def summary(self):
+        '''Total time and number of calls per stage path'''
+        totals = {}
+        for record in self.records:
+            if record['kind'] == 'timer':
+                seconds, calls = totals.get(record['path'], (0.0, 0))
+                totals[record['path']] = (seconds + record['seconds'], calls + 1)
+        return {path: {'seconds': seconds, 'calls': calls} for path, (seconds, calls) in totals.items()}
+
+    def clear(self):
+        self.records = []
+
+    # Private methods
+    def _path(self, name):
+        return '/'.join(self._stack + [name])
+
+
+class _StageTimer:
+    __slots__ = ('instrumentation', 'name', 'fields', 'start')
+
+    def __init__(self, instrumentation, name, fields):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.instrumentation._stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        instrumentation = self.instrumentation
+        path = '/'.join(instrumentation._stack)
+        instrumentation._stack.pop()
+        record = {'kind': 'timer', 'name': self.name, 'path': path, 'seconds': seconds, **self.fields}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        instrumentation.emit(record)
+        return False
+
+
+class _NullStageTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _NullInstrumentation:
+    enabled = False
+    _timer = _NullStageTimer()
+
+    def stage(self, name, **fields):
+        return self._timer
+
+    def count(self, name, value, **fields):
+        pass
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
@@ -1,7 +1,8 @@
 from pinch_analysis import PinchAnalyser
 from utility import Utility
-from data_loader import load_streams_from_csv
-import matplotlib.pyplot as plt
+from cost_model import CostModel
+from data_loader import load_stream_table
+from plotting import plot_series
 import numpy as np
 
 
@@ -25,7 +26,7 @@ def system_test():
 
 
 # Run the application on the stream data
-streams = load_streams_from_csv('test.csv')
+streams = load_stream_table('test.csv')
 
 hu = Utility('hot', T_s=900, T_t=899, h=1)
 cu = Utility('cold', T_s=20, T_t=30, h=1)
@@ -36,16 +37,16 @@ pinch = PinchAnalyser(streams)
 pinch.get_area_target(hu, cu, 10, verbose=False)
 print(pinch.balanced_composite_curve.get_total_cost())
 
-dtmin = range(5,50)
-costs = []
-for i in dtmin:
-    pinch.get_area_target(hu, cu, i, verbose=False)
-    costs.append(pinch.balanced_composite_curve.get_total_cost())
+sweep = pinch.sweep_dtmin(range(5, 50), hu, cu)
 
-plt.plot(dtmin, costs)
+plot_series(sweep['dT_min'], sweep['cost'])
 
-plt.show()
+# Economic dTmin, with utility prices in $ per kW of load per year
+optimum = pinch.optimise_dtmin(hu, cu, hot_utility_price=120, cold_utility_price=10, dT_min_bounds=(5, 50))
+print("Optimal dTmin = {dT_min:.2f} with total annual cost {total_annual_cost:.0f}".format(**optimum))
 
 # Costing assume Pressure of 43.5 psig
 # Material assume carbon steel on both, FM=1
-# Assume tube length of 12 ft, FL = 1.12
\ No newline at end of file
+# Assume tube length of 12 ft, FL = 1.12
+cost_model = CostModel(material='CS/CS', pressure=43.5, tube_length=12, shell_targeting=True)
+print(cost_model.total_cost(pinch.balanced_composite_curve))
\ No newline at end of file
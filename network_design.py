@@ -0,0 +1,744 @@
+'''
+Heat exchanger network synthesis by the pinch design method. The network is designed separately above and
+below the pinch, starting at the pinch: streams touching the pinch are paired under the number and CP rules
+(splitting streams where the rules cannot be met otherwise), each match takes the largest load that ticks off
+one of its streams, and the remaining duties are matched moving away from the pinch. No match may take a load
+that leaves the remaining duties needing utility from the wrong side of the pinch, so the network meets the
+energy targets: hot utility only above the pinch and cold utility only below it. Where the remaining duties pinch
+again away from the pinch, the problem splits there and both parts are designed the same way.
+
+Both sides run through the same routine. Below the pinch the temperatures are mirrored (T -> -T) and the roles
+of hot and cold streams are swapped, which turns it into an above-pinch problem: every stream is then used up
+from its pinch end outwards and the CP rule always reads CP_hot <= CP_cold.
+'''
+import bisect
+import heapq
+import itertools
+
+import numpy as np
+
+from stream import StreamTable
+from balanced_composite_curve import BalancedCompositeCurve, lmtd
+
+ABOVE_PINCH = 'above'
+BELOW_PINCH = 'below'
+
+LOAD_TOLERANCE = 1e-6
+# Smaller partial matches would only move round-off between the remaining duties
+MIN_PARTIAL_LOAD = 1e-3
+# A partial match takes at least this share of the hot segment's load: smaller ones can only creep along
+# where the segment is already dT_min from the cold streams it could take
+MIN_PARTIAL_SHARE = 0.01
+
+
+class Exchanger:
+    KIND_PROCESS = 'process'
+    KIND_HEATER = 'heater'
+    KIND_COOLER = 'cooler'
+
+    def __init__(self, kind, side, hot, cold, Q, T_h_in, T_h_out, T_c_in, T_c_out, h_hot, h_cold):
+        '''
+        :param kind: KIND_PROCESS, KIND_HEATER or KIND_COOLER
+        :param side: ABOVE_PINCH or BELOW_PINCH
+        :param hot: label of the hot stream ('HU' for the hot utility)
+        :param cold: label of the cold stream ('CU' for the cold utility)
+        :param Q: heat load
+        '''
+        self.kind = kind
+        self.side = side
+        self.hot = hot
+        self.cold = cold
+        self.Q = Q
+        self.T_h_in = T_h_in
+        self.T_h_out = T_h_out
+        self.T_c_in = T_c_in
+        self.T_c_out = T_c_out
+        self.h_hot = h_hot
+        self.h_cold = h_cold
+        self.lmtd = None
+        self.area = None
+        self.cost = None
+
+    def __str__(self):
+        return ("{} {} - {} ({} pinch) Q = {}\n    T_hot = {} to {}, T_cold = {} to {}\n    LMTD = {}, Area = {}, "
+                "Cost = {}".format(self.kind.capitalize(), self.hot, self.cold, self.side, self.Q, self.T_h_in,
+                                   self.T_h_out, self.T_c_in, self.T_c_out, self.lmtd, self.area, self.cost))
+
+
+class HeatExchangerNetwork:
+    def __init__(self, exchangers, splits, T_pinch, dTmin):
+        '''
+        Designed network with the LMTD, area and cost of every exchanger
+        :param exchangers: list of Exchanger
+        :param splits: dict of (stream label, side) -> number of parallel branches, for split streams
+        :param T_pinch: shifted pinch temperature the design started from
+        '''
+        self.exchangers = exchangers
+        self.splits = splits
+        self.T_pinch = T_pinch
+        self.dTmin = dTmin
+
+        # Counter-current exchangers: the area takes the film resistance of both sides
+        T_h_in, T_h_out, T_c_in, T_c_out, Q, h_hot, h_cold = (
+            np.array([getattr(e, name) for e in exchangers], dtype=float)
+            for name in ('T_h_in', 'T_h_out', 'T_c_in', 'T_c_out', 'Q', 'h_hot', 'h_cold'))
+        exchanger_lmtd = lmtd(T_h_in - T_c_out, T_h_out - T_c_in)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            area = Q * (1 / h_hot + 1 / h_cold) / exchanger_lmtd
+        for e, e_lmtd, e_area in zip(exchangers, exchanger_lmtd, area):
+            e.lmtd = float(e_lmtd)
+            e.area = float(e_area)
+            e.cost = BalancedCompositeCurve._get_base_cost(e.area) if e.area > 0 else float('nan')
+
+    def get_exchanger_count(self):
+        return len(self.exchangers)
+
+    def get_total_area(self):
+        return float(sum(e.area for e in self.exchangers))
+
+    def get_total_cost(self):
+        return float(sum(e.cost for e in self.exchangers))
+
+    def get_utility_loads(self):
+        '''
+        :return: hot utility load, cold utility load
+        '''
+        return (float(sum(e.Q for e in self.exchangers if e.kind == Exchanger.KIND_HEATER)),
+                float(sum(e.Q for e in self.exchangers if e.kind == Exchanger.KIND_COOLER)))
+
+    def get_energy_penalty(self):
+        '''Utility used on the wrong side of the pinch (heaters below it plus coolers above it)'''
+        return float(sum(e.Q for e in self.exchangers
+                         if (e.kind == Exchanger.KIND_HEATER and e.side == BELOW_PINCH)
+                         or (e.kind == Exchanger.KIND_COOLER and e.side == ABOVE_PINCH)))
+
+    def compare_with_targets(self, balanced_composite_curve):
+        '''
+        Compares the network with the targets of the balanced composite curve at the same dTmin
+        :param balanced_composite_curve: BalancedCompositeCurve with its area target computed
+        :return: dict of name -> (network value, target value) for units, area and cost
+        '''
+        bcc = balanced_composite_curve
+        area_target = bcc.get_total_area()
+        return {
+            'units': (self.get_exchanger_count(), bcc.get_unit_target()),
+            'area': (self.get_total_area(), area_target),
+            'cost': (self.get_total_cost(), bcc._get_total_cost(area_target))
+        }
+
+    def print_report(self, balanced_composite_curve=None):
+        '''
+        :param balanced_composite_curve: BalancedCompositeCurve to compare the network with (optional)
+        '''
+        print("===== Heat Exchanger Network =====")
+        for e in self.exchangers:
+            print(e)
+        for (label, side), branches in self.splits.items():
+            print("Stream {} split into {} branches {} the pinch".format(label, branches, side))
+        hot_utility, cold_utility = self.get_utility_loads()
+        print("{} units, Area = {}, Cost = {}".format(self.get_exchanger_count(), self.get_total_area(),
+                                                      self.get_total_cost()))
+        print("Hot Utility = {}, Cold Utility = {}, Energy Penalty = {}".format(
+            hot_utility, cold_utility, self.get_energy_penalty()))
+        if balanced_composite_curve is not None:
+            for name, (value, target) in self.compare_with_targets(balanced_composite_curve).items():
+                print("{}: network = {}, target = {}".format(name.capitalize(), value, target))
+        print("==================================")
+
+
+def design_network(streams, T_pinch, dT_min, hot_utility_stream, cold_utility_stream, hot_utility=0):
+    '''
+    Maximum energy recovery network by the pinch design method
+    :param streams: StreamTable or list of streams/[T_s, T_t, CP, (h)] rows
+    :param T_pinch: shifted pinch temperature, or None for a threshold problem
+    :param dT_min: minimum approach temperature
+    :param hot_utility_stream: hot Utility used by the heaters
+    :param cold_utility_stream: cold Utility used by the coolers
+    :param hot_utility: hot utility target, which decides which end a threshold problem is designed from
+    :return: HeatExchangerNetwork
+    '''
+    streams = StreamTable.from_streams(streams)
+    if T_pinch is None:
+        # Threshold problem: design from the end that needs no utility, as if the pinch were there
+        shifted = streams.shifted(dT_min / 2.0)
+        T_all = np.concatenate((shifted.T_s, shifted.T_t))
+        T_pinch = float(T_all.min() if hot_utility > LOAD_TOLERANCE else T_all.max())
+    labels = ['H{}'.format(i + 1) for i in range(streams.n_hot)] + \
+             ['C{}'.format(i + 1) for i in range(len(streams) - streams.n_hot)]
+    if streams.names is not None:
+        labels = [name if name is not None else label for name, label in zip(streams.names, labels)]
+
+    T_pinch_hot = T_pinch + dT_min / 2.0
+    T_pinch_cold = T_pinch - dT_min / 2.0
+    T_high = streams.T_high
+    T_low = streams.T_low
+    is_hot = streams.is_hot
+
+    exchangers = []
+    splits = {}
+    for side in (ABOVE_PINCH, BELOW_PINCH):
+        # Stream portions on this side in the side's frame, each starting at its pinch end
+        if side == ABOVE_PINCH:
+            hot = [_Branch(i, streams.CP[i], max(T_low[i], T_pinch_hot), T_high[i])
+                   for i in np.flatnonzero(is_hot & (T_high > T_pinch_hot))]
+            cold = [_Branch(i, streams.CP[i], max(T_low[i], T_pinch_cold), T_high[i])
+                    for i in np.flatnonzero(~is_hot & (T_high > T_pinch_cold))]
+            matches, hot_left, cold_left, split_off = _design_side(hot, cold, T_pinch_hot, T_pinch_cold, dT_min)
+        else:
+            hot = [_Branch(i, streams.CP[i], -min(T_high[i], T_pinch_cold), -T_low[i])
+                   for i in np.flatnonzero(~is_hot & (T_low < T_pinch_cold))]
+            cold = [_Branch(i, streams.CP[i], -min(T_high[i], T_pinch_hot), -T_low[i])
+                    for i in np.flatnonzero(is_hot & (T_low < T_pinch_hot))]
+            matches, hot_left, cold_left, split_off = _design_side(hot, cold, -T_pinch_cold, -T_pinch_hot, dT_min)
+
+        for b in split_off:
+            key = (labels[b.stream], side)
+            splits[key] = splits.get(key, 1) + 1
+        for hot_stream, cold_stream, Q, fh0, fh1, fc0, fc1 in matches:
+            if side == ABOVE_PINCH:
+                temperatures = (fh1, fh0, fc0, fc1)
+            else:
+                hot_stream, cold_stream = cold_stream, hot_stream
+                temperatures = (-fc0, -fc1, -fh1, -fh0)
+            exchangers.append(Exchanger(Exchanger.KIND_PROCESS, side, labels[hot_stream], labels[cold_stream], Q,
+                                        *temperatures, streams.h[hot_stream], streams.h[cold_stream]))
+
+        # Frame hot streams left over need the utility of the other side of the pinch
+        for segment, frame_hot in [(h, True) for h in hot_left] + [(c, False) for c in cold_left]:
+            actual_hot = frame_hot == (side == ABOVE_PINCH)
+            if side == ABOVE_PINCH:
+                T_in, T_out = (segment.end, segment.start) if actual_hot else (segment.start, segment.end)
+            else:
+                T_in, T_out = (-segment.start, -segment.end) if actual_hot else (-segment.end, -segment.start)
+            exchangers.append(_utility_exchanger(side, actual_hot, labels[segment.stream], segment.load, T_in,
+                                                 T_out, streams.h[segment.stream], hot_utility_stream,
+                                                 cold_utility_stream))
+
+    return HeatExchangerNetwork(exchangers, splits, T_pinch, dT_min)
+
+
+# Private methods
+class _Branch:
+    '''Stream portion (or branch of a split stream) on one side of the pinch, used up from start towards end'''
+    __slots__ = ('stream', 'CP', 'start', 'end')
+
+    def __init__(self, stream, CP, start, end):
+        self.stream = int(stream)
+        self.CP = float(CP)
+        self.start = float(start)
+        self.end = float(end)
+
+    @property
+    def load(self):
+        return self.CP * (self.end - self.start)
+
+    def split(self, CP):
+        '''Takes a parallel branch with the given CP off this one'''
+        self.CP -= CP
+        return _Branch(self.stream, CP, self.start, self.end)
+
+
+def _design_side(hot, cold, T_pinch_hot, T_pinch_cold, dT_min):
+    '''
+    Pinch design method on one side of the pinch, in the above-pinch frame
+    :return: matches as (hot stream, cold stream, Q, hot start, hot end, cold start, cold end) in the frame,
+             hot and cold segments left over, list of the branches split off streams
+    '''
+    matches = []
+    splits = []
+    hot, cold = _pinch_matches(hot, cold, T_pinch_hot, T_pinch_cold, dT_min, matches, splits)
+    _match_away_from_pinch(hot, cold, dT_min, matches, splits)
+    return (matches, _mix([h for h in hot if h.load > LOAD_TOLERANCE]),
+            _mix([c for c in cold if c.load > LOAD_TOLERANCE]), splits)
+
+
+def _pinch_matches(hot, cold, T_pinch_hot, T_pinch_cold, dT_min, matches, splits):
+    '''
+    Pairs the streams at the pinch and gives each pair the load that ticks off one of its streams, where the
+    remaining problem allows it
+    :return: hot and cold segments left, including the branches split off
+    '''
+    pinch_hot = [b for b in hot if abs(b.start - T_pinch_hot) <= LOAD_TOLERANCE]
+    pinch_cold = [b for b in cold if abs(b.start - T_pinch_cold) <= LOAD_TOLERANCE]
+    pairs, split_off = _pinch_pairs(pinch_hot, pinch_cold)
+    splits.extend(split_off)
+    hot_streams = {h.stream for h in hot}
+    hot = hot + [b for b in split_off if b.stream in hot_streams]
+    cold = cold + [b for b in split_off if b.stream not in hot_streams]
+    T, margin = _cascade_margin(hot, cold, dT_min)
+    for h, c in pairs:
+        # Ticking off a stream at the pinch must still leave a feasible problem away from it. A pair that can only
+        # take part of that load is left to the matches away from the pinch: its load would run into the next
+        # tight point, which would then split every stream crossing it.
+        load = _max_load(h, c, dT_min)
+        if load > LOAD_TOLERANCE and \
+                _feasible_loads(h, [c], [c.CP], T, margin, dT_min)[0] >= load - LOAD_TOLERANCE:
+            _match(h, c, load, matches)
+            T, margin = _update_margin(T, margin, h, c, matches[-1], dT_min)
+
+    # Branches mix again after the pinch matches, unless mixing them at their different temperatures takes away
+    # heat sink the remaining hot duties need
+    mixed_hot, mixed_cold = _mix(hot), _mix(cold)
+    if min(_cascade_margin(mixed_hot, mixed_cold, dT_min)[1], default=0.0) >= -LOAD_TOLERANCE:
+        return mixed_hot, mixed_cold
+    return hot, cold
+
+
+def _pinch_pairs(hot, cold):
+    '''
+    Pairs every hot stream at the pinch with a cold stream of at least its CP. Hot streams are taken largest
+    CP first and each gets the smallest cold CP that fits, found by bisection in the sorted free cold CPs. A
+    hot stream no free cold stream can take is split against the largest one; when no cold stream is free
+    (number rule), a cold stream with CP to spare in an earlier pair is split.
+    :return: list of (hot branch, cold branch), list of the branches split off
+    '''
+    counter = itertools.count()
+    tol = LOAD_TOLERANCE * max([b.CP for b in hot + cold] + [1.0])
+    free_cold = sorted(cold, key=lambda b: b.CP)
+    free_CP = [b.CP for b in free_cold]
+    waiting = [(-h.CP, next(counter), h) for h in hot]
+    heapq.heapify(waiting)
+    spare = []
+    pairs = []
+    split_off = []
+
+    for _ in range(4 * (len(hot) + len(cold)) + 4):
+        if not waiting:
+            break
+        h = heapq.heappop(waiting)[2]
+        i = bisect.bisect_left(free_CP, h.CP - tol)
+        if i < len(free_cold):
+            c = free_cold.pop(i)
+            free_CP.pop(i)
+            pairs.append((h, c))
+            if c.CP - h.CP > tol:
+                heapq.heappush(spare, (h.CP - c.CP, next(counter), h, c))
+        elif free_cold:
+            c = free_cold.pop()
+            free_CP.pop()
+            branch = h.split(c.CP)
+            split_off.append(branch)
+            pairs.append((branch, c))
+            heapq.heappush(waiting, (-h.CP, next(counter), h))
+        elif spare:
+            _, _, paired_hot, c = heapq.heappop(spare)
+            branch = c.split(c.CP - paired_hot.CP)
+            split_off.append(branch)
+            i = bisect.bisect_left(free_CP, branch.CP)
+            free_cold.insert(i, branch)
+            free_CP.insert(i, branch.CP)
+            heapq.heappush(waiting, (-h.CP, next(counter), h))
+        else:
+            # Not enough cold CP at the pinch: the rest is left to the matches away from it
+            break
+    return pairs, split_off
+
+
+def _match_away_from_pinch(hot, cold, dT_min, matches, splits):
+    '''
+    Matches the remaining duties one at a time. Every load is checked against the cascade of the duties it
+    would leave, since a match can otherwise leave hot duty that no cold stream is hot enough to take. Each
+    match is, in order of preference:
+    - one that ticks off a stream, for the hot stream closest to the pinch that has one
+    - where the remaining duties pinch again (the margin is used up between their ends), none: the duties below
+      and above that temperature are designed as two pinch problems of their own
+    - one that ticks off a hot stream with a branch of a cold stream, or a cold stream with a branch of the hot
+      stream
+    - the largest load of any pair the remaining problem allows
+    Should none of these be possible, the rest is transferred vertically between the composite curves.
+    The margin is updated after every match rather than built again. It can only go down, so once a hot stream
+    has no tick-off, only the cold streams changed since can give it one.
+    '''
+    T, margin = _cascade_margin(hot, cold, dT_min)
+    # Hot segment without a tick-off -> cold segments changed since (in a dict, to keep them in order)
+    blocked = {}
+    # Segments left over by the designs below tight points
+    hot_left, cold_left = [], []
+    while True:
+        waiting = sorted((h for h in hot if h.load > LOAD_TOLERANCE), key=lambda b: b.start)
+        if not waiting:
+            break
+        for h in waiting:
+            option = _tick_off(h, list(blocked.pop(h)) if h in blocked else cold, T, margin, dT_min)
+            if option is not None:
+                c, Q, hot_top, cold_top = option
+                _match(h, c, Q, matches, hot_top, cold_top)
+                break
+            blocked[h] = {}
+        else:
+            if _decompose(hot, cold, T, margin, dT_min, matches, splits, hot_left, cold_left):
+                T, margin = _cascade_margin(hot, cold, dT_min)
+                blocked.clear()
+                continue
+            h, c = _branch_tick_off(waiting, hot, cold, T, margin, dT_min, matches, splits)
+            if h is None:
+                h, c = _partial_match(waiting, cold, T, margin, dT_min, matches)
+            if h is None:
+                # Round-off in the margin grows with the duties matched so far
+                if margin.min() >= -LOAD_TOLERANCE * max(1.0, sum(h.load for h in waiting)) and \
+                        any(c.load > LOAD_TOLERANCE for c in cold):
+                    _vertical_matches(hot, cold, matches, splits)
+                break
+
+        T, margin = _update_margin(T, margin, h, c, matches[-1], dT_min)
+        # A branch changes the CP of the segment it was split from too
+        changed = [b for b in cold if b.stream == c.stream]
+        for b in list(blocked):
+            if b.stream == h.stream:
+                del blocked[b]
+            else:
+                blocked[b].update(dict.fromkeys(changed))
+    hot.extend(hot_left)
+    cold.extend(cold_left)
+
+
+def _tick_off(h, cold, T, margin, dT_min):
+    '''
+    Best match of h that ticks off h or a cold stream and leaves a feasible remaining problem. Either stream
+    gives the bottom or the top portion of its segment, whichever keeps dT_min at both ends; matches that tick
+    off both streams come first, then those that waste the least temperature difference, then the largest.
+    :return: (cold segment, load, whether h gives its top, whether the cold stream gives its top), or None
+    '''
+    candidates = [c for c in cold if c.load > LOAD_TOLERANCE and c.start <= h.end - dT_min + LOAD_TOLERANCE]
+    if not candidates:
+        return None
+    c_start, c_end, c_CP = (np.array([getattr(c, name) for c in candidates]) for name in ('start', 'end', 'CP'))
+    Q = np.minimum(c_CP * (c_end - c_start), h.load)
+    # Placements (hot top, cold top) for every candidate: bottom/bottom, bottom/top, top/bottom, top/top
+    hot_top = np.repeat([False, False, True, True], len(candidates))
+    cold_top = np.tile(np.repeat([False, True], len(candidates)), 2)
+    k = np.tile(np.arange(len(candidates)), 4)
+    Q, c_CP = Q[k], c_CP[k]
+    h0 = np.where(hot_top, h.end - Q / h.CP, h.start)
+    c0 = np.where(cold_top, c_end[k] - Q / c_CP, c_start[k])
+    h1, c1 = h0 + Q / h.CP, c0 + Q / c_CP
+    valid = np.flatnonzero((h0 - c0 >= dT_min - LOAD_TOLERANCE) & (h1 - c1 >= dT_min - LOAD_TOLERANCE))
+    if len(valid) == 0:
+        return None
+
+    # The margin left is piecewise linear, so it is lowest where it bends: at T or at the ends of the match. The
+    # match only changes it between the start of the cold portion and the end of the hot one.
+    Q, c_CP, h0, h1, c0, c1 = (a[valid, None] for a in (Q, c_CP, h0, h1, c0, c1))
+    window = slice(np.searchsorted(T, c0.min() + dT_min / 2.0), np.searchsorted(T, h1.max() - dT_min / 2.0, 'right'))
+    ends = np.concatenate((c0 + dT_min / 2.0, c1 + dT_min / 2.0, h0 - dT_min / 2.0, h1 - dT_min / 2.0), axis=1)
+    x = np.concatenate((np.broadcast_to(T[window], (len(valid), len(T[window]))), ends), axis=1)
+    left = np.concatenate((np.broadcast_to(margin[window], (len(valid), len(T[window]))),
+                           np.interp(ends, T, margin)), axis=1) - \
+        np.clip(c_CP * (x - c0 - dT_min / 2.0), 0, Q) + np.clip(h.CP * (x - h0 + dT_min / 2.0), 0, Q)
+    Q, h0, h1, c0, c1 = (a[:, 0] for a in (Q, h0, h1, c0, c1))
+    feasible = left.min(axis=1) >= -LOAD_TOLERANCE
+    if not feasible.any():
+        return None
+
+    c_load = np.array([c.load for c in candidates])[k[valid]]
+    both = np.abs(c_load - h.load) <= LOAD_TOLERANCE
+    waste = (h0 - c0) + (h1 - c1)
+    order = np.lexsort((Q, -waste, both))
+    best = order[feasible[order]][-1]
+    return candidates[k[valid[best]]], float(Q[best]), bool(hot_top[valid[best]]), bool(cold_top[valid[best]])
+
+
+def _branch_tick_off(waiting, hot, cold, T, margin, dT_min, matches, splits):
+    '''
+    Ticks off the first waiting hot stream that a branch of a cold stream can take whole, or that can tick off
+    a cold stream with a branch of its own. Both streams give the bottom of their segments. A cold branch is
+    preferred the smaller it is, leaving most of its stream for later; a hot branch the larger it is, leaving
+    little of the hot stream behind.
+    :return: the hot and cold segments matched, or (None, None)
+    '''
+    for h in waiting:
+        candidates = [c for c in cold if c.load > LOAD_TOLERANCE and h.start - c.start >= dT_min - LOAD_TOLERANCE]
+        if not candidates:
+            continue
+        best = None
+        branch_CP = _branch_CPs(h, candidates, dT_min)
+        feasible = _feasible_loads(h, candidates, np.minimum(branch_CP, [c.CP for c in candidates]), T, margin,
+                                   dT_min)
+        for c, CP, load in zip(candidates, branch_CP, feasible):
+            if CP < c.CP - LOAD_TOLERANCE and load >= h.load - LOAD_TOLERANCE and \
+                    (best is None or -CP / c.CP > best[0]):
+                best = (-CP / c.CP, c, CP, True)
+        for c in candidates:
+            room = c.end + dT_min - h.start
+            if room <= 0 or c.load >= h.load:
+                continue
+            CP = min(h.CP, c.load / room)
+            if CP >= h.CP - LOAD_TOLERANCE or CP * (h.end - h.start) < c.load - LOAD_TOLERANCE:
+                continue
+            trial = _Branch(h.stream, CP, h.start, h.end)
+            if _feasible_loads(trial, [c], [c.CP], T, margin, dT_min)[0] >= c.load - LOAD_TOLERANCE and \
+                    (best is None or CP / h.CP - 1 > best[0]):
+                best = (CP / h.CP - 1, c, CP, False)
+        if best is None:
+            continue
+
+        _, c, CP, cold_branch = best
+        if cold_branch:
+            c = c.split(CP)
+            cold.append(c)
+            splits.append(c)
+            Q = h.load
+        else:
+            h = h.split(CP)
+            hot.append(h)
+            splits.append(h)
+            Q = c.load
+        _match(h, c, Q, matches)
+        return h, c
+    return None, None
+
+
+def _decompose(hot, cold, T, margin, dT_min, matches, splits, hot_left, cold_left):
+    '''
+    Where the margin is used up between the ends of the remaining hot duties, no heat can cross that shifted
+    temperature. The duties below it are designed as a pinch problem of their own (mirrored, like the
+    below-pinch side), adding what they leave over to hot_left and cold_left; those above it get the pinch
+    matches and replace the remaining segments.
+    :return: whether the remaining problem was decomposed
+    '''
+    hot_live = [h for h in hot if h.load > LOAD_TOLERANCE]
+    cold_live = [c for c in cold if c.load > LOAD_TOLERANCE]
+    lowest = min(h.start for h in hot_live) - dT_min / 2.0
+    highest = max(h.end for h in hot_live) - dT_min / 2.0
+    tight = T[(margin <= LOAD_TOLERANCE) & (T > lowest + LOAD_TOLERANCE) & (T < highest - LOAD_TOLERANCE)]
+    if len(tight) == 0:
+        return False
+
+    T_hot, T_cold = tight[0] + dT_min / 2.0, tight[0] - dT_min / 2.0
+    low_hot = [_Branch(c.stream, c.CP, -min(c.end, T_cold), -c.start) for c in cold_live
+               if c.start < T_cold - LOAD_TOLERANCE]
+    low_cold = [_Branch(h.stream, h.CP, -min(h.end, T_hot), -h.start) for h in hot_live
+                if h.start < T_hot - LOAD_TOLERANCE]
+    high_hot = [_Branch(h.stream, h.CP, max(h.start, T_hot), h.end) for h in hot_live
+                if h.end > T_hot + LOAD_TOLERANCE]
+    high_cold = [_Branch(c.stream, c.CP, max(c.start, T_cold), c.end) for c in cold_live
+                 if c.end > T_cold + LOAD_TOLERANCE]
+    low_matches, low_hot_left, low_cold_left, low_splits = _design_side(low_hot, low_cold, -T_cold, -T_hot, dT_min)
+    matches.extend((cold_stream, hot_stream, Q, -fc1, -fc0, -fh1, -fh0)
+                   for hot_stream, cold_stream, Q, fh0, fh1, fc0, fc1 in low_matches)
+    splits.extend(low_splits)
+    high_hot, high_cold = _pinch_matches(high_hot, high_cold, T_hot, T_cold, dT_min, matches, splits)
+
+    hot_left.extend(_Branch(b.stream, b.CP, -b.end, -b.start) for b in low_cold_left)
+    cold_left.extend(_Branch(b.stream, b.CP, -b.end, -b.start) for b in low_hot_left)
+    for b in hot + cold:
+        b.start = b.end
+    hot.extend(high_hot)
+    cold.extend(high_cold)
+    return True
+
+
+def _partial_match(waiting, cold, T, margin, dT_min, matches):
+    '''
+    Matches the first waiting hot stream that has one with the largest load any cold stream can take from it
+    at the bottom of both segments
+    :return: the hot and cold segments matched, or (None, None)
+    '''
+    for h in waiting:
+        candidates = [c for c in cold if c.load > LOAD_TOLERANCE and c.start <= h.start - dT_min + LOAD_TOLERANCE]
+        if not candidates:
+            continue
+        loads = np.minimum(_max_loads(h, candidates, dT_min),
+                           _feasible_loads(h, candidates, [c.CP for c in candidates], T, margin, dT_min))
+        best = int(np.argmax(loads))
+        if loads[best] > max(MIN_PARTIAL_LOAD, MIN_PARTIAL_SHARE * h.load):
+            _match(h, candidates[best], float(loads[best]), matches)
+            return h, candidates[best]
+    return None, None
+
+
+def _vertical_matches(hot, cold, matches, splits):
+    '''
+    Transfers all remaining hot duty vertically: with the hot and cold composite curves of the remaining
+    duties lined up at their pinch ends, each enthalpy interval's hot streams give their shares to its cold
+    streams, paired in order so an interval needs one match fewer than it has streams. The intervals keep
+    dT_min at both ends as long as the cascade margin is nowhere negative.
+    '''
+    hot = [h for h in hot if h.load > LOAD_TOLERANCE]
+    cold = [c for c in cold if c.load > LOAD_TOLERANCE]
+    hot_T, hot_E = _composite(hot)
+    cold_T, cold_E = _composite(cold)
+    levels = np.unique(np.concatenate((hot_E, cold_E[cold_E < hot_E[-1]])))
+    # Where a composite curve has a gap (no segment, so its load stays the same), an interval ends at the bottom
+    # of the gap and the next one starts at its top
+    hot_top, hot_bottom = _composite_temperatures(levels, hot_T, hot_E)
+    cold_top, cold_bottom = _composite_temperatures(levels, cold_T, cold_E)
+
+    ongoing = {}
+    for x0, x1, y0, y1 in zip(hot_top[:-1], hot_bottom[1:], cold_top[:-1], cold_bottom[1:]):
+        givers = [h for h in hot if h.start <= x0 + LOAD_TOLERANCE and h.end >= x1 - LOAD_TOLERANCE]
+        takers = [c for c in cold if c.start <= y0 + LOAD_TOLERANCE and c.end >= y1 - LOAD_TOLERANCE]
+        give = [h.CP * (x1 - x0) for h in givers]
+        take = [c.CP * (y1 - y0) for c in takers]
+        partners = set()
+        continued = {}
+        i = j = 0
+        while i < len(givers) and j < len(takers):
+            Q = min(give[i], take[j])
+            pair = (id(givers[i]), id(takers[j]))
+            if Q > LOAD_TOLERANCE and pair in ongoing:
+                # The pair was matched in the interval below as well: the same exchanger carries on
+                k = ongoing[pair]
+                h_stream, c_stream, load, h0, _, c0, _ = matches[k]
+                matches[k] = (h_stream, c_stream, load + Q, h0, x1, c0, y1)
+                continued[pair] = k
+            elif Q > LOAD_TOLERANCE:
+                continued[pair] = len(matches)
+                matches.append((givers[i].stream, takers[j].stream, Q, x0, x1, y0, y1))
+                # Every partner after a stream's first one takes another branch of it
+                for b, CP in ((givers[i], Q / (x1 - x0)), (takers[j], Q / (y1 - y0))):
+                    if id(b) in partners:
+                        splits.append(_Branch(b.stream, CP, x0, x1))
+                    partners.add(id(b))
+            partners.update(pair)
+            give[i] -= Q
+            take[j] -= Q
+            i += give[i] <= LOAD_TOLERANCE
+            j += take[j] <= LOAD_TOLERANCE
+        ongoing = continued
+
+    for h in hot:
+        h.start = h.end
+    for c in cold:
+        c.start = min(max(cold_bottom[-1], c.start), c.end)
+
+
+def _composite(segments):
+    '''Temperatures where the composite curve of a set of segments bends, and its load below each of them'''
+    start = np.array([b.start for b in segments])
+    end = np.array([b.end for b in segments])
+    T = np.unique(np.concatenate((start, end)))
+    return T, np.clip(T[:, None] - start, 0, end - start) @ np.array([b.CP for b in segments])
+
+
+def _composite_temperatures(levels, T, E):
+    '''Highest and lowest temperature of a composite curve at each of the given loads'''
+    return np.interp(levels, E, T), -np.interp(-levels, -E[::-1], -T[::-1])
+
+
+def _cascade_margin(hot, cold, dT_min):
+    '''
+    Heat the cold segments can still take below each shifted temperature, less the heat the hot segments
+    still have to give below it. The remaining duties need no utility on the wrong side of the pinch as long
+    as the margin is nowhere negative.
+    :return: shifted temperatures where the margin bends, margin at each of them
+    '''
+    h_start, h_end, h_CP = (np.array([getattr(b, name) for b in hot]) for name in ('start', 'end', 'CP'))
+    c_start, c_end, c_CP = (np.array([getattr(b, name) for b in cold]) for name in ('start', 'end', 'CP'))
+    T = np.unique(np.concatenate((h_start - dT_min / 2.0, h_end - dT_min / 2.0,
+                                  c_start + dT_min / 2.0, c_end + dT_min / 2.0)))
+    hot_below = np.clip(T[:, None] + dT_min / 2.0 - h_start, 0, np.maximum(h_end - h_start, 0)) @ h_CP
+    cold_below = np.clip(T[:, None] - dT_min / 2.0 - c_start, 0, np.maximum(c_end - c_start, 0)) @ c_CP
+    return T, cold_below - hot_below
+
+
+def _feasible_loads(h, candidates, CP, T, margin, dT_min):
+    '''
+    Largest load h can exchange with (a branch of the given CP of) each candidate cold stream while the
+    duties left afterwards keep a non-negative cascade margin. Below a shifted temperature the match takes
+    the candidate's heat sink a(T) and the hot duty b(T), so a load Q is feasible where
+    min(a, Q) - min(b, Q) <= margin everywhere: the bound is b + margin wherever a exceeds it.
+    '''
+    c_start = np.array([c.start for c in candidates])[:, None]
+    c_end = np.array([c.end for c in candidates])[:, None]
+    CP = np.asarray(CP, dtype=float)[:, None]
+    sink = np.clip(CP * (T - dT_min / 2.0 - c_start), 0, CP * (c_end - c_start))
+    limit = np.clip(h.CP * (T + dT_min / 2.0 - h.start), 0, h.load) + np.maximum(margin, 0)
+    excess = sink - limit
+    binding = excess > LOAD_TOLERANCE
+    bound = np.where(binding, limit, np.inf).min(axis=1)
+
+    # Between two temperatures everything is linear, so where the excess changes sign the bound is met there
+    crosses = binding[:, :-1] != binding[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = excess[:, :-1] / (excess[:, :-1] - excess[:, 1:])
+        at_crossing = limit[:-1] + fraction * (limit[1:] - limit[:-1])
+    return np.minimum(bound, np.where(crosses, at_crossing, np.inf).min(axis=1, initial=np.inf))
+
+
+def _branch_CPs(h, candidates, dT_min):
+    '''
+    Smallest CP of a branch of each candidate cold stream that takes the whole remaining load of h, keeping
+    dT_min at the far end and staying within the cold stream's range (inf where there is none)
+    '''
+    c_start = np.array([c.start for c in candidates])
+    c_end = np.array([c.end for c in candidates])
+    room = np.minimum(h.end - c_start - dT_min, c_end - c_start)
+    with np.errstate(divide='ignore'):
+        return np.where(room > 0, h.load / np.where(room > 0, room, 1), np.inf)
+
+
+def _max_load(h, c, dT_min):
+    return float(_max_loads(h, [c], dT_min)[0])
+
+
+def _max_loads(h, candidates, dT_min):
+    '''
+    Largest load each candidate cold stream can exchange with h at its pinch end while both ends of the
+    exchanger keep at least dT_min: min(hot load, cold load, load at which the far end reaches dT_min)
+    '''
+    c_start = np.array([c.start for c in candidates])
+    c_CP = np.array([c.CP for c in candidates])
+    c_load = np.array([c.load for c in candidates])
+    slack = h.start - c_start - dT_min
+    closing = 1 / c_CP - 1 / h.CP
+    with np.errstate(divide='ignore', invalid='ignore'):
+        limit = np.where(closing > 0, np.maximum(slack, 0) / closing, np.inf)
+    return np.where(slack >= -LOAD_TOLERANCE, np.minimum(np.minimum(c_load, h.load), limit), 0.0)
+
+
+def _match(h, c, Q, matches, hot_top=False, cold_top=False):
+    '''Matches a load Q between h and c, taken from the start of each segment or, for a top, from its end'''
+    h0, h1 = (h.end - Q / h.CP, h.end) if hot_top else (h.start, h.start + Q / h.CP)
+    c0, c1 = (c.end - Q / c.CP, c.end) if cold_top else (c.start, c.start + Q / c.CP)
+    matches.append((h.stream, c.stream, Q, h0, h1, c0, c1))
+    for b, top, b0, b1 in ((h, hot_top, h0, h1), (c, cold_top, c0, c1)):
+        if b.load - Q <= LOAD_TOLERANCE:
+            b.start = b.end
+        elif top:
+            b.end = b0
+        else:
+            b.start = b1
+
+
+def _update_margin(T, margin, h, c, match, dT_min):
+    '''
+    Cascade margin after a match: below each shifted temperature it takes the heat sink of the cold segment c
+    and the duty of the hot segment h, both ramping up to the load across the ends of the match
+    :return: shifted temperatures where the margin bends, margin at each of them
+    '''
+    _, _, Q, h0, h1, c0, c1 = match
+    new_T = np.union1d(T, [c0 + dT_min / 2.0, c1 + dT_min / 2.0, h0 - dT_min / 2.0, h1 - dT_min / 2.0])
+    return new_T, (np.interp(new_T, T, margin) - np.clip(c.CP * (new_T - c0 - dT_min / 2.0), 0, Q) +
+                   np.clip(h.CP * (new_T - h0 + dT_min / 2.0), 0, Q))
+
+
+def _mix(segments):
+    '''
+    One segment per stream and temperature range. Branches of a stream that end together or overlap mix at the
+    CP-weighted mean of their starts and ends; a portion of the same CP that carries on where another one ends
+    joins it.
+    '''
+    mixed = []
+    for b in sorted(segments, key=lambda b: (b.stream, b.start)):
+        last = mixed[-1] if mixed and mixed[-1].stream == b.stream else None
+        if last is not None and (abs(b.end - last.end) <= LOAD_TOLERANCE or b.start < last.end - LOAD_TOLERANCE):
+            CP = last.CP + b.CP
+            mixed[-1] = _Branch(b.stream, CP, (last.CP * last.start + b.CP * b.start) / CP,
+                                (last.CP * last.end + b.CP * b.end) / CP)
+        elif last is not None and abs(b.start - last.end) <= LOAD_TOLERANCE and \
+                abs(b.CP - last.CP) <= LOAD_TOLERANCE * b.CP:
+            mixed[-1] = _Branch(b.stream, b.CP, last.start, b.end)
+        else:
+            mixed.append(b)
+    return mixed
+
+
+def _utility_exchanger(side, actual_hot, label, Q, T_in, T_out, h, hot_utility_stream, cold_utility_stream):
+    if actual_hot:
+        utility = cold_utility_stream.fit(Q)
+        return Exchanger(Exchanger.KIND_COOLER, side, label, 'CU', Q, T_in, T_out, utility.T_s, utility.T_t, h,
+                         utility.h)
+    utility = hot_utility_stream.fit(Q)
+    return Exchanger(Exchanger.KIND_HEATER, side, 'HU', label, Q, utility.T_s, utility.T_t, T_in, T_out, utility.h,
+                     h)
@@ -1,68 +1,161 @@
-from stream import StreamManager
-from heat_cascade import HeatCascade
+import numpy as np
+
+from stream import StreamManager, film_contributions
+from heat_cascade import HeatCascade, dtmin_targets, parametric_targets, threshold_dtmin
 from composite_curve import CompositeCurve
 from balanced_composite_curve import BalancedCompositeCurve
-from helper_functions import get_intervals
+from grand_composite_curve import GrandCompositeCurve, utility_levels
+from network_design import design_network
+from cost_model import CostModel
+from helper_functions import get_intervals, brent_minimise, capital_recovery_factor
+from result_cache import fingerprint, stream_fingerprint
+from instrumentation import NULL_INSTRUMENTATION
 
 
 class PinchAnalyser:
-    def __init__(self, streams):
+    def __init__(self, streams, cache=None, instrumentation=None, contributions_from_h=False, cost_model=None):
+        '''
+        :param streams: StreamTable or list of streams/[T_s, T_t, CP, (h, (dT_cont))] rows
+        :param cache: ResultCache shared by analyses that should reuse each other's results (optional)
+        :param instrumentation: Instrumentation receiving stage timings and counts (optional)
+        :param contributions_from_h: streams without their own dT_cont contribute to the approach temperature
+                                     in proportion to 1/h (see film_contributions) instead of dTmin/2 each
+        :param cost_model: CostModel for capital costs and their annualisation (optional, plain fixed head units)
+        '''
         self.streamManager = StreamManager(streams)
         self.streams = self.streamManager.get_streams()
+        self.contributions_from_h = contributions_from_h
+        self.cost_model = cost_model if cost_model is not None else CostModel()
+        self.cache = cache
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self.dT_min = None
         self.T_pinch = None
         self.T_pinch_actual = None
         self.composite_curve = None
         self.balanced_composite_curve = None
+        self.grand_composite_curve = None
+        self.network = None
         self.heat_cascade = None
+        self._stream_fingerprint = None
 
     def problem_table_analysis(self, dT_min=5, verbose=True):
-        shifted_streams = self._shifted_temp_streams(self.streams, dT_min)
-        shifted_intervals = get_intervals(shifted_streams)
+        with self.instrumentation.stage('problem_table_analysis', dT_min=dT_min):
+            key = self._cache_key('problem_table', dT_min)
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                self.heat_cascade = cached
+            else:
+                shifted_streams = self._shifted_temp_streams(self.streams, dT_min)
+                shifted_intervals = get_intervals(shifted_streams)
+                self.heat_cascade = HeatCascade(shifted_streams, shifted_intervals)
+                if self.cache is not None:
+                    self.cache.put(key, self.heat_cascade)
+
+        if self.instrumentation.enabled:
+            self.instrumentation.count('streams', len(self.streams))
+            self.instrumentation.count('intervals', len(self.heat_cascade.dT))
+            self.instrumentation.count('cache_hit', cached is not None)
 
-        self.heat_cascade = HeatCascade(shifted_streams, shifted_intervals)
         if verbose:
             self.heat_cascade.print_table()
 
-        self.T_pinch, self.hot_utility, self.cold_utility = self.heat_cascade.get_results()
-        self.T_pinch_actual = (self.T_pinch + dT_min/2, self.T_pinch - dT_min/2)
+        self._set_cascade_results(dT_min)
+
+    def classify(self, dT_min=5):
+        '''
+        Classifies the problem from its problem table, so threshold problems can be routed away from the
+        pinch based area, cost and network steps before they are run
+        :param dT_min: minimum approach temperature
+        :return: dict with keys problem_type ('pinched' or 'threshold'), zero_utility ('hot', 'cold', 'both'
+                 or None), pinch_points (shifted, hottest first), T_pinch, hot_utility, cold_utility and
+                 threshold_dT_min (None when the problem has no threshold, or when the streams do not all
+                 contribute dTmin/2 and the targets do not scale with dTmin alone)
+        '''
+        self.problem_table_analysis(dT_min, verbose=False)
+        threshold = None
+        if self._uniform_contributions():
+            with self.instrumentation.stage('threshold_dtmin'):
+                threshold = threshold_dtmin(self.streams.T_s, self.streams.T_t, self.streams.CP, self.streams.is_hot)
+        return {
+            'problem_type': self.heat_cascade.problem_type,
+            'zero_utility': self.heat_cascade.zero_utility,
+            'pinch_points': self.heat_cascade.pinch_points,
+            'T_pinch': self.T_pinch,
+            'hot_utility': self.hot_utility,
+            'cold_utility': self.cold_utility,
+            'threshold_dT_min': threshold
+        }
 
     def get_composite_curve(self, dT_min=None, plot=True):
         if dT_min is not None:
             self.problem_table_analysis(dT_min=dT_min, verbose=False)
 
-        if self.T_pinch is None:
+        if self.heat_cascade is None:
             print(
                 'Pinch analysis has not been carried out yet! Composite curves will be drawn using default dTmin=5degC')
             self.problem_table_analysis(verbose=False)
 
-        self.composite_curve = CompositeCurve(
-            self.streamManager.get_hot_streams(),
-            self.streamManager.get_cold_streams(),
-            get_intervals(self.streamManager.get_hot_streams()),
-            get_intervals(self.streamManager.get_cold_streams()),
-            self.hot_utility,
-            self.cold_utility,
-            self.T_pinch
-        )
+        streams = self._process_streams(self.dT_min)
+        with self.instrumentation.stage('get_composite_curve'):
+            self.composite_curve = CompositeCurve(
+                streams.hot(),
+                streams.cold(),
+                get_intervals(streams.hot()),
+                get_intervals(streams.cold()),
+                self.hot_utility,
+                self.cold_utility,
+                self.T_pinch,
+                self.dT_min
+            )
 
         if plot:
             self.composite_curve.plot()
 
+    def get_grand_composite_curve(self, dT_min=5, utility_streams=(), plot=True):
+        '''
+        Builds the grand composite curve from the problem table
+        :param dT_min: minimum approach temperature
+        :param utility_streams: Utility levels to add as cascade boundaries, so loads can be placed on them
+        :param plot: plot the curve
+        :return: GrandCompositeCurve
+        '''
+        shifted_streams = self._shifted_temp_streams(self.streams, dT_min)
+        intervals = np.union1d(get_intervals(shifted_streams), utility_levels(utility_streams, dT_min))[::-1]
+        self.grand_composite_curve = GrandCompositeCurve(HeatCascade(shifted_streams, intervals), dT_min)
+
+        if plot:
+            self.grand_composite_curve.plot()
+        return self.grand_composite_curve
+
     def get_balanced_composite_curve(self, hot_utility_stream, cold_utility_stream, dT_min=5, verbose=True):
-        '''Only functional for single HU and CU'''
+        '''
+        Builds the balanced composite curve with the utilities fitted to their targets. Lists of hot and/or
+        cold Utility are placed on the grand composite curve first (see GrandCompositeCurve.place_utilities)
+        and every utility with a load enters the curve.
+        '''
         if self.T_pinch is None:
             self.get_composite_curve(dT_min=dT_min, plot=False)
 
-        self.balanced_composite_curve = BalancedCompositeCurve(
-            self.streamManager.get_hot_streams(),
-            self.streamManager.get_cold_streams(),
-            self.hot_utility,
-            self.cold_utility,
-            hot_utility_stream,
-            cold_utility_stream,
-            self.T_pinch,
-            dT_min
-        )
+        hot_utility, cold_utility = self.hot_utility, self.cold_utility
+        if isinstance(hot_utility_stream, (list, tuple)) or isinstance(cold_utility_stream, (list, tuple)):
+            hot_utility_stream = _as_list(hot_utility_stream)
+            cold_utility_stream = _as_list(cold_utility_stream)
+            with self.instrumentation.stage('place_utilities', dT_min=dT_min):
+                gcc = self.get_grand_composite_curve(dT_min, hot_utility_stream + cold_utility_stream, plot=False)
+                hot_utility, cold_utility = gcc.place_utilities(hot_utility_stream, cold_utility_stream)
+
+        streams = self._process_streams(dT_min)
+        with self.instrumentation.stage('get_balanced_composite_curve', dT_min=dT_min):
+            self.balanced_composite_curve = BalancedCompositeCurve(
+                streams.hot(),
+                streams.cold(),
+                hot_utility,
+                cold_utility,
+                hot_utility_stream,
+                cold_utility_stream,
+                self.T_pinch,
+                dT_min
+            )
 
         if verbose:
             self.balanced_composite_curve.plot()
@@ -71,12 +164,286 @@ class PinchAnalyser:
         print(self.balanced_composite_curve.get_area_target())
 
     def get_area_target(self, hot_utility_stream, cold_utility_stream, dT_min=5, verbose=True):
-        self.problem_table_analysis(dT_min, verbose=False)
-        self.get_balanced_composite_curve(hot_utility_stream, cold_utility_stream, verbose=verbose)
+        '''
+        Bath formula area target from the balanced composite curve
+        :param hot_utility_stream: hot Utility, or list of hot Utility levels
+        :param cold_utility_stream: cold Utility, or list of cold Utility levels
+        :param dT_min: minimum approach temperature
+        :param verbose: print the BCC segments and plot the curve
+        :return: total area
+        '''
+        with self.instrumentation.stage('get_area_target', dT_min=dT_min):
+            area = self._get_area_target(hot_utility_stream, cold_utility_stream, dT_min, verbose)
+
+        if self.instrumentation.enabled:
+            streams_per_segment = self.balanced_composite_curve.get_segment_stream_counts()
+            self.instrumentation.count('bcc_segments', len(streams_per_segment))
+            self.instrumentation.count('streams_per_segment', float(streams_per_segment.mean()),
+                                       max=int(streams_per_segment.max()))
+        return area
+
+    def get_network_design(self, hot_utility_stream, cold_utility_stream, dT_min=5, verbose=True):
+        '''
+        Maximum energy recovery network by the pinch design method (see network_design), designed from the
+        pinch of this analysis, with the area target computed alongside for comparison
+        :param hot_utility_stream: hot Utility used by the heaters
+        :param cold_utility_stream: cold Utility used by the coolers
+        :param dT_min: minimum approach temperature
+        :param verbose: print the network and its comparison with the BCC targets
+        :return: HeatExchangerNetwork
+        '''
+        self.get_area_target(hot_utility_stream, cold_utility_stream, dT_min, verbose=False)
+        with self.instrumentation.stage('design_network', dT_min=dT_min):
+            self.network = design_network(self.streams, self.T_pinch, dT_min, hot_utility_stream,
+                                          cold_utility_stream, self.hot_utility)
+
+        if self.instrumentation.enabled:
+            self.instrumentation.count('exchangers', self.network.get_exchanger_count())
+            self.instrumentation.count('stream_splits', len(self.network.splits))
+        if verbose:
+            self.network.print_report(self.balanced_composite_curve)
+        return self.network
+
+    def sweep_dtmin(self, dT_min_values, hot_utility_stream, cold_utility_stream):
+        '''
+        Evaluates pinch, utility, area and cost targets over a range of dTmin values. Utility targets
+        for all points come from one vectorized pass over the unshifted streams, and the process
+        composite curves are shared by every point since only the fitted utility streams change.
+        :param dT_min_values: dTmin values to evaluate (iterable)
+        :param hot_utility_stream: hot Utility
+        :param cold_utility_stream: cold Utility
+        :return: dict of arrays with keys dT_min, T_pinch, hot_utility, cold_utility, area, cost
+        '''
+        dT_min_values = np.asarray(list(dT_min_values), dtype=float)
+        if self._uniform_contributions():
+            T_pinch, hot_utility, cold_utility = dtmin_targets(
+                self.streams.T_s, self.streams.T_t, self.streams.CP, self.streams.is_hot, dT_min_values)
+        else:
+            # Streams shift by different amounts, so every point needs its own interval list
+            targets = []
+            for dT_min in dT_min_values:
+                shifted_streams = self._shifted_temp_streams(self.streams, dT_min)
+                targets.append(HeatCascade(shifted_streams, get_intervals(shifted_streams)).get_results())
+            T_pinch, hot_utility, cold_utility = (np.array(column, dtype=float) for column in zip(*targets))
+
+        area = np.empty(len(dT_min_values))
+        cost_area = np.empty(len(dT_min_values))
+        units = np.empty(len(dT_min_values))
+        for i, dT_min in enumerate(dT_min_values):
+            streams = self._process_streams(dT_min)
+            bcc = BalancedCompositeCurve(
+                streams.hot(),
+                streams.cold(),
+                hot_utility[i],
+                cold_utility[i],
+                hot_utility_stream,
+                cold_utility_stream,
+                T_pinch[i] if np.isfinite(T_pinch[i]) else None,  # Threshold points have no pinch
+                dT_min
+            )
+            area[i] = bcc.get_area_target(verbose=False)
+            cost_area[i], units[i] = self.cost_model.bcc_targets(bcc)
+        # Every point is priced in one call
+        cost = self.cost_model.capital_cost(cost_area, units)
+
+        return {
+            'dT_min': dT_min_values,
+            'T_pinch': T_pinch,
+            'hot_utility': hot_utility,
+            'cold_utility': cold_utility,
+            'area': area,
+            'cost': cost
+        }
+
+    def get_parametric_targets(self, dT_min_bounds=(5, 50)):
+        '''
+        Exact pinch and utility targets as piecewise linear functions of dTmin, so any dTmin within the
+        bounds can be looked up without another problem table analysis, e.g.
+        T_pinch, hot_utility, cold_utility = analyser.get_parametric_targets((5, 50))(12.5)
+        :param dT_min_bounds: (lowest, highest) dTmin covered
+        :return: ParametricTargets
+        '''
+        if not self._uniform_contributions():
+            raise ValueError("Parametric targets need every stream to contribute dTmin/2 to the approach")
+        with self.instrumentation.stage('parametric_targets'):
+            return parametric_targets(self.streams.T_s, self.streams.T_t, self.streams.CP, self.streams.is_hot,
+                                      *dT_min_bounds)
 
-        return self.balanced_composite_curve.get_area_target(verbose=verbose)
+    def optimise_dtmin(self, hot_utility_stream, cold_utility_stream, hot_utility_price, cold_utility_price,
+                       dT_min_bounds=(5, 50), interest_rate=None, years=None, coarse_points=5, tol=0.01):
+        '''
+        Supertargeting: finds the dTmin with the lowest total annual cost, i.e. utility cost plus the
+        annualised capital cost of the area target. Only the capital cost needs a balanced composite curve.
+        The utility cost is known exactly at every breakpoint from the parametric targets, and the capital
+        cost is smooth except where the pinch moves and the unit target changes, so it is evaluated at
+        coarse_points evenly spaced dTmin values and at both ends of every stretch with the same pinch, and
+        interpolated within each stretch. The lowest estimate is evaluated and the estimate updated until it
+        settles; Brent's method then refines the optimum between the evaluated points around it.
+        :param hot_utility_stream: hot Utility
+        :param cold_utility_stream: cold Utility
+        :param hot_utility_price: annual cost per unit of hot utility load
+        :param cold_utility_price: annual cost per unit of cold utility load
+        :param dT_min_bounds: (lowest, highest) dTmin considered
+        :param interest_rate: interest rate used to annualise the capital cost (default: the cost model's)
+        :param years: plant life used to annualise the capital cost (default: the cost model's)
+        :param coarse_points: number of evenly spaced dTmin values the capital cost is first evaluated at
+        :param tol: absolute tolerance on the optimal dTmin
+        :return: dict with keys dT_min, total_annual_cost, utility_cost, capital_cost, T_pinch, hot_utility,
+                 cold_utility, area and evaluations
+        '''
+        low, high = dT_min_bounds
+        if not 0 < low < high:
+            raise ValueError("dT_min_bounds must satisfy 0 < lowest < highest, got {}".format(dT_min_bounds))
+        if coarse_points < 2:
+            raise ValueError("coarse_points must be at least 2, got {}".format(coarse_points))
+        annualisation = capital_recovery_factor(
+            self.cost_model.interest_rate if interest_rate is None else interest_rate,
+            self.cost_model.years if years is None else years)
+
+        def annual_costs(sweep):
+            utility_cost = sweep['hot_utility'] * hot_utility_price + sweep['cold_utility'] * cold_utility_price
+            capital_cost = sweep['cost'] * annualisation
+            return utility_cost, capital_cost
+
+        evaluations = {}
+
+        def evaluate(dT_min_values):
+            sweep = self.sweep_dtmin(dT_min_values, hot_utility_stream, cold_utility_stream)
+            for i, dT_min in enumerate(sweep['dT_min']):
+                evaluations[float(dT_min)] = (sweep, i)
+
+        def total_annual_cost(dT_min):
+            if float(dT_min) not in evaluations:
+                evaluate([dT_min])
+            sweep, i = evaluations[float(dT_min)]
+            utility_cost, capital_cost = annual_costs(sweep)
+            cost = utility_cost[i] + capital_cost[i]
+            return np.inf if np.isnan(cost) else float(cost)
+
+        coarse = np.linspace(low, high, coarse_points)
+        if not self._uniform_contributions():
+            # Without parametric targets the utility cost is only known where the capital cost is evaluated, so
+            # the coarse points alone bracket the optimum
+            evaluate(coarse)
+            pinch_changes = np.empty(0)
+        else:
+            targets = self.get_parametric_targets(dT_min_bounds)
+            pinch_changes = targets.pinch_changes
+            utility_cost = targets.hot_utility * hot_utility_price + targets.cold_utility * cold_utility_price
+            edges = np.concatenate(([low], pinch_changes, [high]))
+            # Just inside both ends of every stretch, so the interpolation never crosses a change of the pinch
+            inside = np.minimum(tol, np.diff(edges) / 2.0)
+            evaluate(np.unique(np.concatenate((coarse, edges[1:-1] - inside[:-1], edges[1:-1] + inside[1:]))))
+
+            # Breakpoints where the pinch changes belong to neither stretch; the points next to them stand in
+            candidates = np.setdiff1d(targets.dT_min, pinch_changes)
+            stretch = np.searchsorted(pinch_changes, candidates, side='right')
+            for _ in range(coarse_points):
+                points = np.array(sorted(evaluations))
+                capital_cost = np.array([annual_costs(sweep)[1][i] for sweep, i in map(evaluations.get, points)])
+                point_stretch = np.searchsorted(pinch_changes, points, side='right')
+                estimate = np.full(len(candidates), np.inf)
+                for k in np.unique(stretch):
+                    known = (point_stretch == k) & np.isfinite(capital_cost)
+                    if known.any():
+                        estimate[stretch == k] = np.interp(candidates[stretch == k], points[known],
+                                                           capital_cost[known])
+                estimate += np.interp(candidates, targets.dT_min, utility_cost)
+                guess = float(candidates[int(np.argmin(estimate))])
+                if not np.isfinite(estimate.min()) or guess in evaluations:
+                    break
+                evaluate([guess])
+
+        # The optimum lies between the best evaluated point and one of its neighbours. When the pinch changes
+        # next to it, the capital cost jumps there and the other side is the neighbouring stretch instead.
+        points = np.array(sorted(evaluations))
+        cost = np.array([total_annual_cost(x) for x in points])
+        stretch = np.searchsorted(pinch_changes, points, side='right')
+        best = int(np.argmin(cost))
+        dT_min, lowest = float(points[best]), cost[best]
+        for step in (-1, 1):
+            near, far = best + step, best + 2 * step
+            if 0 <= near < len(points) and stretch[near] == stretch[best]:
+                lower, upper = sorted((points[best], points[near]))
+            elif 0 <= far < len(points) and stretch[far] == stretch[near]:
+                lower, upper = sorted((points[near], points[far]))
+            else:
+                continue
+            if upper - lower > tol:
+                x, f = brent_minimise(total_annual_cost, lower, upper, tol=tol)
+                if f < lowest:
+                    dT_min, lowest = float(x), f
+
+        sweep, i = evaluations[dT_min]
+        utility_cost, capital_cost = annual_costs(sweep)
+        return {
+            'dT_min': dT_min,
+            'total_annual_cost': float(utility_cost[i] + capital_cost[i]),
+            'utility_cost': float(utility_cost[i]),
+            'capital_cost': float(capital_cost[i]),
+            'T_pinch': float(sweep['T_pinch'][i]),
+            'hot_utility': float(sweep['hot_utility'][i]),
+            'cold_utility': float(sweep['cold_utility'][i]),
+            'area': float(sweep['area'][i]),
+            'evaluations': len(evaluations)
+        }
 
     # Private methods
+    def _get_area_target(self, hot_utility_stream, cold_utility_stream, dT_min, verbose):
+        key = self._cache_key('area_target', dT_min, hot_utility_stream, cold_utility_stream)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            self.heat_cascade, self.balanced_composite_curve, area = cached
+            self._set_cascade_results(dT_min)
+            if verbose:
+                self.balanced_composite_curve.print_report()
+                self.balanced_composite_curve.plot_from_heat_intervals()
+            return area
+
+        self.problem_table_analysis(dT_min, verbose=False)
+        self.get_balanced_composite_curve(hot_utility_stream, cold_utility_stream, dT_min=dT_min, verbose=verbose)
+
+        with self.instrumentation.stage('bcc_area'):
+            area = self.balanced_composite_curve.get_area_target(verbose=verbose)
+        if self.cache is not None:
+            self.cache.put(key, (self.heat_cascade, self.balanced_composite_curve, area))
+        return area
+
+    def _set_cascade_results(self, dT_min):
+        self.dT_min = dT_min
+        self.T_pinch, self.hot_utility, self.cold_utility = self.heat_cascade.get_results()
+        if self.T_pinch is None:
+            self.T_pinch_actual = None
+        else:
+            self.T_pinch_actual = (self.T_pinch + dT_min/2, self.T_pinch - dT_min/2)
+
+    def _cache_key(self, *args):
+        if self.cache is None:
+            return None
+        if self._stream_fingerprint is None:
+            self._stream_fingerprint = stream_fingerprint(self.streams)
+            if self.contributions_from_h:
+                self._stream_fingerprint = fingerprint(self.streams, 'contributions_from_h',
+                                                       stream_key=self._stream_fingerprint)
+        return fingerprint(self.streams, *args, stream_key=self._stream_fingerprint)
+
     def _shifted_temp_streams(self, streams, dt_min):
-        dt = dt_min / 2.0
-        return [s.shift(dt) for s in streams]
+        return streams.shifted(self._contributions(streams, dt_min))
+
+    def _contributions(self, streams, dT_min):
+        default = film_contributions(streams.h, dT_min) if self.contributions_from_h else None
+        return streams.contributions(dT_min, default)
+
+    def _uniform_contributions(self):
+        return not self.contributions_from_h and np.all(np.isnan(self.streams.dT_cont))
+
+    def _process_streams(self, dT_min):
+        '''Streams with their approach temperature contributions at dT_min filled in'''
+        if self._uniform_contributions():
+            return self.streams
+        return self.streams.with_contributions(self._contributions(self.streams, dT_min))
+
+
+# Private methods
+def _as_list(utility_streams):
+    return list(utility_streams) if isinstance(utility_streams, (list, tuple)) else [utility_streams]
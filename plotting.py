@@ -0,0 +1,70 @@
+'''
+Figure rendering for the analysis objects. matplotlib is only imported when a figure is actually drawn,
+and figures written to a file are rendered on an Agg canvas without going through pyplot, so headless
+workers never select an interactive backend.
+'''
+import numpy as np
+
+FIGSIZE = (8, 4.5)
+
+
+def plot_composite_curve(composite_curve, filename=None):
+    '''
+    Plots the hot and cold composite curves
+    :param composite_curve: CompositeCurve (or BalancedCompositeCurve)
+    :param filename: write the figure to this file instead of showing it (optional)
+    '''
+    cc = composite_curve
+    _render([(cc.hot_Q, cc.hot_temperatures, 'r-'),
+             (cc.cold_Q + cc.cold_utility, cc.cold_temperatures, 'b-')], filename)
+
+
+def plot_balanced_composite_curve(bcc, filename=None):
+    '''
+    Plots the balanced composite curve from its heat load segments
+    :param bcc: BalancedCompositeCurve with heat intervals computed
+    :param filename: write the figure to this file instead of showing it (optional)
+    '''
+    heats = np.repeat(bcc.q_intervals, 2)[1:-1]
+    temps_h = np.column_stack((bcc.T_h_start, bcc.T_h_end)).ravel()
+    temps_c = np.column_stack((bcc.T_c_start, bcc.T_c_end)).ravel()
+    _render([(heats, temps_h, 'r'), (heats, temps_c, 'b')], filename)
+
+
+def plot_grand_composite_curve(gcc, filename=None):
+    '''
+    Plots the grand composite curve: net heat flow against shifted temperature
+    :param gcc: GrandCompositeCurve
+    :param filename: write the figure to this file instead of showing it (optional)
+    '''
+    _render([(gcc.heat, gcc.temperatures, 'k-')], filename)
+
+
+def plot_series(x, y, filename=None):
+    '''
+    Plots a single line, e.g. total cost against dTmin
+    :param filename: write the figure to this file instead of showing it (optional)
+    '''
+    _render([(x, y, '-')], filename)
+
+
+# Private methods
+def _render(lines, filename):
+    if filename is not None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        figure = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        for x, y, fmt in lines:
+            axes.plot(x, y, fmt)
+        figure.savefig(filename)
+        return
+
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=FIGSIZE)
+    for x, y, fmt in lines:
+        plt.plot(x, y, fmt)
+    plt.show()
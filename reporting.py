@@ -0,0 +1,37 @@
+'''
+Tabular text reports, formatted directly from the result columns.
+'''
+import numpy as np
+
+
+def print_problem_table(heat_cascade):
+    '''
+    Prints the problem table of a heat cascade
+    :param heat_cascade: HeatCascade
+    '''
+    hc = heat_cascade
+    print(format_table(
+        ['S', 'dS', 'CP total', 'dH', 'Infeasible Cascade', 'Feasible Cascade'],
+        [hc.temperatures,
+         np.concatenate(([0], hc.dT)),
+         np.concatenate(([0], hc.CP_total)),
+         np.concatenate(([0], hc.dH)),
+         np.concatenate(([0], hc.ihc)),
+         np.concatenate(([hc.hot_utility], hc.fhc))]))
+
+
+def format_table(headers, columns):
+    '''
+    Formats equal-length numeric columns as a right-aligned text table with a row index
+    :param headers: column titles
+    :param columns: list of arrays
+    :return: string
+    '''
+    cells = [[str(i) for i in range(len(columns[0]))] if len(columns) else []]
+    cells += [['{:g}'.format(v) for v in np.asarray(column, dtype=float)] for column in columns]
+    headers = [''] + list(headers)
+    widths = [max([len(h)] + [len(c) for c in column]) for h, column in zip(headers, cells)]
+    lines = ['  '.join(h.rjust(w) for h, w in zip(headers, widths))]
+    for row in zip(*cells):
+        lines.append('  '.join(c.rjust(w) for c, w in zip(row, widths)))
+    return '\n'.join(lines)
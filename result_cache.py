@@ -0,0 +1,140 @@
+import collections
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+from stream import StreamTable
+
+
+class ResultCache:
+    def __init__(self, max_entries=128, directory=None):
+        '''
+        LRU cache of analysis results with an optional on-disk store
+        :param max_entries: number of results kept in memory
+        :param directory: directory for pickled results that outlive the process (optional)
+        '''
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        value = self._read(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory is not None:
+            tmp_path = '{}.{}.tmp'.format(self._path(key), os.getpid())
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+
+    def invalidate(self, key=None):
+        '''Drops one result, or every result when no key is given, from memory and disk'''
+        keys = [key] if key is not None else list(self._entries)
+        if key is None and self.directory is not None:
+            keys += [f[:-len('.pkl')] for f in os.listdir(self.directory) if f.endswith('.pkl')]
+        for k in keys:
+            self._entries.pop(k, None)
+            if self.directory is not None and os.path.exists(self._path(k)):
+                os.remove(self._path(k))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries)
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (self.directory is not None and os.path.exists(self._path(key)))
+
+    # Private methods
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _read(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+
+def stream_fingerprint(streams):
+    '''
+    Stable hash of a stream set. Rows are sorted first, so the same streams in a different order
+    give the same fingerprint.
+    :param streams: StreamTable or list of streams/rows
+    :return: hex digest (string)
+    '''
+    table = StreamTable.from_streams(streams)
+    columns = np.column_stack((table.T_s, table.T_t, table.CP, table.h))
+    if not np.all(np.isnan(table.dT_cont)):
+        columns = np.column_stack((columns, table.dT_cont))
+    if table.parents is not None:
+        # Segments of one stream must not hash like the same rows given as separate streams
+        columns = np.column_stack((columns, table.parents))
+    columns = columns[np.lexsort(columns.T[::-1])]
+    return hashlib.sha256(np.ascontiguousarray(columns).tobytes()).hexdigest()
+
+
+def fingerprint(streams, *args, stream_key=None):
+    '''
+    Cache key for an analysis of a stream set with the given settings
+    :param streams: StreamTable or list of streams/rows
+    :param args: further inputs of the analysis, e.g. a label, dTmin and Utility objects
+    :param stream_key: stream_fingerprint of the streams when it is already known, so they are not hashed again
+    :return: hex digest (string)
+    '''
+    if stream_key is None:
+        if isinstance(streams, str):
+            raise ValueError("Cannot fingerprint a string as stream data; load the streams first "
+                             "or pass their precomputed stream_key")
+        stream_key = stream_fingerprint(streams)
+    sha = hashlib.sha256(stream_key.encode())
+    for arg in args:
+        sha.update(b'|' + _describe(arg).encode())
+    return sha.hexdigest()
+
+
+# Private methods
+def _describe(arg):
+    if hasattr(arg, 'variable') and hasattr(arg, 'fit'):
+        # Utility definition
+        return 'Utility({})'.format(','.join(_describe(v) for v in (arg.type, arg.T_s, arg.T_t, arg.CP, arg.h,
+                                                                     getattr(arg, 'cost', None))))
+    if isinstance(arg, (list, tuple)):
+        return '[{}]'.format(','.join(_describe(v) for v in arg))
+    if isinstance(arg, (int, float, np.number)) and not isinstance(arg, bool):
+        return repr(float(arg))
+    return repr(arg)
@@ -0,0 +1,191 @@
+'''
+Immutable, array-backed result types. Each result holds its data as read-only NumPy columns of equal length
+plus a few scalars, and exports them without walking per-row objects: to_records gives a structured array,
+to_dict/to_json plain columns, and to_arrow/to_parquet an Arrow table built from the column buffers (pyarrow
+is only needed for those two).
+'''
+import json
+
+import numpy as np
+
+
+class ColumnarResult:
+    COLUMNS = ()
+    SCALARS = ()
+    __slots__ = ()
+
+    def __init__(self, **values):
+        lengths = set()
+        for name in self.COLUMNS:
+            column = np.array(values.pop(name), dtype=float)
+            column.setflags(write=False)
+            lengths.add(len(column))
+            object.__setattr__(self, name, column)
+        if len(lengths) > 1:
+            raise ValueError("{} columns must have equal lengths, got {}".format(type(self).__name__, sorted(lengths)))
+        for name in self.SCALARS:
+            object.__setattr__(self, name, _scalar(values.pop(name, None)))
+        if values:
+            raise TypeError("Unexpected fields for {}: {}".format(type(self).__name__, sorted(values)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __len__(self):
+        return len(getattr(self, self.COLUMNS[0]))
+
+    def __eq__(self, other):
+        return (type(self) is type(other)
+                and all(np.array_equal(getattr(self, c), getattr(other, c), equal_nan=True) for c in self.COLUMNS)
+                and all(getattr(self, s) == getattr(other, s) for s in self.SCALARS))
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return _rebuild, (type(self), self.to_dict())
+
+    def __repr__(self):
+        scalars = ', '.join('{}={}'.format(s, getattr(self, s)) for s in self.SCALARS)
+        return "{}({} rows{})".format(type(self).__name__, len(self), ', ' + scalars if scalars else '')
+
+    def to_records(self):
+        '''Columns as one NumPy structured array (scalars are not included)'''
+        records = np.empty(len(self), dtype=[(name, float) for name in self.COLUMNS])
+        for name in self.COLUMNS:
+            records[name] = getattr(self, name)
+        return records
+
+    def to_dict(self):
+        '''Columns as lists and scalars as plain values'''
+        result = {name: getattr(self, name).tolist() for name in self.COLUMNS}
+        result.update({name: getattr(self, name) for name in self.SCALARS})
+        return result
+
+    def to_json(self, path=None):
+        '''
+        :param path: write the JSON to this file (optional)
+        :return: JSON string (non-finite values are written as null)
+        '''
+        text = json.dumps(_finite(self.to_dict()))
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_arrow(self):
+        '''Columns as a pyarrow Table sharing the column buffers; scalars go into the schema metadata'''
+        pa = _import_pyarrow()
+        metadata = {name: json.dumps(_finite(getattr(self, name))) for name in self.SCALARS}
+        return pa.table({name: pa.array(getattr(self, name)) for name in self.COLUMNS}, metadata=metadata)
+
+    def to_parquet(self, path):
+        table = self.to_arrow()
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+
+
+class CascadeResult(ColumnarResult):
+    '''Problem table: one row per shifted temperature interval, hottest first'''
+    COLUMNS = ('T_high', 'T_low', 'dT', 'CP_total', 'dH', 'ihc', 'fhc')
+    SCALARS = ('T_pinch', 'hot_utility', 'cold_utility')
+    __slots__ = COLUMNS + SCALARS
+
+    @classmethod
+    def from_heat_cascade(cls, heat_cascade):
+        hc = heat_cascade
+        return cls(T_high=hc.temperatures[:-1], T_low=hc.temperatures[1:], dT=hc.dT, CP_total=hc.CP_total,
+                   dH=hc.dH, ihc=hc.ihc, fhc=hc.fhc, T_pinch=hc.T_pinch, hot_utility=hc.hot_utility,
+                   cold_utility=hc.cold_utility)
+
+
+class CurveResult(ColumnarResult):
+    '''One composite curve: boundary temperatures (ascending) and cumulative heat load from the cold end'''
+    COLUMNS = ('T', 'Q')
+    __slots__ = COLUMNS
+
+
+class CompositeCurveResult:
+    __slots__ = ('hot', 'cold', 'T_pinch', 'dTmin')
+
+    def __init__(self, hot, cold, T_pinch, dTmin):
+        '''
+        :param hot: CurveResult of the hot composite curve
+        :param cold: CurveResult of the cold composite curve
+        '''
+        for name, value in (('hot', hot), ('cold', cold), ('T_pinch', _scalar(T_pinch)), ('dTmin', _scalar(dTmin))):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_composite_curve(cls, composite_curve):
+        cc = composite_curve
+        return cls(CurveResult(T=cc.hot_temperatures, Q=cc.hot_Q),
+                   CurveResult(T=cc.cold_temperatures, Q=cc.cold_Q + cc.cold_utility), cc.T_pinch, cc.dTmin)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompositeCurveResult is immutable")
+
+    def __reduce__(self):
+        return CompositeCurveResult, (self.hot, self.cold, self.T_pinch, self.dTmin)
+
+    def to_dict(self):
+        return {'hot': self.hot.to_dict(), 'cold': self.cold.to_dict(), 'T_pinch': self.T_pinch, 'dTmin': self.dTmin}
+
+    def to_json(self, path=None):
+        text = json.dumps(_finite(self.to_dict()))
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+class BCCSegmentsResult(ColumnarResult):
+    '''Balanced composite curve: one row per vertical heat load segment'''
+    COLUMNS = ('q_start', 'q_end', 'T_h_start', 'T_h_end', 'T_c_start', 'T_c_end', 'hot_CP', 'cold_CP',
+               'lmtd', 'area')
+    SCALARS = ('total_area', 'T_pinch', 'dTmin')
+    __slots__ = COLUMNS + SCALARS
+
+    @classmethod
+    def from_balanced_composite_curve(cls, bcc):
+        if len(bcc.q_intervals) == 0:
+            bcc.get_heat_intervals()
+        return cls(q_start=bcc.q_intervals[:-1], q_end=bcc.q_intervals[1:], T_h_start=bcc.T_h_start,
+                   T_h_end=bcc.T_h_end, T_c_start=bcc.T_c_start, T_c_end=bcc.T_c_end, hot_CP=bcc.segment_hot_CP,
+                   cold_CP=bcc.segment_cold_CP, lmtd=bcc.segment_lmtd, area=bcc.segment_area,
+                   total_area=bcc.get_total_area(), T_pinch=bcc.T_pinch, dTmin=bcc.dTmin)
+
+
+class SweepResult(ColumnarResult):
+    '''Targets over a range of dTmin values, e.g. SweepResult(**PinchAnalyser.sweep_dtmin(...))'''
+    COLUMNS = ('dT_min', 'T_pinch', 'hot_utility', 'cold_utility', 'area', 'cost')
+    __slots__ = COLUMNS
+
+
+# Private methods
+def _rebuild(cls, values):
+    return cls(**values)
+
+
+def _scalar(value):
+    if value is None:
+        return None
+    return float(value) if isinstance(value, (int, float, np.number)) and not isinstance(value, bool) else value
+
+
+def _finite(value):
+    # JSON has no NaN/Infinity
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_finite(v) for v in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Arrow/Parquet export needs the optional pyarrow package") from None
+    return pyarrow
@@ -0,0 +1,307 @@
+'''
+Sensitivity and uncertainty analysis of the pinch targets. Stream data is handled as (samples x streams)
+matrices and the problem table and the balanced composite curve area are evaluated for all samples at once:
+every row is sorted once and the cascades, curves and segment areas are cumulative sums along the rows, so no
+per-sample stream or curve objects are built.
+'''
+import numpy as np
+
+from stream import StreamTable
+from utility import VAR_TS, VAR_TT
+from heat_cascade import PINCH_TOLERANCE
+from balanced_composite_curve import segment_areas
+from pinch_analysis import PinchAnalyser
+
+TARGETS = ('T_pinch', 'hot_utility', 'cold_utility', 'area')
+
+
+def batch_targets(T_s, T_t, CP, h, hot_utility_stream, cold_utility_stream, dT_min=5):
+    '''
+    Pinch, utility and area targets of many variants of a stream set
+    :param T_s: supply temperatures (samples x streams)
+    :param T_t: target temperatures (samples x streams)
+    :param CP: heat capacity flowrates (samples x streams)
+    :param h: film coefficients (samples x streams)
+    :param hot_utility_stream: hot Utility
+    :param cold_utility_stream: cold Utility
+    :param dT_min: minimum approach temperature
+    :return: dict of arrays (one value per sample) with keys T_pinch (shifted, nan when there is none),
+             hot_utility, cold_utility and area
+    '''
+    T_s, T_t, CP, h = np.broadcast_arrays(*(np.atleast_2d(np.asarray(a, dtype=float)) for a in (T_s, T_t, CP, h)))
+    T_pinch, hot_utility, cold_utility = batch_problem_table(T_s, T_t, CP, dT_min)
+    area = batch_area_target(T_s, T_t, CP, h, hot_utility, cold_utility, hot_utility_stream, cold_utility_stream)
+    return {'T_pinch': T_pinch, 'hot_utility': hot_utility, 'cold_utility': cold_utility, 'area': area}
+
+
+def batch_problem_table(T_s, T_t, CP, dT_min=5):
+    '''
+    Problem table analysis of every row. The shifted stream ends of a row, sorted from the top, are its interval
+    boundaries; the net CP below each boundary is a cumulative sum of the streams starting and ending above it.
+    :param T_s: supply temperatures (samples x streams)
+    :param T_t: target temperatures (samples x streams)
+    :param CP: heat capacity flowrates (samples x streams)
+    :param dT_min: minimum approach temperature
+    :return: shifted pinch temperature (nan when there is none), hot utility and cold utility (arrays)
+    '''
+    is_hot = T_s > T_t
+    shift = np.where(is_hot, -dT_min / 2.0, dT_min / 2.0)
+    T_high = np.maximum(T_s, T_t) + shift
+    T_low = np.minimum(T_s, T_t) + shift
+    surplus_CP = np.where(is_hot, CP, -CP)
+
+    # Going down, a stream adds its CP to the net CP at its hot end and removes it at its cold end
+    boundaries, net_CP = _sorted_events(np.concatenate((T_high, T_low), axis=1),
+                                        np.concatenate((surplus_CP, -surplus_CP), axis=1), descending=True)
+    ihc = np.cumsum(net_CP[:, :-1] * -np.diff(boundaries, axis=1), axis=1)
+    hot_utility = np.maximum(-ihc.min(axis=1), 0.0)
+    fhc = ihc + hot_utility[:, None]
+
+    # Coldest boundary with no heat flow; the top boundary is never the cold end of an interval
+    below = boundaries[:, 1:]
+    is_pinch = (fhc <= PINCH_TOLERANCE) & (below < boundaries[:, :1])
+    T_pinch = np.where(is_pinch, below, np.inf).min(axis=1)
+    T_pinch[np.isinf(T_pinch)] = np.nan
+    return T_pinch, hot_utility, fhc[:, -1]
+
+
+def batch_area_target(T_s, T_t, CP, h, hot_utility, cold_utility, hot_utility_stream, cold_utility_stream):
+    '''
+    Bath formula area target of every row: the utilities are fitted to their loads, the hot and cold composite
+    curves are built row by row as cumulative sums, and the vertical segments between the merged heat load
+    breakpoints are evaluated as in BalancedCompositeCurve.get_heat_intervals.
+    :param T_s: supply temperatures (samples x streams)
+    :param T_t: target temperatures (samples x streams)
+    :param CP: heat capacity flowrates (samples x streams)
+    :param h: film coefficients (samples x streams)
+    :param hot_utility: hot utility load per sample (array)
+    :param cold_utility: cold utility load per sample (array)
+    :param hot_utility_stream: hot Utility
+    :param cold_utility_stream: cold Utility
+    :return: total area per sample (array)
+    '''
+    is_hot = T_s > T_t
+    T_high = np.maximum(T_s, T_t)
+    T_low = np.minimum(T_s, T_t)
+    curves = []
+    for side, utility_stream, load in ((is_hot, hot_utility_stream, hot_utility),
+                                       (~is_hot, cold_utility_stream, cold_utility)):
+        u_T_s, u_T_t, u_CP = _fit_utility(utility_stream, load)
+        side_CP = np.column_stack((np.where(side, CP, 0.0), u_CP))
+        side_h = np.column_stack((h, np.full(len(load), utility_stream.h, dtype=float)))
+        curves.append(_composite_curve(np.column_stack((T_high, np.maximum(u_T_s, u_T_t))),
+                                       np.column_stack((T_low, np.minimum(u_T_s, u_T_t))),
+                                       side_CP, side_CP / side_h))
+    (hot_T, hot_Q, hot_CP, hot_CP_h), (cold_T, cold_Q, cold_CP, cold_CP_h) = curves
+
+    hot_Q = np.round(hot_Q, decimals=6)
+    cold_Q = np.round(cold_Q, decimals=6)
+    q = np.sort(np.concatenate((hot_Q, cold_Q), axis=1), axis=1)
+    q_start = q[:, :-1]
+    dq = np.diff(q, axis=1)
+
+    rows = np.arange(len(q))[:, None]
+    hot_index = np.clip(_searchsorted_rows(hot_Q, q_start) - 1, 0, hot_CP.shape[1] - 1)
+    cold_index = np.clip(_searchsorted_rows(cold_Q, q_start) - 1, 0, cold_CP.shape[1] - 1)
+    segment_hot_CP = hot_CP[rows, hot_index]
+    segment_cold_CP = cold_CP[rows, cold_index]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        T_h_start = hot_T[rows, hot_index] + (q_start - hot_Q[rows, hot_index]) / segment_hot_CP
+        T_c_start = cold_T[rows, cold_index] + (q_start - cold_Q[rows, cold_index]) / segment_cold_CP
+        T_h_end = T_h_start + dq / segment_hot_CP
+        T_c_end = T_c_start + dq / segment_cold_CP
+        area = segment_areas(T_h_start, T_h_end, T_c_start, T_c_end,
+                             hot_CP_h[rows, hot_index], cold_CP_h[rows, cold_index])
+    # Zero-width segments come from coincident breakpoints and carry no load
+    return np.where(dq > 0, area, 0.0).sum(axis=1)
+
+
+def local_sensitivities(streams, hot_utility_stream, cold_utility_stream, dT_min=5):
+    '''
+    Analytic first-order sensitivities at the given stream data, from the structure of the cascade and the BCC.
+    The hot utility is minus the infeasible cascade at the pinch, which is linear in each stream's CP with the
+    length of the stream's shifted range above the pinch as coefficient; the cold utility follows from the
+    overall heat balance. In the Bath formula every stream's share of the area is proportional to 1/h.
+    Temperature derivatives of a stream end lying exactly on the pinch are those for moving the end down.
+    :param streams: StreamTable or list of streams/[T_s, T_t, CP, (h)] rows
+    :param hot_utility_stream: hot Utility
+    :param cold_utility_stream: cold Utility
+    :param dT_min: minimum approach temperature
+    :return: dict of arrays (one value per stream, in StreamTable order) with keys dQH_dCP, dQC_dCP,
+             dQH_dT_s, dQH_dT_t and dA_dh
+    '''
+    table = StreamTable.from_streams(streams)
+    pinch = PinchAnalyser(table)
+    pinch.problem_table_analysis(dT_min, verbose=False)
+    T_pinch = pinch.heat_cascade.T_pinch
+    sign = np.where(table.is_hot, 1.0, -1.0)
+    shifted = table.shifted(dT_min / 2.0)
+    T_high = shifted.T_high
+    T_low = shifted.T_low
+
+    if T_pinch is None or pinch.hot_utility <= 0:
+        # Threshold problem: the hot utility is zero and locally unaffected
+        dQH_dCP = np.zeros(len(table))
+        dQH_dT_high = dQH_dT_low = np.zeros(len(table))
+    else:
+        above = np.clip(T_high, T_pinch, None) - np.clip(T_low, T_pinch, None)
+        dQH_dCP = -sign * above
+        dQH_dT_high = np.where(T_high > T_pinch, -sign * table.CP, 0.0)
+        dQH_dT_low = np.where(T_low > T_pinch, sign * table.CP, 0.0)
+    dQC_dCP = dQH_dCP + sign * np.abs(table.T_s - table.T_t)
+
+    pinch.get_area_target(hot_utility_stream, cold_utility_stream, dT_min, verbose=False)
+    return {
+        'dQH_dCP': dQH_dCP,
+        'dQC_dCP': dQC_dCP,
+        'dQH_dT_s': np.where(table.is_hot, dQH_dT_high, dQH_dT_low),
+        'dQH_dT_t': np.where(table.is_hot, dQH_dT_low, dQH_dT_high),
+        'dA_dh': -_stream_areas(pinch.balanced_composite_curve, table) / table.h
+    }
+
+
+def monte_carlo(streams, hot_utility_stream, cold_utility_stream, dT_min=5, n_samples=1000,
+                cp_std=0.05, h_std=0.1, T_std=0.0, seed=None, percentiles=(5, 50, 95)):
+    '''
+    Distributions of the targets when the stream data is uncertain. CP and h are scaled by normally distributed
+    factors (relative standard deviations cp_std and h_std) and the temperatures get normally distributed
+    offsets (standard deviation T_std).
+    :param streams: StreamTable or list of streams/[T_s, T_t, CP, (h)] rows
+    :param hot_utility_stream: hot Utility
+    :param cold_utility_stream: cold Utility
+    :param dT_min: minimum approach temperature
+    :param n_samples: number of samples
+    :param cp_std: relative standard deviation of CP
+    :param h_std: relative standard deviation of h
+    :param T_std: standard deviation of the supply and target temperatures
+    :param seed: random seed
+    :param percentiles: percentiles reported in the summary
+    :return: dict with the per-sample targets (see batch_targets) and 'summary': target -> {mean, std, p<n>...}
+    '''
+    table = StreamTable.from_streams(streams)
+    rng = np.random.default_rng(seed)
+    shape = (n_samples, len(table))
+    # Factors are kept positive so a sample never flips the sign of CP or h
+    CP = table.CP * np.maximum(1 + cp_std * rng.standard_normal(shape), 1e-3)
+    h = table.h * np.maximum(1 + h_std * rng.standard_normal(shape), 1e-3)
+    T_s = table.T_s + T_std * rng.standard_normal(shape)
+    T_t = table.T_t + T_std * rng.standard_normal(shape)
+
+    results = batch_targets(T_s, T_t, CP, h, hot_utility_stream, cold_utility_stream, dT_min)
+    results['summary'] = {key: _summarise(results[key], percentiles) for key in TARGETS}
+    return results
+
+
+def tornado(streams, hot_utility_stream, cold_utility_stream, dT_min=5, relative_change=0.1,
+            parameters=('CP', 'h'), target='area'):
+    '''
+    One-at-a-time ranking of stream parameters by their effect on a target. Every parameter of every stream is
+    moved down and up by relative_change and all variants are evaluated in one batch.
+    :param streams: StreamTable or list of streams/[T_s, T_t, CP, (h)] rows
+    :param hot_utility_stream: hot Utility
+    :param cold_utility_stream: cold Utility
+    :param dT_min: minimum approach temperature
+    :param relative_change: relative change applied to each parameter
+    :param parameters: stream parameters to vary (any of 'T_s', 'T_t', 'CP', 'h')
+    :param target: target to rank by (one of TARGETS)
+    :return: list of (label, target at the low value, target at the high value), largest swing first
+    '''
+    table = StreamTable.from_streams(streams)
+    n = len(table)
+    names = table.names or ['stream {}'.format(i) for i in _input_positions(streams, table)]
+    nominal = {'T_s': table.T_s, 'T_t': table.T_t, 'CP': table.CP, 'h': table.h}
+
+    # Rows 2k and 2k + 1 move parameter k down and up
+    columns = {key: np.tile(values, (2 * n * len(parameters), 1)) for key, values in nominal.items()}
+    labels = []
+    for p, parameter in enumerate(parameters):
+        rows = 2 * (p * n + np.arange(n))
+        columns[parameter][rows, np.arange(n)] *= 1 - relative_change
+        columns[parameter][rows + 1, np.arange(n)] *= 1 + relative_change
+        labels += ['{} of {}'.format(parameter, name) for name in names]
+
+    values = batch_targets(columns['T_s'], columns['T_t'], columns['CP'], columns['h'],
+                           hot_utility_stream, cold_utility_stream, dT_min)[target]
+    low, high = values[0::2], values[1::2]
+    order = np.argsort(-np.nan_to_num(np.abs(high - low)), kind='stable')
+    return [(labels[i], float(low[i]), float(high[i])) for i in order]
+
+
+# Private methods
+def _sorted_events(temperatures, deltas, descending=False):
+    '''Sorts each row's event temperatures and returns them with the running total of the event deltas'''
+    order = np.argsort(-temperatures if descending else temperatures, axis=1, kind='stable')
+    return (np.take_along_axis(temperatures, order, axis=1),
+            np.cumsum(np.take_along_axis(deltas, order, axis=1), axis=1))
+
+
+def _composite_curve(T_high, T_low, CP, CP_h):
+    '''Ascending boundaries, cumulative Q from the cold end, and CP and CP/h of the interval above each boundary'''
+    temperatures = np.concatenate((T_low, T_high), axis=1)
+    boundaries, curve_CP = _sorted_events(temperatures, np.concatenate((CP, -CP), axis=1))
+    _, curve_CP_h = _sorted_events(temperatures, np.concatenate((CP_h, -CP_h), axis=1))
+    curve_CP, curve_CP_h = curve_CP[:, :-1], curve_CP_h[:, :-1]
+    Q = np.cumsum(curve_CP * np.diff(boundaries, axis=1), axis=1)
+    return boundaries, np.concatenate((np.zeros((len(Q), 1)), Q), axis=1), curve_CP, curve_CP_h
+
+
+def _searchsorted_rows(a, v):
+    '''np.searchsorted(a[i], v[i], side='right') for every row i of the row-sorted a'''
+    n_a = a.shape[1]
+    merged = np.concatenate((a, v), axis=1)
+    # Stable sort keeps entries of a ahead of equal entries of v
+    order = np.argsort(merged, axis=1, kind='stable')
+    from_a = np.cumsum(order < n_a, axis=1)
+    is_v = order >= n_a
+    result = np.empty(v.shape, dtype=int)
+    rows = np.nonzero(is_v)[0]
+    result[rows, order[is_v] - n_a] = from_a[is_v]
+    return result
+
+
+def _fit_utility(utility_stream, loads):
+    '''Utility.fit for an array of loads, returning the T_s, T_t and CP arrays'''
+    n = len(loads)
+    Q = utility_stream.type * np.asarray(loads, dtype=float)
+    if utility_stream.variable == VAR_TS:
+        return utility_stream.T_t - Q / utility_stream.CP, np.full(n, utility_stream.T_t), np.full(n, utility_stream.CP)
+    if utility_stream.variable == VAR_TT:
+        return np.full(n, utility_stream.T_s), utility_stream.T_s + Q / utility_stream.CP, np.full(n, utility_stream.CP)
+    return (np.full(n, utility_stream.T_s), np.full(n, utility_stream.T_t),
+            Q / (utility_stream.T_t - utility_stream.T_s))
+
+
+def _input_positions(streams, table):
+    '''
+    Position in the caller's streams of each row of the table built from them. The table keeps the hot streams
+    ahead of the cold ones, each in their input order; the rows of a segmented stream share its position.
+    '''
+    if isinstance(streams, StreamTable) or table.parents is not None:
+        return table.stream_ids()
+    is_hot = np.array([s[0] > s[1] if isinstance(s, (list, tuple, np.ndarray)) else s.T_s > s.T_t
+                       for s in streams], dtype=bool)
+    return np.argsort(~is_hot, kind='stable')
+
+
+def _stream_areas(bcc, table):
+    '''Share of the BCC area of each process stream: sum over the segments it spans of (q / h) / LMTD'''
+    areas = np.zeros(len(table))
+    for is_hot, index, T_start, T_end, temperatures in (
+            (True, bcc.hot_index, bcc.T_h_start, bcc.T_h_end, bcc.hot_temperatures),
+            (False, bcc.cold_index, bcc.T_c_start, bcc.T_c_end, bcc.cold_temperatures)):
+        rows = np.flatnonzero(table.is_hot == is_hot)
+        T_high = np.maximum(table.T_s[rows], table.T_t[rows])
+        T_low = np.minimum(table.T_s[rows], table.T_t[rows])
+        # A stream spans the segments lying in the curve intervals inside its temperature range
+        spans = (T_low[:, None] <= temperatures[index]) & (T_high[:, None] >= temperatures[index + 1])
+        per_segment = (T_end - T_start) / bcc.segment_lmtd
+        areas[rows] = (spans * per_segment).sum(axis=1) * table.CP[rows] / table.h[rows]
+    return areas
+
+
+def _summarise(values, percentiles):
+    summary = {'mean': float(np.nanmean(values)), 'std': float(np.nanstd(values))}
+    for p, value in zip(percentiles, np.nanpercentile(values, percentiles)):
+        summary['p{}'.format(p)] = float(value)
+    return summary
@@ -0,0 +1,112 @@
+import numpy as np
+
+from stream import StreamTable
+from heat_cascade import PINCH_TOLERANCE
+from helper_functions import grouped_interval_totals
+
+
+class SiteAnalyser:
+    def __init__(self, zones, dT_min=5):
+        '''
+        Problem table analysis of a site made of several zones (process units). All shifted stream temperatures
+        go into one global interval index and the net CP of every zone is summed over it in a single sweep, so
+        the targets of each zone, of the whole site and of any combination of zones are cascades over rows of
+        the same interval heat balance rather than separate analyses.
+        :param zones: dict of zone name -> streams (StreamTable or list of streams/[T_s, T_t, CP, (h)] rows)
+        :param dT_min: minimum approach temperature
+        '''
+        self.zone_names = list(zones)
+        self.dT_min = dT_min
+        tables = [StreamTable.from_streams(zones[name]).shifted(dT_min / 2.0) for name in self.zone_names]
+        if not any(len(table) for table in tables):
+            raise ValueError("Site has no streams!")
+
+        T_s = np.concatenate([table.T_s for table in tables])
+        T_t = np.concatenate([table.T_t for table in tables])
+        CP = np.concatenate([table.CP for table in tables])
+        is_hot = np.concatenate([table.is_hot for table in tables])
+        zone = np.repeat(np.arange(len(tables)), [len(table) for table in tables])
+        T_high = np.where(is_hot, T_s, T_t)
+        T_low = np.where(is_hot, T_t, T_s)
+
+        # Global shifted interval index and the interval heat balance of every zone over it
+        self.temperatures = np.unique(np.concatenate((T_s, T_t)))[::-1]
+        self.dT = self.temperatures[:-1] - self.temperatures[1:]
+        self.CP_total = grouped_interval_totals(self.temperatures, T_high, T_low, np.where(is_hot, CP, -CP),
+                                                zone, len(tables))
+        self.dH = self.CP_total * self.dT
+
+        # Temperature span of each zone, which bounds where its pinch can be
+        self.zone_T_high = np.full(len(tables), -np.inf)
+        self.zone_T_low = np.full(len(tables), np.inf)
+        np.maximum.at(self.zone_T_high, zone, T_high)
+        np.minimum.at(self.zone_T_low, zone, T_low)
+
+        self.zone_T_pinch, self.zone_hot_utility, self.zone_cold_utility = self._cascade_targets(
+            self.dH, self.zone_T_low, self.zone_T_high)
+
+    def get_zone_results(self):
+        '''
+        :return: dict of zone name -> (shifted pinch temperature or None, hot utility, cold utility)
+        '''
+        return {name: (_pinch_or_none(self.zone_T_pinch[i]), float(self.zone_hot_utility[i]),
+                       float(self.zone_cold_utility[i]))
+                for i, name in enumerate(self.zone_names)}
+
+    def get_site_results(self, zones=None):
+        '''
+        Targets of the zones integrated together
+        :param zones: names of the zones to integrate (defaults to the whole site)
+        :return: shifted pinch temperature or None, hot utility, cold utility
+        '''
+        rows = self._rows(zones)
+        T_pinch, hot_utility, cold_utility = self._cascade_targets(
+            self.dH[rows].sum(axis=0, keepdims=True),
+            self.zone_T_low[rows].min(keepdims=True), self.zone_T_high[rows].max(keepdims=True))
+        return _pinch_or_none(T_pinch[0]), float(hot_utility[0]), float(cold_utility[0])
+
+    def get_integration_savings(self, zones=None):
+        '''
+        Utility saved by integrating the zones instead of running each on its own
+        :param zones: names of the zones to integrate (defaults to the whole site)
+        :return: hot utility saving, cold utility saving
+        '''
+        rows = self._rows(zones)
+        _, hot_utility, cold_utility = self.get_site_results(zones)
+        return (float(self.zone_hot_utility[rows].sum()) - hot_utility,
+                float(self.zone_cold_utility[rows].sum()) - cold_utility)
+
+    def print_summary(self):
+        print('===== SITE ANALYSIS =====')
+        for name, (T_pinch, hot_utility, cold_utility) in self.get_zone_results().items():
+            print("Zone {}: Pinch at shifted T = {}, Hot Utility = {}, Cold Utility = {}".format(
+                name, T_pinch, hot_utility, cold_utility))
+        T_pinch, hot_utility, cold_utility = self.get_site_results()
+        print("Site: Pinch at shifted T = {}, Hot Utility = {}, Cold Utility = {}".format(
+            T_pinch, hot_utility, cold_utility))
+        print("Integration saves {} hot utility and {} cold utility".format(*self.get_integration_savings()))
+        print("=" * 25)
+
+    # Private methods
+    def _rows(self, zones):
+        if zones is None:
+            return np.arange(len(self.zone_names))
+        return np.array([self.zone_names.index(name) for name in zones], dtype=int)
+
+    def _cascade_targets(self, dH, T_low, T_high):
+        '''Cascades every row of dH at once; the pinch of a row is searched only within its own span'''
+        ihc = np.cumsum(dH, axis=1)
+        hot_utility = np.maximum(-ihc.min(axis=1), 0.0)
+        fhc = ihc + hot_utility[:, None]
+
+        # Boundaries outside a zone's span carry its zero (or full) heat flow and are not pinches
+        boundaries = self.temperatures[1:]
+        is_pinch = ((fhc <= PINCH_TOLERANCE) & (boundaries >= T_low[:, None])
+                    & (boundaries < T_high[:, None]))
+        T_pinch = np.where(is_pinch, boundaries, np.inf).min(axis=1)
+        return T_pinch, hot_utility, fhc[:, -1]
+
+
+# Private methods
+def _pinch_or_none(T_pinch):
+    return float(T_pinch) if np.isfinite(T_pinch) else None
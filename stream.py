@@ -1,6 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
 
 
 class Stream:
@@ -8,13 +6,18 @@ class Stream:
     TYPE_COLD = 1
 
     # Constructor/factory methods
-    def __init__(self, T_s, T_t, CP, h=1):
+    def __init__(self, T_s, T_t, CP, h=1, dT_cont=None):
+        '''
+        :param dT_cont: the stream's contribution to the approach temperature of its matches (defaults to
+                        dTmin/2)
+        '''
         if T_s == T_t:
             raise ValueError("Stream cannot have equal supply and target temperatures!")
         self.T_s = T_s
         self.T_t = T_t
         self.CP = CP
         self.h = h
+        self.dT_cont = dT_cont
 
         self.Q = abs(T_s - T_t) * CP
         self.type = self.TYPE_HOT if (T_s > T_t) else self.TYPE_COLD
@@ -25,7 +28,7 @@ class Stream:
         T_t = stream_obj.T_t if T_t is None else T_t
         CP = stream_obj.CP if CP is None else CP
         h = stream_obj.h if h is None else h
-        return Stream(T_s, T_t, CP, h)
+        return Stream(T_s, T_t, CP, h, getattr(stream_obj, 'dT_cont', None))
 
     # Object methods
     def is_hot(self):
@@ -43,43 +46,376 @@ class Stream:
             type_str, self.T_s, self.T_t, self.CP, self.Q, self.h))
 
 
-class StreamManager():
-    def __init__(self, streams_list=None):
-        self.streams = []
-        if streams_list is not None:
-            for s in streams_list:
-                self.add_stream(s)
+class SegmentedStream:
+    TYPE_HOT = Stream.TYPE_HOT
+    TYPE_COLD = Stream.TYPE_COLD
 
-    def _add_stream_np(self, np_slice):
-        print(np_slice)
-        print(list(np_slice))
-        self.add_stream(list(np_slice))
+    def __init__(self, T, H, h=1, tolerance=0.01, dT_cont=None):
+        '''
+        Stream whose CP changes with temperature, given by enthalpy points from supply to target. Between two
+        points the CP is constant, and adjacent segments whose CPs (and film coefficients) stay within
+        tolerance of their merged CP are coalesced, so detailed enthalpy data adds only as many rows and
+        interval boundaries as its shape needs. Isothermal steps (pure component phase change) need a small
+        temperature glide.
+        :param T: temperatures from supply to target (strictly monotonic)
+        :param H: enthalpy at each temperature (any reference)
+        :param h: film heat transfer coefficient, one value or one per segment
+        :param tolerance: largest relative CP difference within a coalesced segment
+        :param dT_cont: contribution to the approach temperature (defaults to dTmin/2)
+        '''
+        T = np.asarray(T, dtype=float)
+        H = np.asarray(H, dtype=float)
+        if T.ndim != 1 or len(T) < 2 or len(H) != len(T):
+            raise ValueError("Segmented stream needs at least two (T, H) points!")
+        dT = np.diff(T)
+        dH = np.diff(H)
+        if not (np.all(dT > 0) or np.all(dT < 0)):
+            raise ValueError("Segmented stream temperatures must be strictly monotonic!")
+        CP = dH / dT
+        if np.any(CP <= 0):
+            raise ValueError("Segmented stream enthalpy must rise with temperature!")
+        h = np.broadcast_to(np.asarray(h, dtype=float), CP.shape)
 
-    def add_stream(self, stream):
-        if isinstance(stream, list):
-            if len(stream) == 3:
-                self.streams.append(Stream(stream[0], stream[1], stream[2]))
-            elif len(stream) == 4:
-                self.streams.append(Stream(stream[0], stream[1], stream[2], stream[3]))
+        starts = _coalesced_runs(dT, dH, CP, h, tolerance)
+        self.T = np.append(T[starts], T[-1])
+        self.CP = np.add.reduceat(dH, starts) / np.add.reduceat(dT, starts)
+        self.h = h[starts]
+        self.dT_cont = dT_cont
+        self.T_s = float(T[0])
+        self.T_t = float(T[-1])
+        self.Q = abs(float(H[-1] - H[0]))
+        self.type = self.TYPE_HOT if (self.T_s > self.T_t) else self.TYPE_COLD
+        self.merged_segments = len(dT) - len(starts)
+
+    @classmethod
+    def from_segments(cls, segments, h=1, tolerance=0.01, dT_cont=None):
+        '''
+        :param segments: contiguous [T_start, T_end, CP] segments from supply to target
+        '''
+        segments = np.asarray(segments, dtype=float).reshape(-1, 3)
+        if np.any(segments[1:, 0] != segments[:-1, 1]):
+            raise ValueError("Segments must be contiguous!")
+        T = np.append(segments[:, 0], segments[-1, 1])
+        H = np.concatenate(([0], np.cumsum(segments[:, 2] * (segments[:, 1] - segments[:, 0]))))
+        return cls(T, H, h, tolerance, dT_cont)
+
+    def is_hot(self):
+        return self.type == self.TYPE_HOT
+
+    def rows(self):
+        '''Constant-CP [T_s, T_t, CP, h] rows, one per coalesced segment'''
+        return [(self.T[i], self.T[i + 1], self.CP[i], self.h[i]) for i in range(len(self.CP))]
+
+    def __len__(self):
+        return len(self.CP)
+
+    def __str__(self):
+        type_str = "Hot" if self.is_hot() else "Cold"
+        return "{0:s} segmented stream with Ts={1:f} Tt={2:f} Q={3:f} in {4:d} segments".format(
+            type_str, self.T_s, self.T_t, self.Q, len(self))
+
+
+class StreamTable:
+    '''
+    Columnar stream data. Hot streams are stored ahead of cold streams (each in their input order), so the
+    hot and cold subsets are slices of the same arrays rather than filtered copies. A SegmentedStream takes
+    one row per segment; parents then holds the stream each row belongs to. dT_cont holds each stream's
+    contribution to the approach temperature, NaN where the default of dTmin/2 applies.
+    '''
+    def __init__(self, T_s, T_t, CP, h=None, names=None, parents=None, dT_cont=None):
+        T_s = np.atleast_1d(np.asarray(T_s, dtype=float))
+        T_t = np.atleast_1d(np.asarray(T_t, dtype=float))
+        CP = np.atleast_1d(np.asarray(CP, dtype=float))
+        h = np.ones_like(T_s) if h is None else np.atleast_1d(np.asarray(h, dtype=float))
+        dT_cont = np.full_like(T_s, np.nan) if dT_cont is None else np.atleast_1d(np.asarray(dT_cont, dtype=float))
+        if np.any(T_s == T_t):
+            raise ValueError("Stream cannot have equal supply and target temperatures!")
+
+        is_hot = T_s > T_t
+        if np.any(is_hot[1:] > is_hot[:-1]):
+            order = np.argsort(~is_hot, kind='stable')
+            T_s, T_t, CP, h, dT_cont = T_s[order], T_t[order], CP[order], h[order], dT_cont[order]
+            names = None if names is None else [names[i] for i in order]
+            parents = None if parents is None else np.asarray(parents)[order]
+        self._set_columns(T_s, T_t, CP, h, names, int(np.count_nonzero(is_hot)),
+                          None if parents is None else np.asarray(parents, dtype=int), dT_cont)
+
+    @classmethod
+    def from_streams(cls, streams):
+        '''
+        Builds a table from Stream-like objects, SegmentedStream or [T_s, T_t, CP, (h, (dT_cont))] rows.
+        Tables are returned unchanged.
+        '''
+        if isinstance(streams, StreamTable):
+            return streams
+        rows = []
+        parents = []
+        for s in streams:
+            parents.append(len(rows))
+            if isinstance(s, SegmentedStream):
+                dT_cont = np.nan if s.dT_cont is None else s.dT_cont
+                rows.extend(row + (dT_cont,) for row in s.rows())
+            elif isinstance(s, (list, tuple, np.ndarray)):
+                if len(s) == 3:
+                    rows.append((s[0], s[1], s[2], 1, np.nan))
+                elif len(s) == 4:
+                    rows.append(tuple(s) + (np.nan,))
+                elif len(s) == 5:
+                    rows.append(tuple(np.nan if v is None else v for v in s))
+                else:
+                    raise IndexError('Input stream data has too many/few items!')
             else:
-                raise IndexError('Input stream data has too many/few items!')
+                dT_cont = getattr(s, 'dT_cont', None)
+                rows.append((s.T_s, s.T_t, s.CP, s.h, np.nan if dT_cont is None else dT_cont))
+        columns = np.array(rows, dtype=float).reshape(-1, 5)
+        if len(rows) == len(parents):
+            parents = None
         else:
-            self.streams.append(stream)
+            parents = np.repeat(np.arange(len(parents)), np.diff(np.append(parents, len(rows))))
+        return cls(columns[:, 0], columns[:, 1], columns[:, 2], columns[:, 3], parents=parents,
+                   dT_cont=columns[:, 4])
+
+    # Object methods
+    @property
+    def Q(self):
+        return np.abs(self.T_s - self.T_t) * self.CP
+
+    @property
+    def is_hot(self):
+        return np.arange(len(self)) < self.n_hot
+
+    @property
+    def T_high(self):
+        '''Hotter end of every stream'''
+        return np.maximum(self.T_s, self.T_t)
+
+    @property
+    def T_low(self):
+        '''Colder end of every stream'''
+        return np.minimum(self.T_s, self.T_t)
+
+    @property
+    def type(self):
+        return np.where(self.is_hot, Stream.TYPE_HOT, Stream.TYPE_COLD)
+
+    def hot(self):
+        '''Hot streams as a view on this table'''
+        return self._view(slice(0, self.n_hot), self.n_hot)
+
+    def cold(self):
+        '''Cold streams as a view on this table'''
+        return self._view(slice(self.n_hot, len(self)), 0)
+
+    def shifted(self, dt):
+        '''
+        Returns a table with hot streams shifted down and cold streams shifted up by dt
+        :param dt: one shift for all streams, or one per row (e.g. contributions())
+        '''
+        offset = np.empty(len(self))
+        offset[:self.n_hot] = -1
+        offset[self.n_hot:] = 1
+        offset *= dt
+        return self._from_columns(self.T_s + offset, self.T_t + offset, self.CP, self.h, self.names, self.n_hot,
+                                  self.parents, self.dT_cont)
+
+    def contributions(self, dT_min, default=None):
+        '''
+        Approach temperature contribution of every row
+        :param dT_min: minimum approach temperature, giving the default contribution of dT_min/2
+        :param default: contributions to use instead of dT_min/2 where none is set (one value or one per row)
+        :return: array
+        '''
+        return np.where(np.isnan(self.dT_cont), dT_min / 2.0 if default is None else default, self.dT_cont)
+
+    def with_contributions(self, dT_cont):
+        '''Returns a table with the given approach temperature contributions (one per row)'''
+        return self._from_columns(self.T_s, self.T_t, self.CP, self.h, self.names, self.n_hot, self.parents,
+                                  np.asarray(dT_cont, dtype=float))
+
+    def extended(self, streams):
+        '''Returns a new table with the given streams appended'''
+        other = StreamTable.from_streams(streams)
+        names = None
+        if self.names is not None or other.names is not None:
+            names = (self.names or [None] * len(self)) + (other.names or [None] * len(other))
+        parents = None
+        if self.parents is not None or other.parents is not None:
+            own = self.stream_ids()
+            parents = np.concatenate((own, other.stream_ids() + (own.max() + 1 if len(own) else 0)))
+        dT_cont = np.concatenate((self.dT_cont, other.dT_cont))
+        # Concatenate in input order (hot then cold of each table); the constructor re-partitions
+        return StreamTable(np.concatenate((self.T_s, other.T_s)), np.concatenate((self.T_t, other.T_t)),
+                           np.concatenate((self.CP, other.CP)), np.concatenate((self.h, other.h)), names, parents,
+                           dT_cont)
+
+    def stream_ids(self):
+        '''Stream each row belongs to (rows of a segmented stream share one)'''
+        return np.arange(len(self)) if self.parents is None else self.parents
+
+    def spanning(self, T_h, T_c):
+        '''Rows of the streams that span the temperature interval from T_h down to T_c'''
+        return [self[i] for i in np.flatnonzero((self.T_high > T_c) & (self.T_low < T_h))]
+
+    def __len__(self):
+        return len(self.T_s)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Stream index out of range')
+        return StreamRow(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield StreamRow(self, i)
+
+    # Private methods
+    def _set_columns(self, T_s, T_t, CP, h, names, n_hot, parents=None, dT_cont=None):
+        self.T_s = T_s
+        self.T_t = T_t
+        self.CP = CP
+        self.h = h
+        self.names = names
+        self.n_hot = n_hot
+        self.parents = parents
+        self.dT_cont = np.full_like(T_s, np.nan) if dT_cont is None else dT_cont
+
+    def _view(self, index, n_hot):
+        names = None if self.names is None else self.names[index]
+        parents = None if self.parents is None else self.parents[index]
+        return self._from_columns(self.T_s[index], self.T_t[index], self.CP[index], self.h[index], names, n_hot,
+                                  parents, self.dT_cont[index])
+
+    @classmethod
+    def _from_columns(cls, T_s, T_t, CP, h, names, n_hot, parents=None, dT_cont=None):
+        table = cls.__new__(cls)
+        table._set_columns(T_s, T_t, CP, h, names, n_hot, parents, dT_cont)
+        return table
+
+
+class StreamRow:
+    '''Lightweight Stream-like proxy for one row of a StreamTable'''
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def T_s(self):
+        return float(self.table.T_s[self.index])
+
+    @property
+    def T_t(self):
+        return float(self.table.T_t[self.index])
+
+    @property
+    def CP(self):
+        return float(self.table.CP[self.index])
+
+    @property
+    def h(self):
+        return float(self.table.h[self.index])
+
+    @property
+    def Q(self):
+        return abs(self.T_s - self.T_t) * self.CP
+
+    @property
+    def type(self):
+        return Stream.TYPE_HOT if self.is_hot() else Stream.TYPE_COLD
+
+    @property
+    def name(self):
+        return None if self.table.names is None else self.table.names[self.index]
+
+    @property
+    def dT_cont(self):
+        dT_cont = self.table.dT_cont[self.index]
+        return None if np.isnan(dT_cont) else float(dT_cont)
+
+    @property
+    def parent(self):
+        return int(self.table.stream_ids()[self.index])
+
+    def is_hot(self):
+        return self.index < self.table.n_hot
+
+    def shift(self, dt):
+        return Stream.shift(self, dt)
+
+    def __str__(self):
+        return Stream.__str__(self)
+
+
+def stream_arrays(streams):
+    '''
+    Column arrays of a StreamTable or a list of streams for the vectorized engines
+    :param streams: StreamTable or list of Stream objects
+    :return: T_s, T_t, CP, h (float arrays) and is_hot (bool array)
+    '''
+    if isinstance(streams, StreamTable):
+        return streams.T_s, streams.T_t, streams.CP, streams.h, streams.is_hot
+    T_s = np.fromiter((s.T_s for s in streams), dtype=float, count=len(streams))
+    T_t = np.fromiter((s.T_t for s in streams), dtype=float, count=len(streams))
+    CP = np.fromiter((s.CP for s in streams), dtype=float, count=len(streams))
+    h = np.fromiter((s.h for s in streams), dtype=float, count=len(streams))
+    return T_s, T_t, CP, h, T_s > T_t
+
+
+def film_contributions(h, dT_min, h_ref=None):
+    '''
+    Approach temperature contributions proportional to the film resistance 1/h, so poorly transferring
+    streams take a larger share of the approach temperature
+    :param h: film heat transfer coefficients (array)
+    :param dT_min: minimum approach temperature, the approach of two streams with h = h_ref
+    :param h_ref: reference film coefficient (defaults to the geometric mean of h)
+    :return: contribution per stream (array)
+    '''
+    h = np.asarray(h, dtype=float)
+    if h_ref is None:
+        h_ref = float(np.exp(np.log(h).mean())) if len(h) else 1.0
+    return dT_min / 2.0 * h_ref / h
+
+
+class StreamManager():
+    def __init__(self, streams_list=None):
+        self.streams = StreamTable.from_streams(streams_list if streams_list is not None else [])
+
+    def add_stream(self, stream):
+        self.streams = self.streams.extended([stream])
 
     def get_streams(self):
         return self.streams
 
     def get_hot_streams(self):
-        return [s for s in self.streams if s.type == Stream.TYPE_HOT]
+        return self.streams.hot()
 
     def get_cold_streams(self):
-        return [s for s in self.streams if s.type == Stream.TYPE_COLD]
+        return self.streams.cold()
 
     def print_streams(self):
         for s in self.streams:
             print(s)
 
 
+# Private methods
+def _coalesced_runs(dT, dH, CP, h, tolerance):
+    '''Start index of each run of adjacent segments merged into one, in a single pass'''
+    starts = [0]
+    run_dT, run_dH, run_min, run_max = dT[0], dH[0], CP[0], CP[0]
+    for i in range(1, len(dT)):
+        merged_CP = (run_dH + dH[i]) / (run_dT + dT[i])
+        low, high = min(run_min, CP[i]), max(run_max, CP[i])
+        if h[i] == h[starts[-1]] and high - low <= tolerance * merged_CP:
+            run_dT, run_dH, run_min, run_max = run_dT + dT[i], run_dH + dH[i], low, high
+        else:
+            starts.append(i)
+            run_dT, run_dH, run_min, run_max = dT[i], dH[i], CP[i], CP[i]
+    return np.array(starts)
+
+
 # Unit tests
 # s = Stream(20, 135, 2, 0.2)
 # s2 = Stream.clone(s, T_s=100)
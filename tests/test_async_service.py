@@ -0,0 +1,29 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+from async_service import AsyncPinchService
+from result_cache import fingerprint, stream_fingerprint
+from utility import Utility
+
+HOT_UTILITY = Utility('hot', T_s=1000, T_t=999)
+COLD_UTILITY = Utility('cold', T_s=-100, T_t=-99)
+ROWS = [[20, 200, 10], [150, 60, 1], [30, 40, 1], [100, 30, 1]]
+
+
+def test_fingerprint_takes_a_precomputed_stream_key_only_explicitly():
+    key = fingerprint(ROWS, 'area_target', 10)
+    assert fingerprint(ROWS, 'area_target', 10, stream_key=stream_fingerprint(ROWS)) == key
+    with pytest.raises(ValueError):
+        fingerprint('streams.csv', 'area_target', 10)
+
+
+def test_area_target_does_not_key_requests_on_a_path():
+    async def request():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            service = AsyncPinchService(executor=executor)
+            await service.area_target('streams.csv', HOT_UTILITY, COLD_UTILITY, dT_min=10)
+
+    with pytest.raises(ValueError):
+        asyncio.run(request())
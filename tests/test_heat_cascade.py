@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from heat_cascade import dtmin_targets, parametric_targets
+from pinch_analysis import PinchAnalyser
+from utility import Utility
+
+HOT_UTILITY = Utility('hot', T_s=1000, T_t=999)
+COLD_UTILITY = Utility('cold', T_s=-100, T_t=-99)
+DT_MIN_VALUES = [5.0, 13.18, 20.0]
+
+
+@pytest.mark.parametrize('rows', [
+    [[20, 80, 2], [50, 120, 3]],
+    [[150, 60, 2], [120, 40, 3]],
+])
+def test_one_sided_targets_match_heat_cascade(rows):
+    analyser = PinchAnalyser(rows)
+    streams = analyser.streams
+    expected = []
+    for dT_min in DT_MIN_VALUES:
+        analyser.problem_table_analysis(dT_min, verbose=False)
+        expected.append((np.nan if analyser.T_pinch is None else analyser.T_pinch, analyser.hot_utility,
+                         analyser.cold_utility))
+    expected = np.array(expected).T
+
+    swept = dtmin_targets(streams.T_s, streams.T_t, streams.CP, streams.is_hot, DT_MIN_VALUES)
+    parametric = parametric_targets(streams.T_s, streams.T_t, streams.CP, streams.is_hot, 5.0, 20.0)(DT_MIN_VALUES)
+    sweep = analyser.sweep_dtmin(DT_MIN_VALUES, HOT_UTILITY, COLD_UTILITY)
+    for targets in (swept, parametric, (sweep['T_pinch'], sweep['hot_utility'], sweep['cold_utility'])):
+        np.testing.assert_allclose(np.array(targets, dtype=float), expected, atol=1e-9)
@@ -0,0 +1,60 @@
+import collections
+import time
+
+import numpy as np
+import pytest
+
+from balanced_composite_curve import BalancedCompositeCurve
+from network_design import Exchanger, design_network
+from pinch_analysis import PinchAnalyser
+from utility import Utility
+
+DT_MIN = 10.0
+HOT_UTILITY = Utility('hot', T_s=1000, T_t=999)
+COLD_UTILITY = Utility('cold', T_s=-100, T_t=-99)
+
+
+def random_rows(n_streams, seed):
+    '''Streams with integer temperatures between 20 and 400 and integer CPs from 1 to 20, about half of them hot'''
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n_streams):
+        T_low, T_high = sorted(rng.integers(20, 401, 2) * 1.0)
+        if T_low == T_high:
+            T_high += 1
+        CP = float(rng.integers(1, 21))
+        rows.append([T_high, T_low, CP] if rng.random() < 0.5 else [T_low, T_high, CP])
+    return rows
+
+
+@pytest.mark.parametrize('n_streams, seed', [(300, 0), (300, 2), (400, 1)])
+def test_design_network_scale(n_streams, seed):
+    analyser = PinchAnalyser(random_rows(n_streams, seed))
+    analyser.problem_table_analysis(DT_MIN, verbose=False)
+    streams = analyser.streams
+
+    start = time.perf_counter()
+    network = design_network(streams, analyser.T_pinch, DT_MIN, HOT_UTILITY, COLD_UTILITY, analyser.hot_utility)
+    assert time.perf_counter() - start < 30
+
+    # Maximum energy recovery
+    hot_utility, cold_utility = network.get_utility_loads()
+    assert hot_utility == pytest.approx(analyser.hot_utility, abs=1e-3)
+    assert cold_utility == pytest.approx(analyser.cold_utility, abs=1e-3)
+    assert network.get_energy_penalty() < 1e-3
+
+    # Every exchanger keeps dTmin at both ends and every stream gets exactly its duty
+    duty = collections.Counter()
+    for e in network.exchangers:
+        duty[e.hot] += e.Q
+        duty[e.cold] += e.Q
+        if e.kind == Exchanger.KIND_PROCESS:
+            assert min(e.T_h_in - e.T_c_out, e.T_h_out - e.T_c_in) >= DT_MIN - 1e-6
+    labels = ['H{}'.format(i + 1) for i in range(streams.n_hot)] + \
+             ['C{}'.format(i + 1) for i in range(len(streams) - streams.n_hot)]
+    for label, Q in zip(labels, streams.Q):
+        assert duty[label] == pytest.approx(Q, abs=1e-3)
+
+    bcc = BalancedCompositeCurve(streams.hot(), streams.cold(), analyser.hot_utility, analyser.cold_utility,
+                                 HOT_UTILITY, COLD_UTILITY, analyser.T_pinch, DT_MIN)
+    assert network.get_exchanger_count() <= 1.5 * bcc.get_unit_target()
@@ -0,0 +1,16 @@
+from sensitivity import tornado
+from stream import Stream
+from utility import Utility
+
+HOT_UTILITY = Utility('hot', T_s=1000, T_t=999)
+COLD_UTILITY = Utility('cold', T_s=-100, T_t=-99)
+
+
+def test_tornado_labels_follow_input_order():
+    # The cold stream listed first dominates the hot utility, so it swings most and keeps its input position
+    rows = [[20, 200, 10], [150, 60, 1], [30, 40, 1], [100, 30, 1]]
+    for streams in (rows, [Stream(*row) for row in rows]):
+        ranking = tornado(streams, HOT_UTILITY, COLD_UTILITY, dT_min=10, parameters=('CP',), target='hot_utility')
+        label, low, high = ranking[0]
+        assert label == 'CP of stream 0'
+        assert high > low
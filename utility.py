@@ -7,10 +7,12 @@ VAR_CP = 2
 
 class Utility:
 
-    def __init__(self, type='hot', T_s=None, T_t=None, CP=None, h=1):
+    def __init__(self, type='hot', T_s=None, T_t=None, CP=None, h=1, cost=None):
         # type comes in string 'hot' or 'cold'
+        # cost is the price per unit load, used to rank utility levels (optional)
         self.type = -1 if type == 'hot' else 1
         self.h = h
+        self.cost = cost
         _dof = self._degrees_of_freedom(T_s, T_t, CP)
         if _dof > 0:
             raise ValueError \